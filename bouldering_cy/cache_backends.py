@@ -0,0 +1,41 @@
+"""
+Django's cache backends, counting hits and misses towards the metrics of
+the request being handled (see `bouldering_cy.metrics`).
+"""
+from django.core.cache.backends import filebased, locmem, redis
+from .metrics import record_cache
+
+_MISSING = object()
+
+
+class CacheMetricsMixin:
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if not getattr(self, '_counting_many', False):
+            record_cache(hits=int(value is not _MISSING),
+                         misses=int(value is _MISSING))
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # Some backends implement get_many with get(); count keys once
+        self._counting_many = True
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            self._counting_many = False
+        record_cache(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+
+class LocMemCache(CacheMetricsMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheMetricsMixin, filebased.FileBasedCache):
+    pass
+
+
+class RedisCache(CacheMetricsMixin, redis.RedisCache):
+    pass
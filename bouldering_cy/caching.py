@@ -0,0 +1,206 @@
+"""
+Namespaced, versioned caching.
+
+Cached data is grouped into namespaces (e.g. 'catalogue' for products and
+their gallery images). Every key embeds the current version of the
+namespaces it depends on, and saving or deleting a model registered with
+`invalidate_on_change` bumps the version, so stale entries are simply never
+read again and expire on their own. Nothing has to delete keys by hand.
+
+Usage:
+    products = get_or_set('catalogue', 'shop-products', load_products)
+
+    @cached_view('fleet', 'availability')
+    def crashpads(request): ...
+
+    class CrashpadSerializer(CachedRepresentationMixin, ModelSerializer):
+        cache_namespaces = ('fleet', )
+
+Code that changes registered models without signals (`queryset.update()`,
+`bulk_create()`) must call `bump_version` itself.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import cache_page
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE = 'catalogue'
+FLEET = 'fleet'
+AVAILABILITY = 'availability'
+# Stock held by checkouts, which changes without touching the catalogue
+STOCK = 'stock'
+NAMESPACES = (CATALOGUE, FLEET, AVAILABILITY, STOCK)
+
+
+def _version_key(namespace):
+    return f"cache-version:{namespace}"
+
+
+def _check_namespace(namespace):
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Unknown cache namespace: {namespace}")
+
+
+def _new_version():
+    # Start from the clock rather than 1 so a version lost to eviction or a
+    # cache restart can't come back and match keys written before it
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    """Return the current version of `namespace`."""
+    _check_namespace(namespace)
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        version = _new_version()
+        # Another process may have set it first; use whichever won
+        if not cache.add(_version_key(namespace), version, timeout=None):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def get_versions(*namespaces):
+    """Return {namespace: version} for several namespaces in one lookup."""
+    for namespace in namespaces:
+        _check_namespace(namespace)
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    return {
+        namespace: found[key] if key in found else get_version(namespace)
+        for key, namespace in keys.items()
+    }
+
+
+def bump_version(*namespaces):
+    """Invalidate everything cached under `namespaces`."""
+    for namespace in namespaces:
+        _check_namespace(namespace)
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            # No version stored yet (or it was evicted)
+            cache.set(_version_key(namespace), _new_version(), timeout=None)
+        logger.debug("Bumped cache namespace %s", namespace)
+
+
+def make_key(namespaces, *parts):
+    """
+    Build a cache key for `parts` that changes whenever any of
+    `namespaces` is bumped.
+    """
+    if isinstance(namespaces, str):
+        namespaces = (namespaces, )
+    versions = get_versions(*namespaces)
+    prefix = ':'.join(f"{namespace}.{versions[namespace]}"
+                      for namespace in namespaces)
+    key = ':'.join(str(part) for part in parts)
+    # Keep keys short and free of characters memcached/redis dislike
+    if len(key) > 150 or not key.isprintable() or ' ' in key:
+        key = hashlib.md5(key.encode()).hexdigest()
+    return f"{prefix}:{key}"
+
+
+def get_or_set(namespaces, key, default, timeout=None):
+    """
+    Return the value cached for `key` under `namespaces`, calling
+    `default()` and caching its result on a miss.
+    """
+    if timeout is None:
+        timeout = settings.CACHE_NAMESPACE_TIMEOUT
+    return cache.get_or_set(make_key(namespaces, key), default, timeout)
+
+
+def cached_view(*namespaces, timeout=None):
+    """
+    Cache a view's GET/HEAD responses until any of `namespaces` changes.
+
+    Built on Django's `cache_page`, so responses that vary on cookies or
+    headers are cached separately and private responses are not shared.
+    """
+    for namespace in namespaces:
+        _check_namespace(namespace)
+
+    def decorator(view_func):
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            versions = get_versions(*namespaces)
+            key_prefix = '.'.join(f"{namespace}{versions[namespace]}"
+                                  for namespace in namespaces)
+            view = cache_page(
+                settings.CACHE_NAMESPACE_TIMEOUT
+                if timeout is None else timeout,
+                key_prefix=key_prefix)(view_func)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class CachedRepresentationMixin:
+    """
+    Serializer mixin caching each instance's representation until any of
+    `cache_namespaces` changes. Override `get_cache_key_parts` to add any
+    context the representation depends on.
+    """
+    cache_namespaces = ()
+    cache_timeout = None
+
+    def get_cache_key_parts(self, instance):
+        return ()
+
+    def to_representation(self, instance):
+        if not self.cache_namespaces or instance.pk is None:
+            return super().to_representation(instance)
+        # File URLs are made absolute using the requested host
+        request = self.context.get('request')
+        host = request.get_host() if request else ''
+        key = ':'.join(
+            str(part)
+            for part in (type(self).__name__, instance.pk, host,
+                         *self.get_cache_key_parts(instance)))
+        represent = super().to_representation
+        return get_or_set(self.cache_namespaces,
+                          key,
+                          lambda: represent(instance),
+                          timeout=self.cache_timeout)
+
+
+def invalidate_on_change(namespace, *models):
+    """Bump `namespace` whenever one of `models` is saved or deleted."""
+    _check_namespace(namespace)
+
+    def invalidate(sender, **kwargs):
+        bump_version(namespace)
+        # Bump again once the change is visible to other connections, in
+        # case a concurrent request re-cached the old rows in between
+        transaction.on_commit(lambda: bump_version(namespace))
+
+    for model in models:
+        uid = f"cache-invalidate:{namespace}:{model._meta.label}"
+        post_save.connect(invalidate,
+                          sender=model,
+                          weak=False,
+                          dispatch_uid=uid)
+        post_delete.connect(invalidate,
+                            sender=model,
+                            weak=False,
+                            dispatch_uid=uid)
+
+
+def cache_versions(request):
+    """
+    Expose namespace versions to templates for fragment caching:
+        {% cache 900 shop-products cache_versions.catalogue %}
+    """
+    return {'cache_versions': SimpleLazyObject(lambda: get_versions(
+        *NAMESPACES))}
@@ -0,0 +1,144 @@
+"""
+HTTP caching policies.
+
+`cache_policy` lets browsers and CDNs keep a view's GET/HEAD responses and
+revalidate them cheaply. Each response gets an ETag built from the cache
+namespace versions the view depends on (see `bouldering_cy.caching`), so
+a conditional request for content that hasn't changed is answered with a
+304 before the view runs, along with the route's Cache-Control and Vary:
+
+    @cache_policy(CATALOGUE, max_age=60)
+    def shop_view(request): ...
+
+    @method_decorator(cache_policy(FLEET, AVAILABILITY, max_age=30,
+                                   refresh_every=60), name='dispatch')
+    class BookingView(TemplateView): ...
+
+Pages also show whether the visitor is signed in, and forms embed their
+CSRF token, so these go into the ETag too, along with the host, full
+path, the request headers the route varies on and RELEASE_VERSION, so
+template changes are picked up on deploy. Content that changes with time
+alone (expiring rental holds, today's date) is covered by
+`refresh_every`, which gives the ETag a new value at least that often.
+
+Responses are `public` only when the request sent no cookies and the
+response sets none; anything that may be personal is `private`. Pages
+showing flash messages are never cached, and only 200 responses get an
+ETag. Turned off with HTTP_CACHE_ENABLED (off by default under DEBUG, so
+template edits show up straight away).
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.template.response import SimpleTemplateResponse
+from django.utils.cache import (add_never_cache_headers,
+                                get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from .caching import get_versions
+
+# Stands in for RELEASE_VERSION when it isn't set, so a restart (as on
+# every deploy) still gives new ETags
+_STARTED = str(time.time_ns())
+
+
+def _has_messages(request):
+    # len() doesn't mark the messages as read
+    return len(get_messages(request)) > 0
+
+
+def _visitor(request):
+    """
+    What a page shows of the visitor: their account and CSRF token. The
+    cart is loaded by the page itself, from the cart summary endpoint.
+    """
+    user = getattr(request, 'user', None)
+    # The CSRF secret, from the cookie or, on a first visit, as the page
+    # set it
+    return (user.pk if user and user.is_authenticated else '',
+            request.META.get('CSRF_COOKIE', ''))
+
+
+def _sets_cookies(request, response):
+    # The CSRF and session cookies are only added on the way out, by their
+    # middleware
+    session = getattr(request, 'session', None)
+    return bool(response.cookies
+                or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+                or (session is not None and session.modified))
+
+
+def _etag(parts, request):
+    """
+    A weak ETag for `parts` and the visitor. Weak, as pages embed a
+    freshly masked CSRF token each time they're rendered, so two responses
+    with the same ETag are equivalent but not byte for byte the same.
+    """
+    parts = [*parts, *_visitor(request)]
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _content_parts(request, namespaces, vary, refresh_every):
+    """What the response depends on, besides the visitor."""
+    versions = get_versions(*namespaces) if namespaces else {}
+    parts = [
+        settings.RELEASE_VERSION or _STARTED,
+        request.get_host(),
+        request.get_full_path(),
+        *(f"{namespace}.{versions[namespace]}" for namespace in namespaces),
+        *(request.headers.get(header, '') for header in vary),
+    ]
+    if refresh_every:
+        parts.append(int(time.time() // refresh_every))
+    return parts
+
+
+def cache_policy(*namespaces, max_age=0, vary=(), refresh_every=None):
+    """
+    Answer conditional GET/HEAD requests for the view with a 304 until any
+    of `namespaces` changes, and let clients reuse responses for `max_age`
+    seconds before revalidating. `vary` names request headers the response
+    depends on besides Cookie (added by the session middleware).
+    """
+
+    def decorator(view_func):
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or not settings.HTTP_CACHE_ENABLED):
+                return view_func(request, *args, **kwargs)
+            if _has_messages(request):
+                response = view_func(request, *args, **kwargs)
+                add_never_cache_headers(response)
+                return response
+
+            parts = _content_parts(request, namespaces, vary,
+                                   refresh_every)
+            etag = _etag(parts, request)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                # Render now so the ETag and cookies reflect the page
+                if isinstance(response, SimpleTemplateResponse):
+                    response.render()
+                # A first visit is given its CSRF cookie by the page
+                etag = _etag(parts, request)
+            response.headers.setdefault('ETag', etag)
+
+            shared = not (request.COOKIES
+                          or _sets_cookies(request, response))
+            patch_cache_control(response,
+                                **{'public' if shared else 'private': True},
+                                max_age=max_age)
+            if vary:
+                patch_vary_headers(response, vary)
+            return response
+
+        return wrapper
+
+    return decorator
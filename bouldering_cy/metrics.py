@@ -0,0 +1,200 @@
+"""
+Per-request performance metrics.
+
+`RequestMetricsMiddleware` measures every request: the number of SQL
+queries and the time spent running them, cache hits and misses (counted
+by the backends in `bouldering_cy.cache_backends`) and the time spent
+calling Stripe and SendGrid, which the code making those calls wraps in
+`timed()`:
+
+    with timed('stripe'):
+        intent = stripe.PaymentIntent.retrieve(intent_id)
+
+The figures are sent back in a `Server-Timing` header, so they show up in
+the browser's network panel, and logged to `bouldering_cy.metrics` as
+fields of the log record (`record.metrics`). A warning is logged when a
+view goes over its query or time budget: REQUEST_QUERY_BUDGET and
+REQUEST_TIME_BUDGET_MS, overridden per URL name in REQUEST_BUDGETS.
+
+Streaming responses are measured up to the point the response is
+returned, not while their content is sent. The middleware runs natively
+under both WSGI and ASGI, so it doesn't force async views onto a thread.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.external = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting and timing each query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def fields(self):
+        """The metrics as flat, log-friendly fields; times in ms."""
+        fields = {
+            'duration_ms': round(self.duration * 1000, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+        for service, seconds in sorted(self.external.items()):
+            fields[f"{service}_ms"] = round(seconds * 1000, 1)
+        return fields
+
+    def server_timing(self):
+        """The metrics as a Server-Timing header value."""
+        entries = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+        ]
+        entries.extend(f"{service};dur={seconds * 1000:.1f}"
+                       for service, seconds in sorted(self.external.items()))
+        entries.append(f"total;dur={self.duration * 1000:.1f}")
+        return ', '.join(entries)
+
+
+def current_metrics():
+    """The metrics of the request being handled, if any."""
+    return _current.get()
+
+
+@contextmanager
+def timed(service):
+    """Add the time spent in the block to the request's `service` time."""
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.external[service] += time.perf_counter() - start
+
+
+def record_cache(hits=0, misses=0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def get_budget(view_name):
+    """(query budget, time budget in ms) for the view with `view_name`."""
+    budget = settings.REQUEST_BUDGETS.get(view_name, {})
+    return (budget.get('queries', settings.REQUEST_QUERY_BUDGET),
+            budget.get('ms', settings.REQUEST_TIME_BUDGET_MS))
+
+
+class RequestMetricsMiddleware:
+    """Measure each request and report it; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REQUEST_METRICS_ENABLED:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.watch_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Async views query through sync_to_async, on the thread the
+        # request's sync code runs on, so the queries are watched there
+        watching = await sync_to_async(self.watch_queries)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(watching.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def watch_queries(self, metrics):
+        """Count and time the queries made on this thread's connections."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics))
+        return stack
+
+    def finish(self, request, response, metrics):
+        metrics.finish()
+        if settings.REQUEST_METRICS_HEADER:
+            response['Server-Timing'] = metrics.server_timing()
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            **metrics.fields(),
+        }
+        summary = ' '.join(f"{key}={value}" for key, value in fields.items())
+        logger.info(f"Request metrics: {summary}",
+                    extra={'metrics': fields})
+
+        query_budget, time_budget = get_budget(view_name)
+        over = []
+        if query_budget is not None and metrics.queries > query_budget:
+            over.append(f"{metrics.queries} queries (budget {query_budget})")
+        if (time_budget is not None
+                and fields['duration_ms'] > time_budget):
+            over.append(f"{fields['duration_ms']}ms (budget {time_budget}ms)")
+        if over:
+            logger.warning(
+                f"{view_name or request.path} over budget: "
+                f"{', '.join(over)}",
+                extra={'metrics': fields})
@@ -15,6 +15,7 @@ import dj_database_url
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
 import sys
+from django.core.exceptions import ImproperlyConfigured
 if os.path.isfile("env.py"):
     import env
 
@@ -70,9 +71,12 @@ INSTALLED_APPS = [
     "rentals",
     "accounts",
     "newsletter",
+    "images",
+    "reports",
 ]
 
 MIDDLEWARE = [
+    "bouldering_cy.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -98,9 +102,9 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "cart.contexts.cart_summary",
                 "newsletter.contexts.newsletter_form",
                 "bouldering_cy.context_processor.sentry_settings",
+                "bouldering_cy.caching.cache_versions",
             ],
         },
     },
@@ -175,6 +179,89 @@ if 'test' in sys.argv:
     DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
     DATABASES['default']['NAME'] = os.path.join(BASE_DIR, "test_db.sqlite3")
 
+# Cache
+# 'locmem' (per process, the default in development), 'file' (shared by
+# processes on one host) or 'redis' (shared across hosts, needs the redis
+# package). Production defaults to redis when REDIS_URL is set, else file.
+if PRODUCTION:
+    DEFAULT_CACHE_BACKEND = "redis" if os.environ.get("REDIS_URL") else "file"
+else:
+    DEFAULT_CACHE_BACKEND = "locmem"
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", DEFAULT_CACHE_BACKEND)
+if 'test' in sys.argv:
+    CACHE_BACKEND = "locmem"
+# The namespace versions live in the cache, so with a per-process cache
+# the other workers would keep serving stale pages and ETags
+if (PRODUCTION and CACHE_BACKEND == "locmem"
+        and int(os.environ.get("WEB_CONCURRENCY", 1)) > 1):
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND 'locmem' isn't shared between the "
+        f"{os.environ['WEB_CONCURRENCY']} web workers, use 'file' or 'redis'")
+CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "bouldering_cy.cache_backends.LocMemCache",
+        "LOCATION": "bouldering-cy",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "file": {
+        "BACKEND": "bouldering_cy.cache_backends.FileBasedCache",
+        "LOCATION": os.environ.get("CACHE_DIR",
+                                   os.path.join(BASE_DIR, ".cache")),
+    },
+    "redis": {
+        "BACKEND": "bouldering_cy.cache_backends.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/1"),
+    },
+}
+CACHES = {
+    "default": {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        "KEY_PREFIX": "bouldering-cy",
+        "TIMEOUT": 60 * 15,  # seconds
+    }
+}
+# How long namespaced entries (catalogue, fleet, availability) are kept.
+# Model changes invalidate them straight away, so this only bounds how long
+# a change made outside the ORM's signals can go unnoticed.
+CACHE_NAMESPACE_TIMEOUT = int(os.environ.get("CACHE_NAMESPACE_TIMEOUT",
+                                             60 * 15))
+
+# HTTP caching: ETags, 304s and Cache-Control (see
+# bouldering_cy/http_caching.py). Off under DEBUG by default so template
+# edits show up without a restart.
+HTTP_CACHE_ENABLED = os.environ.get("HTTP_CACHE_ENABLED",
+                                    str(not DEBUG)) == "True"
+# Identifies the deployed code, so pages revalidated after a deploy are
+# re-rendered with the new templates (set by Heroku's dyno metadata)
+RELEASE_VERSION = os.environ.get("HEROKU_RELEASE_VERSION", "")
+
+# Request metrics (see bouldering_cy/metrics.py)
+REQUEST_METRICS_ENABLED = os.environ.get("REQUEST_METRICS_ENABLED",
+                                         "True") == "True"
+# Send the metrics to the browser in a Server-Timing header
+REQUEST_METRICS_HEADER = os.environ.get("REQUEST_METRICS_HEADER",
+                                        "True") == "True"
+# A warning is logged for requests over these budgets (None = no budget,
+# set by an empty or 0 value)
+REQUEST_QUERY_BUDGET = int(
+    os.environ.get("REQUEST_QUERY_BUDGET", 50) or 0) or None
+REQUEST_TIME_BUDGET_MS = int(
+    os.environ.get("REQUEST_TIME_BUDGET_MS", 1000) or 0) or None
+# Budgets of particular views, by URL name
+REQUEST_BUDGETS = {
+    "cart_detail": {"queries": 20},
+    "cart_add": {"queries": 15},
+    "cart_update": {"queries": 20},
+    # Creates the Payment Intent and places the holds
+    "checkout": {"queries": 40, "ms": 3000},
+    # Creates the order and sends the confirmation email
+    "checkout_success": {"queries": 60, "ms": 5000},
+    "stripe_webhook": {"queries": 60, "ms": 5000},
+    # Reports read many rows by design
+    "admin:reports_dashboard": {"queries": None, "ms": 5000},
+    "admin:reports_utilization": {"queries": None, "ms": 5000},
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -207,6 +294,31 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_KEY")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_EMAIL")
 SERVER_EMAIL = os.environ.get("DEFAULT_EMAIL")
 
+# Newsletter sending
+# Point at a local stand-in (see `run_fake_sendgrid`) for load testing
+SENDGRID_API_HOST = os.environ.get("SENDGRID_API_HOST",
+                                   "https://api.sendgrid.com")
+NEWSLETTER_SEND_WORKERS = int(os.environ.get("NEWSLETTER_SEND_WORKERS", 1))
+# Maximum sends per second across all workers (None = unlimited)
+NEWSLETTER_SEND_RATE = float(
+    os.environ.get("NEWSLETTER_SEND_RATE", 0)) or None
+NEWSLETTER_SEND_MAX_RETRIES = 3  # retries on 429 rate-limit responses
+# Subscribers fetched (and sent_to rows written) per database round trip
+NEWSLETTER_CHUNK_SIZE = 2000
+# Welcome emails are queued in the database and sent by a background
+# worker pool
+NEWSLETTER_EMAIL_ASYNC = True
+NEWSLETTER_EMAIL_WORKERS = 2
+NEWSLETTER_WELCOME_MAX_ATTEMPTS = 3
+# Seconds after which a welcome email left sending by a dead process is
+# sent again
+NEWSLETTER_WELCOME_TIMEOUT = 60 * 10
+NEWSLETTER_WELCOME_SLUG = os.environ.get("NEWSLETTER_WELCOME_SLUG", "welcome")
+NEWSLETTER_MAIL_CACHE_TIMEOUT = 60 * 5  # seconds
+# Verification key from SendGrid's signed event webhook settings
+SENDGRID_WEBHOOK_PUBLIC_KEY = os.environ.get("SENDGRID_WEBHOOK_PUBLIC_KEY")
+SENDGRID_WEBHOOK_TOLERANCE = 60 * 10  # seconds
+
 # Contact numbers
 WHATSAPP_NUMBER = os.environ.get("WHATSAPP_NUMBER")
 
@@ -317,6 +429,8 @@ STANDARD_DELIVERY_PERCENTAGE = 10
 FREE_DELIVERY_THRESHOLD = 65.00  # euros
 STRIPE_CURRENCY = "eur"
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+# Point at a local stand-in (see `run_fake_stripe`) for load testing
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE", "https://api.stripe.com")
 ORDER_CREATION_RETRIES = 3
 ORDER_CREATION_RETRY_DELAY = 3  # seconds
 TEST_WEBHOOK_ORDER_HANDLER = os.environ.get("TEST_WEBHOOK_ORDER_HANDLER",
@@ -325,10 +439,25 @@ RENTAL_HANDLING_FEE = 2.00  # euros
 
 # Stock Validation
 LOW_STOCK_THRESHOLD = 10
+# Seconds stock and crashpads stay held for a checkout
+STOCK_HOLD_TIMEOUT = 60 * 30
+STOCK_HOLD_SESSION_ID = 'stock_hold'
+# Products per page of the shop listing
+SHOP_PAGE_SIZE = 12
+
+# Responsive webp renditions generated for uploaded images
+IMAGE_RENDITION_WIDTHS = (640, 1024, 1440, 1920)
+IMAGE_RENDITION_QUALITY = 80
+# Threads used by the process_images worker command
+IMAGE_PROCESSING_WORKERS = int(os.environ.get("IMAGE_PROCESSING_WORKERS", 2))
+IMAGE_PROCESSING_MAX_ATTEMPTS = 3
+# Seconds after which a job left processing by a dead worker is retaken
+IMAGE_PROCESSING_TIMEOUT = 60 * 10
 
 # Sentry settings
 
-SENTRY_ENABLED = not ('test' in sys.argv)
+# Nor report the errors load tests provoke
+SENTRY_ENABLED = not ('test' in sys.argv or 'loadtest_checkout' in sys.argv)
 print(f"SENTRY_ENABLED setting is: {SENTRY_ENABLED}")
 if SENTRY_ENABLED:
     sentry_sdk.init(
@@ -423,6 +552,7 @@ LOGGING = {
 print("\n\n---- SETTINGS CONFIGURATION ----")
 print(f"PRODUCTION setting is: {PRODUCTION}")
 print(f"DEBUG setting is: {DEBUG}")
+print(f"HTTP_CACHE_ENABLED setting is: {HTTP_CACHE_ENABLED}")
 print("\n---- STRIPE SETTINGS ----")
 print(f"STRIPE_LIVE_MODE setting is: {STRIPE_LIVE_MODE}")
 print(f"STRIPE_PUBLIC_KEY setting exists: {bool(STRIPE_PUBLIC_KEY)}")
@@ -446,6 +576,7 @@ print(
     f"STANDARD_DELIVERY_PERCENTAGE setting is: {STANDARD_DELIVERY_PERCENTAGE}")
 print(f"FREE_DELIVERY_THRESHOLD setting is: {FREE_DELIVERY_THRESHOLD}")
 print(f"STRIPE_CURRENCY setting is: {STRIPE_CURRENCY}")
+print(f"STRIPE_API_BASE setting is: {STRIPE_API_BASE}")
 print(f"ORDER_CREATION_RETRIES setting is: {ORDER_CREATION_RETRIES}")
 print(f"ORDER_CREATION_RETRY_DELAY setting is: {ORDER_CREATION_RETRY_DELAY}")
 print("\n---- EMAIL SETTINGS ----")
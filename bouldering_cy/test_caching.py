@@ -0,0 +1,144 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory
+from model_bakery import baker
+from shop.models import Product, GalleryImage
+from rentals.models import Crashpad
+from rentals.serializers import CrashpadSerializer
+from .caching import (get_version, bump_version, make_key, get_or_set,
+                      cached_view, CATALOGUE, FLEET, AVAILABILITY)
+
+
+class CacheVersionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_keys(self):
+        """Test bumping a namespace changes the keys built under it"""
+        before = make_key(CATALOGUE, 'products')
+        bump_version(CATALOGUE)
+        self.assertNotEqual(make_key(CATALOGUE, 'products'), before)
+
+    def test_bump_only_affects_its_namespace(self):
+        """Test other namespaces keep their version"""
+        fleet_version = get_version(FLEET)
+        bump_version(CATALOGUE)
+        self.assertEqual(get_version(FLEET), fleet_version)
+
+    def test_bump_without_stored_version(self):
+        """Test bumping works after the version was evicted"""
+        bump_version(AVAILABILITY)
+        self.assertIsNotNone(get_version(AVAILABILITY))
+
+    def test_unknown_namespace(self):
+        """Test unknown namespaces are rejected"""
+        with self.assertRaises(ValueError):
+            get_version('products')
+
+    def test_long_keys_are_hashed(self):
+        """Test long or unsafe key parts are hashed"""
+        key = make_key(CATALOGUE, 'search', 'guide book ' * 20)
+        self.assertLess(len(key), 100)
+        self.assertNotIn(' ', key)
+
+    def test_get_or_set_across_namespaces(self):
+        """Test a value depending on two namespaces is dropped by either"""
+        calls = []
+
+        def load():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_or_set((FLEET, AVAILABILITY), 'x', load), 1)
+        self.assertEqual(get_or_set((FLEET, AVAILABILITY), 'x', load), 1)
+        bump_version(AVAILABILITY)
+        self.assertEqual(get_or_set((FLEET, AVAILABILITY), 'x', load), 2)
+
+
+class SignalInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_product_changes_bump_catalogue(self):
+        """Test saving and deleting products bumps the catalogue"""
+        version = get_version(CATALOGUE)
+        product = baker.make(Product, price=Decimal('10.00'),
+                             _fill_optional=False)
+        self.assertNotEqual(get_version(CATALOGUE), version)
+
+        version = get_version(CATALOGUE)
+        product.delete()
+        self.assertNotEqual(get_version(CATALOGUE), version)
+
+    def test_gallery_image_changes_bump_catalogue(self):
+        """Test gallery images belong to the catalogue namespace"""
+        product = baker.make(Product, price=Decimal('10.00'),
+                             _fill_optional=False)
+        version = get_version(CATALOGUE)
+        baker.make(GalleryImage, product=product, image='test.jpg')
+        self.assertNotEqual(get_version(CATALOGUE), version)
+
+    def test_crashpad_changes_bump_fleet_and_availability(self):
+        """Test crashpads invalidate the fleet and availability"""
+        fleet, availability = get_version(FLEET), get_version(AVAILABILITY)
+        catalogue = get_version(CATALOGUE)
+        baker.make(Crashpad, day_rate=Decimal('10.00'),
+                   seven_day_rate=Decimal('8.00'),
+                   fourteen_day_rate=Decimal('6.00'))
+        self.assertNotEqual(get_version(FLEET), fleet)
+        self.assertNotEqual(get_version(AVAILABILITY), availability)
+        self.assertEqual(get_version(CATALOGUE), catalogue)
+
+
+class CachedHelpersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.crashpad = baker.make(Crashpad,
+                                   name='Original',
+                                   day_rate=Decimal('10.00'),
+                                   seven_day_rate=Decimal('8.00'),
+                                   fourteen_day_rate=Decimal('6.00'))
+
+    def test_cached_view(self):
+        """Test a cached view is served from cache until its data changes"""
+        calls = []
+
+        @cached_view(FLEET)
+        def view(request):
+            calls.append(1)
+            return HttpResponse(str(len(calls)))
+
+        self.assertEqual(view(self.factory.get('/fleet/')).content, b'1')
+        self.assertEqual(view(self.factory.get('/fleet/')).content, b'1')
+        self.crashpad.save()
+        self.assertEqual(view(self.factory.get('/fleet/')).content, b'2')
+
+    def test_serializer_representation_is_cached(self):
+        """Test serialized crashpads are cached and refreshed on save"""
+        with self.assertNumQueries(1):
+            CrashpadSerializer(self.crashpad).data
+        # Gallery images are not fetched again
+        with self.assertNumQueries(0):
+            data = CrashpadSerializer(self.crashpad).data
+        self.assertEqual(data['name'], 'Original')
+
+        self.crashpad.name = 'Renamed'
+        self.crashpad.save()
+        self.assertEqual(CrashpadSerializer(self.crashpad).data['name'],
+                         'Renamed')
+
+    def test_serializer_cache_varies_on_dates(self):
+        """Test availability for different dates is cached separately"""
+        unknown = CrashpadSerializer(self.crashpad).data
+        dated = CrashpadSerializer(self.crashpad,
+                                   context={
+                                       'check_in': '2030-01-01',
+                                       'check_out': '2030-01-05'
+                                   }).data
+        self.assertEqual(unknown['availability_status'], 'unknown')
+        self.assertEqual(dated['availability_status'], 'available')
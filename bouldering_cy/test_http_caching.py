@@ -0,0 +1,173 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from rentals.models import Crashpad, CrashpadBooking
+from shop.models import Product
+from .http_caching import cache_policy
+
+
+@override_settings(HTTP_CACHE_ENABLED=True)
+class CachePolicyTests(TestCase):
+    """Test ETags, 304s and Cache-Control on the cached routes"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = baker.make(Product,
+                                  name='Guidebook',
+                                  price=Decimal('30.00'),
+                                  stock=5)
+        self.crashpad = baker.make(Crashpad,
+                                   name='Big Pad',
+                                   day_rate=Decimal('10.00'))
+
+    def revalidate(self, url, response, **extra):
+        """GET `url` again with the ETag of an earlier `response`"""
+        return self.client.get(url,
+                               HTTP_IF_NONE_MATCH=response['ETag'],
+                               **extra)
+
+    def test_not_modified_until_catalogue_changes(self):
+        """Test the shop answers 304 until a product changes"""
+        url = reverse('shop')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        with self.assertTemplateNotUsed('shop/shop.html'):
+            not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertIn('max-age=60', not_modified['Cache-Control'])
+
+        self.product.price = Decimal('25.00')
+        self.product.save()
+        changed = self.revalidate(url, response)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_etag_depends_on_query_and_visitor(self):
+        """Test other pages and users get their own ETags, carts don't"""
+        url = reverse('shop')
+        response = self.client.get(url)
+        self.assertEqual(
+            self.revalidate(url, response, data={
+                'q': 'guide'
+            }).status_code, 200)
+
+        self.client.post(reverse('cart_add', args=['product']), {
+            'product_id': self.product.id,
+            'quantity': 1
+        })
+        # The page showing the "added to cart" message isn't cached
+        shown = self.revalidate(url, response)
+        self.assertEqual(shown.status_code, 200)
+        self.assertFalse(shown.has_header('ETag'))
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        self.client.force_login(User.objects.create_user('climber'))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_anonymous_pages_are_public(self):
+        """Test pages are shared until the visitor has cookies"""
+        for name in ('home', 'privacy_policy'):
+            response = self.client.get(reverse(name))
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('max-age=300', response['Cache-Control'])
+            self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+            self.assertEqual(
+                self.revalidate(reverse(name), response).status_code, 304)
+
+        self.client.force_login(User.objects.create_user('climber'))
+        response = self.client.get(reverse('home'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(
+            self.revalidate(reverse('home'), response).status_code, 304)
+
+    def test_api_is_public(self):
+        """Test anonymous API responses can be shared and vary on Accept"""
+        url = reverse('rentals:crashpad-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('private', response['Cache-Control'])
+        self.assertIn('max-age=30', response['Cache-Control'])
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(
+            self.revalidate(url, response,
+                            HTTP_ACCEPT='application/json').status_code, 304)
+        self.assertEqual(
+            self.revalidate(url, response,
+                            HTTP_ACCEPT='text/html').status_code, 200)
+
+    def test_availability_follows_bookings_and_time(self):
+        """Test availability revalidates on bookings and every minute"""
+        check_in = date.today() + timedelta(days=10)
+        url = reverse('rentals:crashpad-available')
+        params = {
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat()
+        }
+        response = self.client.get(url, params)
+        self.assertEqual(
+            self.revalidate(url, response, data=params).status_code, 304)
+
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad,
+                   check_in=check_in,
+                   check_out=check_in,
+                   status='confirmed')
+        response_after_booking = self.revalidate(url, response, data=params)
+        self.assertEqual(response_after_booking.status_code, 200)
+        self.assertEqual(response_after_booking.json(), [])
+
+        with patch('bouldering_cy.http_caching.time.time',
+                   return_value=10**9):
+            later = self.revalidate(reverse('rentals:booking'),
+                                    self.client.get(
+                                        reverse('rentals:booking')))
+            self.assertEqual(later.status_code, 304)
+        with patch('bouldering_cy.http_caching.time.time',
+                   return_value=10**9 + 60):
+            self.assertEqual(
+                self.revalidate(reverse('rentals:booking'),
+                                later).status_code, 200)
+
+    def test_errors_and_other_methods_untouched(self):
+        """Test only successful GETs get an ETag"""
+        response = self.client.get(reverse('rentals:crashpad-available'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+        view = cache_policy()(lambda request: HttpResponse('posted'))
+        request = self.client.post('/').wsgi_request
+        self.assertFalse(view(request).has_header('ETag'))
+
+    def test_pages_with_messages_not_cached(self):
+        """Test one-off flash messages are never cached"""
+
+        @cache_policy(max_age=300)
+        def view(request):
+            return HttpResponse('page')
+
+        request = self.client.get(reverse('home')).wsgi_request
+        messages.info(request, 'Added to cart')
+        response = view(request)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    @override_settings(HTTP_CACHE_ENABLED=False)
+    def test_disabled(self):
+        """Test no caching headers are sent when turned off"""
+        response = self.client.get(reverse('shop'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Cache-Control'))
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (TestCase, RequestFactory, AsyncRequestFactory,
+                         override_settings)
+from django.urls import reverse
+from model_bakery import baker
+from shop.models import Product
+from .metrics import RequestMetricsMiddleware, timed, get_budget
+
+
+def instrumented_view(request):
+    """Two queries, a cache miss then a hit, and a Stripe call"""
+    list(Product.objects.all())
+    Product.objects.count()
+    cache.get('metrics-test')
+    cache.set('metrics-test', 1)
+    cache.get_many(['metrics-test', 'metrics-missing'])
+    with timed('stripe'):
+        time.sleep(0.01)
+    return HttpResponse("ok")
+
+
+async def async_instrumented_view(request):
+    """Two queries and a Stripe call, from an async view"""
+    await sync_to_async(list)(Product.objects.all())
+    await Product.objects.acount()
+    with timed('stripe'):
+        await asyncio.sleep(0.01)
+    return HttpResponse("ok")
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = RequestMetricsMiddleware(instrumented_view)
+
+    def get(self):
+        with self.assertLogs('bouldering_cy.metrics', 'INFO') as logs:
+            response = self.middleware(self.factory.get('/metrics-test/'))
+        return response, logs.records
+
+    def test_metrics_are_recorded(self):
+        """Test queries, cache lookups and outbound time are measured"""
+        response, records = self.get()
+        metrics = records[0].metrics
+        self.assertEqual(metrics['queries'], 2)
+        self.assertEqual(metrics['cache_hits'], 1)
+        self.assertEqual(metrics['cache_misses'], 2)
+        self.assertGreaterEqual(metrics['stripe_ms'], 10)
+        self.assertGreaterEqual(metrics['duration_ms'], metrics['stripe_ms'])
+        self.assertEqual(metrics['status'], 200)
+
+    def test_server_timing_header(self):
+        """Test the metrics are sent in a Server-Timing header"""
+        response, _ = self.get()
+        timing = response['Server-Timing']
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('cache;desc="1 hits, 2 misses"', timing)
+        self.assertIn('stripe;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(REQUEST_QUERY_BUDGET=1)
+    def test_over_budget_warning(self):
+        """Test a warning is logged for requests over budget"""
+        _, records = self.get()
+        warnings = [r for r in records if r.levelname == 'WARNING']
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("2 queries (budget 1)", warnings[0].getMessage())
+
+    @override_settings(REQUEST_QUERY_BUDGET=None, REQUEST_TIME_BUDGET_MS=None)
+    def test_no_budget(self):
+        """Test no warning is logged without budgets"""
+        _, records = self.get()
+        self.assertEqual([r.levelname for r in records], ['INFO'])
+
+    def test_within_budget(self):
+        """Test no warning is logged within the budget"""
+        _, records = self.get()
+        self.assertEqual([r.levelname for r in records], ['INFO'])
+
+    @override_settings(REQUEST_BUDGETS={'checkout': {'queries': 5}},
+                       REQUEST_QUERY_BUDGET=50,
+                       REQUEST_TIME_BUDGET_MS=1000)
+    def test_view_budgets(self):
+        """Test per-view budgets override the defaults"""
+        self.assertEqual(get_budget('checkout'), (5, 1000))
+        self.assertEqual(get_budget('shop'), (50, 1000))
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Test nothing is measured when disabled"""
+        response = self.middleware(self.factory.get('/metrics-test/'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_real_view(self):
+        """Test a page through the full middleware stack"""
+        baker.make(Product, _quantity=2)
+        with self.assertLogs('bouldering_cy.metrics', 'INFO') as logs:
+            response = self.client.get(reverse('shop'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(logs.records[0].metrics['view'], 'shop')
+        self.assertGreater(logs.records[0].metrics['queries'], 0)
+
+    async def test_async_view(self):
+        """Test async views are measured without leaving the event loop"""
+        middleware = RequestMetricsMiddleware(async_instrumented_view)
+        with self.assertLogs('bouldering_cy.metrics', 'INFO') as logs:
+            response = await middleware(
+                AsyncRequestFactory().get('/metrics-test/'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertGreaterEqual(logs.records[0].metrics['stripe_ms'], 10)
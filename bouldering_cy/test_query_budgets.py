@@ -0,0 +1,280 @@
+"""
+Query budgets for the hot paths.
+
+Each test runs a view for carts or fleets of increasing size and checks
+the number of queries against its budget. Reading a cart or a fleet must
+cost the same however big it is, so an N+1 fails here rather than in
+production. Creating an order writes rows for every line, so its budget
+grows by a fixed allowance per line instead.
+
+A budget should only be raised deliberately, with the reason in the
+commit.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from cart.contexts import cart_summary
+from orders.models import Order
+from rentals.models import Crashpad, CrashpadBooking, CrashpadGalleryImage
+from shop.models import Product
+
+CART_SIZES = (1, 10, 50)
+FLEET_SIZES = (10, 100)
+
+ORDER_FORM = {
+    'first_name': 'Test',
+    'last_name': 'User',
+    'email': 'test@example.com',
+    'phone': '12345678',
+    'address_line1': '1 Test Street',
+    'address_line2': '',
+    'town_or_city': 'Nicosia',
+    'postal_code': '1000',
+    'country': 'CY',
+    'comments': '',
+}
+
+
+class QueryBudgetTestCase(TestCase):
+
+    def count_queries(self, view):
+        """Run `view` with a cold cache and return its number of queries"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            view()
+        return len(queries)
+
+    def assertWithinBudget(self, budget, count, msg=None):
+        self.assertLessEqual(
+            count, budget,
+            f"{msg or 'View'} ran {count} queries, budget is {budget}")
+
+
+class CartQueryBudgetTests(QueryBudgetTestCase):
+    """Test the cart and checkout views against their query budgets"""
+
+    CART_DETAIL = 16
+    CART_SUMMARY = 8
+    CHECKOUT = 32
+    STORE_ORDER_METADATA = 15
+    # Creating the order: a fixed cost, then an item row per product and
+    # a booking, its days and its rollups per crashpad
+    CHECKOUT_SUCCESS = 46
+    PER_PRODUCT = 1
+    PER_RENTAL = 8
+
+    def setUp(self):
+        """Set up test data"""
+        self.check_in = date.today() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def make_cart(self, lines):
+        """A cart of `lines` lines, half products and half rentals"""
+        rentals = lines // 2
+        products = lines - rentals
+        cart = {}
+        for product in baker.make(Product,
+                                  price=Decimal('10.00'),
+                                  stock=100,
+                                  _quantity=products):
+            cart[f"product_{product.pk}"] = {
+                'quantity': 1,
+                'price': '10.00',
+                'type': 'product',
+            }
+        for _ in range(rentals):
+            crashpad = baker.make(Crashpad,
+                                  day_rate=Decimal('10.00'),
+                                  seven_day_rate=Decimal('8.00'),
+                                  fourteen_day_rate=Decimal('6.00'))
+            cart[f"rental_{crashpad.pk}"] = {
+                'quantity': 1,
+                'price': '10.00',
+                'type': 'rental',
+                'check_in': self.check_in.isoformat(),
+                'check_out': self.check_out.isoformat(),
+                'rental_days': 3,
+                'daily_rate': '10.00',
+            }
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = cart
+        session.save()
+        return products, rentals
+
+    def assertCartBudget(self, budget, view, name):
+        """Test `view` stays within `budget` for every cart size"""
+        counts = {}
+        for lines in CART_SIZES:
+            with self.subTest(lines=lines):
+                self.make_cart(lines)
+                counts[lines] = self.count_queries(view)
+                self.assertWithinBudget(budget, counts[lines],
+                                        f"{name} with {lines} lines")
+        # Mixed carts must cost the same whatever their size
+        self.assertEqual(counts[10], counts[50],
+                         f"{name} queries grow with the cart: {counts}")
+
+    def test_cart_detail(self):
+        """Test the cart page"""
+        self.assertCartBudget(
+            self.CART_DETAIL, lambda: self.client.get(reverse('cart_detail')),
+            'cart_detail')
+
+    def test_cart_summary(self):
+        """Test the cart context processor"""
+
+        def summary():
+            request = RequestFactory().get('/cart/')
+            request.session = self.client.session
+            cart_summary(request)
+
+        self.assertCartBudget(self.CART_SUMMARY, summary, 'cart_summary')
+
+    @patch('stripe.PaymentIntent.create_async')
+    def test_checkout(self, mock_create):
+        """Test the checkout page, which also places the holds"""
+        mock_create.return_value = MagicMock(id='pi_test',
+                                             client_secret='pi_test_secret')
+
+        def checkout():
+            response = self.client.get(reverse('checkout'))
+            self.assertEqual(response.status_code, 200)
+
+        self.assertCartBudget(self.CHECKOUT, checkout, 'checkout')
+
+    @patch('stripe.PaymentIntent.modify_async')
+    def test_store_order_metadata(self, mock_modify):
+        """Test storing the order form in the PaymentIntent"""
+
+        def store():
+            response = self.client.post(
+                reverse('store_order_metadata'), {
+                    **ORDER_FORM, 'stripe-client-secret':
+                    'pi_test_secret_test'
+                })
+            self.assertEqual(response.status_code, 200)
+
+        self.assertCartBudget(self.STORE_ORDER_METADATA, store,
+                              'store_order_metadata')
+
+    @patch('payments.views.send_rental_confirmation_email')
+    @patch('payments.views.send_confirmation_email')
+    @patch('stripe.PaymentIntent.retrieve_async')
+    def test_checkout_success(self, mock_retrieve, *mock_emails):
+        """Test creating the order, within a fixed allowance per line"""
+        for lines in CART_SIZES:
+            with self.subTest(lines=lines):
+                products, rentals = self.make_cart(lines)
+                reference = f"pi_success_{lines}"
+                session = self.client.session
+                session['order_form_data'] = ORDER_FORM
+                session.save()
+                mock_retrieve.return_value = MagicMock(id=reference,
+                                                       status='succeeded',
+                                                       metadata={})
+
+                def success():
+                    response = self.client.get(
+                        reverse('checkout_success'),
+                        {'payment_intent': reference})
+                    self.assertEqual(response.status_code, 200)
+
+                self.assertWithinBudget(
+                    self.CHECKOUT_SUCCESS + self.PER_PRODUCT * products +
+                    self.PER_RENTAL * rentals, self.count_queries(success),
+                    f"checkout_success with {lines} lines")
+                self.assertTrue(
+                    Order.objects.filter(stripe_piid=reference).exists())
+
+    def test_confirmation_emails(self):
+        """Test the emails list the order's lines without extra queries"""
+        from payments.utils import (send_confirmation_email,
+                                    send_rental_confirmation_email)
+        counts = {}
+        for lines in (10, 50):
+            order = baker.make(Order)
+            for _ in range(lines):
+                baker.make('orders.OrderItem',
+                           order=order,
+                           product=baker.make(Product, price=Decimal('5')))
+                CrashpadBooking.objects.create(
+                    crashpad=baker.make(Crashpad,
+                                        day_rate=Decimal('10.00'),
+                                        seven_day_rate=Decimal('8.00'),
+                                        fourteen_day_rate=Decimal('6.00')),
+                    order=order,
+                    check_in=self.check_in,
+                    check_out=self.check_out)
+            order.prefetch_lines()
+            counts[lines] = self.count_queries(lambda: (
+                send_confirmation_email(order),
+                send_rental_confirmation_email(order)))
+        self.assertEqual(counts[10], counts[50])
+
+
+class FleetQueryBudgetTests(QueryBudgetTestCase):
+    """Test the crashpad availability views against their query budgets"""
+
+    AVAILABLE = 6
+    BOOKING_VIEW = 1
+
+    def setUp(self):
+        """Set up test data"""
+        self.check_in = date.today() + timedelta(days=10)
+        self.params = {
+            'check_in': self.check_in.isoformat(),
+            'check_out': (self.check_in + timedelta(days=2)).isoformat(),
+        }
+
+    def make_fleet(self, size):
+        """`size` crashpads with a gallery image each, a tenth booked"""
+        crashpads = baker.make(Crashpad,
+                               day_rate=Decimal('10.00'),
+                               seven_day_rate=Decimal('8.00'),
+                               fourteen_day_rate=Decimal('6.00'),
+                               _quantity=size)
+        for crashpad in crashpads:
+            baker.make(CrashpadGalleryImage, crashpad=crashpad)
+        for crashpad in crashpads[::10]:
+            CrashpadBooking.objects.create(crashpad=crashpad,
+                                           order=baker.make(Order),
+                                           check_in=self.check_in,
+                                           check_out=self.check_in)
+
+    def assertFleetBudget(self, budget, view, name):
+        """Test `view` costs the same, within `budget`, for every fleet"""
+        counts = {}
+        for size in FLEET_SIZES:
+            with self.subTest(crashpads=size):
+                self.make_fleet(size)
+                counts[size] = self.count_queries(view)
+                self.assertWithinBudget(budget, counts[size],
+                                        f"{name} with {size} crashpads")
+        self.assertEqual(len(set(counts.values())), 1,
+                         f"{name} queries grow with the fleet: {counts}")
+
+    def test_available_crashpads(self):
+        """Test the available crashpads API"""
+
+        def available():
+            response = self.client.get(reverse('rentals:crashpad-available'),
+                                       self.params)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertFleetBudget(self.AVAILABLE, available, 'available')
+
+    def test_booking_view(self):
+        """Test the booking page, with and without dates"""
+        for params in (self.params, {}):
+            with self.subTest(params=params):
+                self.assertFleetBudget(
+                    self.BOOKING_VIEW,
+                    lambda: self.client.get(reverse('rentals:booking'),
+                                            params), 'BookingView')
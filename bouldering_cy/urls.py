@@ -20,6 +20,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from bouldering_cy.http_caching import cache_policy
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("allauth.urls")),
@@ -33,6 +34,7 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls')),
     path('rentals/', include('rentals.urls')),
     path('privacy-policy/',
-         TemplateView.as_view(template_name='privacy_policy.html'),
+         cache_policy(max_age=300)(
+             TemplateView.as_view(template_name='privacy_policy.html')),
          name='privacy_policy'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,194 @@
+"""
+JSON cart API, so the cart can be changed without a page load.
+
+    GET    /cart/api/                     the cart
+    POST   /cart/api/items/               add {"type": "product", "id",
+                                          "quantity"} or {"type": "rental",
+                                          "id", "check_in", "check_out"}
+    PATCH  /cart/api/items/<type>/<id>/   set {"quantity"}, 0 removes
+    DELETE /cart/api/items/<type>/<id>/   remove
+
+Every response is the whole priced cart (`cart_breakdown`), so the page
+can redraw it from the one request. Errors are {"error": message} with a
+400, or a 404 for unknown items. Posts need the CSRF token, sent in the
+X-CSRFToken header.
+"""
+import json
+import logging
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import (require_GET, require_POST,
+                                          require_http_methods)
+from rentals.models import Crashpad
+from rentals.views import validate_dates
+from shop.models import Product
+from .cart import Cart
+
+logger = logging.getLogger(__name__)
+
+ITEM_TYPES = ('product', 'rental')
+
+
+def cart_breakdown(cart):
+    """The cart's lines, totals, delivery and fees."""
+    return {
+        'count': len(cart),
+        'items': cart.serialize()['items'],
+        **cart.totals(),
+    }
+
+
+def _cart_response(cart):
+    return JsonResponse(cart_breakdown(cart))
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _read_json(request):
+    """The request's JSON object, or None if it isn't one."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _quantity(value, minimum=1):
+    """`value` as a quantity of at least `minimum`, or None."""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity >= minimum else None
+
+
+def _id(value):
+    """`value` as an item id, or None."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_product(cart, product_id):
+    """The product, annotated with what's available to this cart."""
+    # Availability excludes stock held by other checkouts
+    return Product.objects.with_available_stock(
+        cart.hold_reference).filter(pk=product_id).first()
+
+
+def _stock_error(product, quantity):
+    """Why the cart can't have `quantity` of `product`, if it can't."""
+    if product.has_stock(quantity):
+        return None
+    available = product.available_quantity()
+    if available == 0:
+        return f"Sorry, {product.name} is out of stock"
+    return f"Sorry, only {available} units available for {product.name}"
+
+
+@require_GET
+@never_cache
+def cart_api(request):
+    """The priced cart."""
+    return _cart_response(Cart(request))
+
+
+@require_POST
+def cart_api_add(request):
+    """Add a product, or a crashpad for the given dates."""
+    data = _read_json(request)
+    if data is None:
+        return _error("Expected a JSON object")
+    cart = Cart(request)
+    item_type = data.get('type')
+    item_id = _id(data.get('id'))
+    if item_id is None and item_type in ITEM_TYPES:
+        return _error("Invalid id")
+
+    if item_type == 'product':
+        quantity = _quantity(data.get('quantity', 1))
+        if quantity is None:
+            return _error("Quantity must be a positive number")
+        product = _get_product(cart, item_id)
+        if product is None:
+            return _error("Product not found", status=404)
+        in_cart = cart.product_quantities().get(product.pk, 0)
+        error = _stock_error(product, in_cart + quantity)
+        if error:
+            return _error(error)
+        cart.add(item=product, quantity=quantity, item_type='product')
+
+    elif item_type == 'rental':
+        check_in = parse_date(str(data.get('check_in', '')))
+        check_out = parse_date(str(data.get('check_out', '')))
+        if not (check_in and check_out):
+            return _error("check_in and check_out must be YYYY-MM-DD dates")
+        is_valid, error = validate_dates(check_in, check_out)
+        if not is_valid:
+            return _error(error)
+        crashpad = Crashpad.objects.filter(pk=item_id).first()
+        if crashpad is None:
+            return _error("Crashpad not found", status=404)
+        if Crashpad.unavailable_ids([(crashpad.pk, check_in, check_out)],
+                                    cart.hold_reference):
+            return _error(f"{crashpad.name} is not available for these "
+                          "dates")
+        # New dates replace any the crashpad is already in the cart for
+        cart.remove(crashpad, 'rental')
+        cart.add(item=crashpad,
+                 item_type='rental',
+                 dates={
+                     'check_in': check_in.isoformat(),
+                     'check_out': check_out.isoformat()
+                 })
+
+    else:
+        return _error(f"type must be one of {', '.join(ITEM_TYPES)}")
+
+    logger.info(f"Cart API added {item_type} {item_id}")
+    return _cart_response(cart)
+
+
+@require_http_methods(['PATCH', 'DELETE'])
+def cart_api_item(request, item_type, item_id):
+    """Change the quantity of an item in the cart, or remove it."""
+    if item_type not in ITEM_TYPES:
+        return _error("Item not found", status=404)
+    item_id = _id(item_id)
+    if item_id is None:
+        return _error("Invalid id")
+    cart = Cart(request)
+    key = f"{item_type}_{item_id}"
+    if key not in cart.cart:
+        return _error("Item not in cart", status=404)
+
+    if request.method == 'PATCH':
+        data = _read_json(request)
+        if data is None:
+            return _error("Expected a JSON object")
+        quantity = _quantity(data.get('quantity'), minimum=0)
+        if quantity is None:
+            return _error("Quantity must be a number, 0 to remove")
+        if quantity and item_type == 'rental':
+            return _error("Rentals can only be removed")
+        if quantity:
+            product = _get_product(cart, item_id)
+            if product is None:
+                return _error("Product not found", status=404)
+            error = _stock_error(product, quantity)
+            if error:
+                return _error(error)
+            cart.add(item=product,
+                     quantity=quantity,
+                     update_quantity=True,
+                     item_type='product')
+            return _cart_response(cart)
+
+    # Removing needs only the key, not the product or crashpad
+    del cart.cart[key]
+    cart.save()
+    return _cart_response(cart)
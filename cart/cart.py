@@ -10,13 +10,20 @@ logger = logging.getLogger(__name__)
 
 class Cart:
 
-    def __init__(self, request=None, cart_data=None):
-        """Initialize the cart."""
+    def __init__(self, request=None, cart_data=None, hold_reference=None):
+        """
+        Initialize the cart. `hold_reference` identifies the stock holds
+        placed for this cart's checkout, which don't count against it.
+        """
+        self.hold_reference = hold_reference
         # The cart is initialized from the session
         if request:
             self.session = request.session
             cart = self.session.get(settings.CART_SESSION_ID, {})
             self.cart = cart
+            if not hold_reference:
+                self.hold_reference = self.session.get(
+                    settings.STOCK_HOLD_SESSION_ID)
         # The cart is initialized from the payment intent
         elif cart_data:
             # Initialize empty cart
@@ -171,7 +178,9 @@ class Cart:
             elif item_type == 'rental':
                 crashpad_ids.append(item_id)
 
-        products = Product.objects.filter(id__in=product_ids)
+        # Availability excludes stock held by other checkouts
+        products = Product.objects.filter(
+            id__in=product_ids).with_available_stock(self.hold_reference)
         crashpads = Crashpad.objects.filter(id__in=crashpad_ids)
 
         # Create a copy of the cart to avoid modifying the session directly
@@ -295,6 +304,7 @@ class Cart:
         Used by utils.validate_stock() and in templates to determine
         if checkout should be enabled.
         """
+        unavailable = self.unavailable_rentals()
         for item in self:
             # Validate product stock
             if item['type'] == 'product':
@@ -305,7 +315,8 @@ class Cart:
                     error = {
                         'error': 'insufficient_stock',
                         'product': product,
-                        'requested': quantity
+                        'requested': quantity,
+                        'available': product.available_quantity()
                     }
                     logger.error(
                         f"Insufficient stock for product {product.id}")
@@ -319,7 +330,7 @@ class Cart:
                                               '%Y-%m-%d').date()
 
                 # Check if the dates are still available
-                if not crashpad.is_available(check_in, check_out):
+                if crashpad.id in unavailable:
                     error = {
                         'error': 'dates_unavailable',
                         'crashpad': crashpad,
@@ -348,6 +359,7 @@ class Cart:
         Used for displaying detailed error messages to the user in templates.
         """
         invalid_items = []
+        unavailable = self.unavailable_rentals()
         for item in self:
             if item['type'] == 'product':
                 product = item['item']
@@ -360,9 +372,9 @@ class Cart:
                         'requested':
                         item['quantity'],
                         'available':
-                        product.stock,
+                        product.available_quantity(),
                         'error':
-                        f'Only {product.stock} units available'
+                        f'Only {product.available_quantity()} units available'
                     })
             elif item['type'] == 'rental':
                 crashpad = item['item']
@@ -382,7 +394,7 @@ class Cart:
                         'error':
                         'Selected dates are in the past'
                     })
-                elif not crashpad.is_available(check_in, check_out):
+                elif crashpad.id in unavailable:
                     invalid_items.append({
                         'name':
                         crashpad.name,
@@ -403,6 +415,29 @@ class Cart:
         """
         return self.get_all_invalid_items()
 
+    def product_quantities(self):
+        """Return {product id: quantity} for the products in the cart."""
+        return {
+            int(key.split('_')[1]): int(item['quantity'])
+            for key, item in self.cart.items() if item['type'] == 'product'
+        }
+
+    def rental_dates(self):
+        """Return (crashpad id, check in, check out) for each rental."""
+        return [(int(key.split('_')[1]),
+                 datetime.strptime(item['check_in'], '%Y-%m-%d').date(),
+                 datetime.strptime(item['check_out'], '%Y-%m-%d').date())
+                for key, item in self.cart.items()
+                if item['type'] == 'rental']
+
+    def unavailable_rentals(self):
+        """
+        Return the ids of the crashpads in the cart that are no longer
+        available for their dates, checked for all rentals at once.
+        """
+        return Crashpad.unavailable_ids(self.rental_dates(),
+                                        self.hold_reference)
+
     def has_rentals(self):
         """Check if the cart has any rental items."""
         return any(item['type'] == 'rental' for item in self)
@@ -414,3 +449,41 @@ class Cart:
     def has_mixed_items(self):
         """Check if the cart has both rental and product items."""
         return self.has_rentals() and self.has_products()
+
+    def totals(self):
+        """
+        Price the cart from the session, without loading its items:
+        delivery is STANDARD_DELIVERY_PERCENTAGE of the cart total below
+        FREE_DELIVERY_THRESHOLD when there are products, and the rental
+        handling fee is added when there are rentals.
+        """
+        types = {item['type'] for item in self.cart.values()}
+        has_products = 'product' in types
+        has_rentals = 'rental' in types
+        cart_total = self.cart_total()
+
+        delivery_cost = Decimal('0')
+        if has_products and cart_total < settings.FREE_DELIVERY_THRESHOLD:
+            delivery_cost = (Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) *
+                             cart_total / Decimal('100'))
+        handling_fee = Decimal(str(
+            settings.RENTAL_HANDLING_FEE)) if has_rentals else Decimal('0')
+
+        if has_products and has_rentals:
+            order_type = 'MIXED'
+        elif has_products:
+            order_type = 'PRODUCTS_ONLY'
+        elif has_rentals:
+            order_type = 'RENTALS_ONLY'
+        else:
+            order_type = None
+
+        return {
+            'cart_total': cart_total,
+            'delivery_cost': delivery_cost,
+            'handling_fee': handling_fee,
+            'grand_total': cart_total + delivery_cost + handling_fee,
+            'order_type': order_type,
+            'has_products': has_products,
+            'has_rentals': has_rentals,
+        }
@@ -0,0 +1,188 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from model_bakery import baker
+from rentals.models import Crashpad, CrashpadBooking
+from shop.models import Product
+
+
+class CartApiTest(TestCase):
+    """Test the JSON cart API"""
+
+    def setUp(self):
+        self.product = baker.make(Product,
+                                  name="Guidebook",
+                                  price=Decimal("30.00"),
+                                  stock=3,
+                                  is_active=True,
+                                  _fill_optional=False)
+        self.crashpad = baker.make(Crashpad,
+                                   name="Big Pad",
+                                   day_rate=Decimal("5.00"),
+                                   seven_day_rate=Decimal("4.00"),
+                                   fourteen_day_rate=Decimal("3.00"),
+                                   _fill_optional=False)
+        self.check_in = date.today() + timedelta(days=1)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url,
+                                            json.dumps(data),
+                                            content_type='application/json')
+
+    def add_product(self, quantity=1):
+        return self.send('post', reverse('cart_api_add'), {
+            'type': 'product',
+            'id': self.product.id,
+            'quantity': quantity
+        })
+
+    def add_rental(self, check_in=None, check_out=None):
+        return self.send(
+            'post', reverse('cart_api_add'), {
+                'type': 'rental',
+                'id': self.crashpad.id,
+                'check_in': (check_in or self.check_in).isoformat(),
+                'check_out': (check_out or self.check_out).isoformat()
+            })
+
+    def item_url(self, item_type, item_id):
+        return reverse('cart_api_item', args=[item_type, item_id])
+
+    def test_empty_cart(self):
+        """Test an empty cart is priced at zero"""
+        response = self.client.get(reverse('cart_api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        data = response.json()
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(data['items'], [])
+        self.assertEqual(Decimal(data['grand_total']), 0)
+        self.assertIsNone(data['order_type'])
+
+    def test_add_product_prices_cart(self):
+        """Test adding products returns the priced breakdown"""
+        data = self.add_product(quantity=2).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['order_type'], 'PRODUCTS_ONLY')
+        self.assertEqual(Decimal(data['cart_total']), Decimal('60.00'))
+        self.assertEqual(Decimal(data['delivery_cost']), Decimal('6.00'))
+        self.assertEqual(Decimal(data['grand_total']), Decimal('66.00'))
+
+        # Adding more goes over the free delivery threshold
+        data = self.add_product().json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(Decimal(data['delivery_cost']), 0)
+        self.assertEqual(Decimal(data['grand_total']), Decimal('90.00'))
+
+    def test_add_product_checks_stock(self):
+        """Test products can't be added beyond their stock"""
+        self.add_product(quantity=2)
+        response = self.add_product(quantity=2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('only 3 units', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('cart_api')).json()['count'],
+                         2)
+
+    def test_add_rental(self):
+        """Test adding a crashpad adds the handling fee"""
+        data = self.add_rental().json()
+        self.assertEqual(data['order_type'], 'RENTALS_ONLY')
+        # Three days, counting check-in and check-out
+        self.assertEqual(Decimal(data['cart_total']), Decimal('15.00'))
+        self.assertEqual(Decimal(data['handling_fee']), Decimal('2.00'))
+        self.assertEqual(Decimal(data['grand_total']), Decimal('17.00'))
+
+        # New dates replace the old ones
+        data = self.add_rental(check_out=self.check_in +
+                               timedelta(days=3)).json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(Decimal(data['cart_total']), Decimal('20.00'))
+
+        data = self.add_product().json()
+        self.assertEqual(data['order_type'], 'MIXED')
+
+    def test_add_unavailable_rental(self):
+        """Test booked crashpads and bad dates are refused"""
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad,
+                   check_in=self.check_in,
+                   check_out=self.check_out,
+                   status='confirmed')
+        response = self.add_rental()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not available', response.json()['error'])
+
+        response = self.add_rental(check_in=date.today() - timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('past', response.json()['error'])
+
+    def test_bad_requests(self):
+        """Test malformed and unknown items are refused"""
+        url = reverse('cart_api_add')
+        response = self.client.post(url,
+                                    'not json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.send('post', url, {
+                'type': 'voucher'
+            }).status_code, 400)
+        self.assertEqual(self.add_product(quantity=0).status_code, 400)
+        self.assertEqual(
+            self.send('post', url, {
+                'type': 'product',
+                'id': 0
+            }).status_code, 404)
+        self.assertEqual(
+            self.client.delete(self.item_url('product',
+                                             self.product.id)).status_code,
+            404)
+        self.assertEqual(self.client.post(reverse('cart_api')).status_code,
+                         405)
+
+    def test_invalid_ids(self):
+        """Test ids that aren't numbers are refused rather than erroring"""
+        url = reverse('cart_api_add')
+        for item_type in ('product', 'rental'):
+            for item_id in ('abc', [1], None):
+                response = self.send('post', url, {
+                    'type': item_type,
+                    'id': item_id,
+                    'check_in': self.check_in.isoformat(),
+                    'check_out': self.check_out.isoformat(),
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], "Invalid id")
+
+    def test_update_and_remove(self):
+        """Test setting quantities, with 0 and DELETE removing items"""
+        self.add_product()
+        self.add_rental()
+        url = self.item_url('product', self.product.id)
+
+        data = self.send('patch', url, {'quantity': 3}).json()
+        self.assertEqual(data['count'], 4)
+        response = self.send('patch', url, {'quantity': 4})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.send('patch', self.item_url('rental', self.crashpad.id), {
+                'quantity': 2
+            }).status_code, 400)
+
+        data = self.send('patch', url, {'quantity': 0}).json()
+        self.assertEqual(data['order_type'], 'RENTALS_ONLY')
+        data = self.client.delete(self.item_url('rental',
+                                                self.crashpad.id)).json()
+        self.assertEqual(data['count'], 0)
+
+    def test_update_queries(self):
+        """Test a quantity change needs no more than one request's queries"""
+        self.add_product()
+        url = self.item_url('product', self.product.id)
+        # The session, the product's stock, the cart's items for the
+        # response and the session save in its savepoint
+        with self.assertNumQueries(6):
+            self.send('patch', url, {'quantity': 2})
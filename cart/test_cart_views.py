@@ -308,6 +308,51 @@ class CartViewsTest(TestCase):
         self.assertEqual(items[0]['item'].id, self.product.id)
         self.assertEqual(items[0]['quantity'], 2)
 
+    def test_cart_summary(self):
+        """Test the cart summary pages load for their cart badge"""
+        url = reverse('cart_summary')
+
+        # An empty cart, with the CSRF cookie set for the page's forms
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'count': 0,
+            'items': [],
+            'total': '0.0'
+        })
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('csrftoken', response.cookies)
+
+        # A product and a rental
+        self.client.post(reverse('cart_add', args=['product']), {
+            'product_id': self.product.id,
+            'quantity': 2
+        })
+        self.client.post(reverse('cart_add', args=['rental']),
+                         json.dumps({
+                             'crashpad_ids': [self.crashpad.id],
+                             'check_in': self.check_in,
+                             'check_out': self.check_out
+                         }),
+                         content_type='application/json')
+        summary = self.client.get(url).json()
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual([item['name'] for item in summary['items']],
+                         ["Test Product", "Test Crashpad"])
+        self.assertEqual(summary['items'][0]['total_price'], '59.98')
+
+    def test_pages_do_not_load_cart(self):
+        """Test pages other than the cart leave it to the summary"""
+        self.client.post(reverse('cart_add', args=['product']), {
+            'product_id': self.product.id,
+            'quantity': 2
+        })
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('cart_item_count', response.context)
+        self.assertContains(response, reverse('cart_summary'))
+        self.assertIn('cart_item_count', self.client.get(
+            reverse('cart_detail')).context)
+
     def test_cart_update_quantities(self):
         """Test updating cart quantities"""
         print("\n--- Running test_cart_update_quantities ---")
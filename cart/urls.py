@@ -1,11 +1,17 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.cart_detail, name="cart_detail"),
+    path("summary/", views.cart_summary_json, name="cart_summary"),
     path("add/<str:item_type>/", views.cart_add, name="cart_add"),
     path("remove/<str:item_type>/<int:item_id>/",
          views.cart_remove,
          name="cart_remove"),
     path("update/", views.cart_update, name="cart_update"),
+    path("api/", api.cart_api, name="cart_api"),
+    path("api/items/", api.cart_api_add, name="cart_api_add"),
+    path("api/items/<str:item_type>/<int:item_id>/",
+         api.cart_api_item,
+         name="cart_api_item"),
 ]
@@ -4,8 +4,11 @@ from django.contrib import messages
 from shop.models import Product
 from rentals.models import Crashpad
 from .cart import Cart
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_GET, require_POST
 from django.http import JsonResponse
+from .contexts import cart_summary
 import json
 
 logger = logging.getLogger(__name__)
@@ -21,7 +24,10 @@ def cart_add(request, item_type):
             # Handle product addition
             product_id = int(request.POST.get('product_id'))
             quantity = int(request.POST.get('quantity', 1))
-            product = get_object_or_404(Product, id=product_id)
+            # Availability excludes stock held by other checkouts
+            product = get_object_or_404(
+                Product.objects.with_available_stock(cart.hold_reference),
+                id=product_id)
 
             # Check stock availability
             current_qty = cart.cart.get(f"product_{product_id}",
@@ -32,14 +38,15 @@ def cart_add(request, item_type):
                 logger.warning(
                     f'Product {product.name} has insufficient stock. '
                     f'User tried to add {quantity} units '
-                    f'(cart has {current_qty}) - stock: {product.stock}')
-                if product.stock == 0:
+                    f'(cart has {current_qty}) - '
+                    f'available: {product.available_quantity()}')
+                if product.available_quantity() == 0:
                     messages.error(request,
                                    f'Sorry, {product.name} is out of stock')
                 else:
                     messages.error(
-                        request,
-                        f'Sorry, only {product.stock} units available '
+                        request, 'Sorry, only '
+                        f'{product.available_quantity()} units available '
                         f'for {product.name} (you have {current_qty} in cart)')
                 return redirect('shop')
 
@@ -132,7 +139,23 @@ def cart_detail(request):
             if 'crashpad_id' in item and item['crashpad_id'] in crashpads:
                 item['crashpad'] = crashpads[item['crashpad_id']]
 
-    return render(request, "cart/cart_detail.html", {"cart": cart})
+    return render(request, "cart/cart_detail.html", {
+        "cart": cart,
+        **cart_summary(request)
+    })
+
+
+@require_GET
+@never_cache
+@ensure_csrf_cookie
+def cart_summary_json(request):
+    """
+    The cart badge and mini-cart contents, fetched by every page so the
+    pages themselves don't depend on the session and can be cached. Also
+    sets the CSRF cookie the pages' forms and scripts post with.
+    """
+    cart = Cart(request)
+    return JsonResponse({'count': len(cart), **cart.serialize()})
 
 
 @require_POST
@@ -163,10 +186,12 @@ def cart_update(request):
                     if new_qty > 0:
                         # Perform stock validation for products
                         if item_type == 'product':
-                            product = get_object_or_404(Product, id=item_id)
+                            # Annotated with its availability by the cart
+                            product = item['item']
                             if not product.has_stock(new_qty):
                                 messages.error(
-                                    request, f'Sorry, only {product.stock} '
+                                    request, 'Sorry, only '
+                                    f'{product.available_quantity()} '
                                     f'units available for {product.name}')
                                 update_successful = False
                                 continue
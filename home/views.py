@@ -1,5 +1,8 @@
 from django.shortcuts import render
+from bouldering_cy.http_caching import cache_policy
 
 
+# Static content, so only a deploy or the visitor changes it
+@cache_policy(max_age=300)
 def index(request):
     return render(request, 'home/index.html')
@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import ImageRendition
+
+
+@admin.register(ImageRendition)
+class ImageRenditionAdmin(admin.ModelAdmin):
+    list_display = ('source', 'status', 'attempts', 'width', 'updated_at')
+    list_filter = ('status', 'model_label')
+    search_fields = ('source', )
+    readonly_fields = ('source', 'model_label', 'field_name',
+                       'cache_namespace', 'status', 'attempts', 'last_error',
+                       'claimed_at', 'width', 'renditions', 'created_at',
+                       'updated_at')
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.update(status=ImageRendition.PENDING, attempts=0)
+        self.message_user(request, f"{updated} images were queued again.")
+
+    retry_jobs.short_description = "Queue selected images again"
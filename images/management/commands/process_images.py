@@ -0,0 +1,63 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from images.models import ImageRendition
+from images.renditions import enqueue_existing, process_pending
+
+
+class Command(BaseCommand):
+    help = ('Generate responsive renditions for uploaded images. Runs as a '
+            'long-lived worker polling for queued jobs, or drains the queue '
+            'once with --once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.IMAGE_PROCESSING_WORKERS,
+            help='Number of images processed at once (default: %(default)s)')
+        parser.add_argument('--once',
+                            action='store_true',
+                            help='Process the queued jobs and exit')
+        parser.add_argument('--sleep',
+                            type=float,
+                            default=5.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=100,
+                            help='Jobs taken from the queue at a time')
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Queue images uploaded before renditions were generated')
+        parser.add_argument('--retry-failed',
+                            action='store_true',
+                            help='Queue failed jobs again')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'] or 1, 1)
+
+        if options['backfill']:
+            seen = enqueue_existing()
+            self.stdout.write(f"Queued renditions for {seen} images")
+
+        if options['retry_failed']:
+            retried = ImageRendition.objects.filter(
+                status=ImageRendition.FAILED).update(
+                    status=ImageRendition.PENDING, attempts=0)
+            self.stdout.write(f"Retrying {retried} failed jobs")
+
+        while True:
+            results = process_pending(workers=workers,
+                                      limit=options['batch_size'])
+            if results:
+                summary = ', '.join(f"{count} {status}"
+                                    for status, count in results.items())
+                self.stdout.write(f"Processed jobs: {summary}")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS("Image queue is empty"))
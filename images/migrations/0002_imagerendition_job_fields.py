@@ -0,0 +1,55 @@
+# Generated by Django 4.2.18 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+def mark_existing_done(apps, schema_editor):
+    """Renditions generated before the queue existed are complete."""
+    ImageRendition = apps.get_model('images', 'ImageRendition')
+    ImageRendition.objects.filter(width__gt=0).update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagerendition',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='cache_namespace',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='field_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='model_label',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='imagerendition',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
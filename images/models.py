@@ -0,0 +1,45 @@
+from django.db import models
+
+
+class ImageRendition(models.Model):
+    """
+    The resized webp copies generated for an uploaded image, stored next
+    to the original in the same storage.
+
+    Rows are created as pending jobs when an image is uploaded and filled
+    in by the `process_images` worker.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Storage name of the original image
+    source = models.CharField(max_length=255, unique=True)
+    # Where the image came from, to find its storage, e.g. shop.Product.image
+    model_label = models.CharField(max_length=100, blank=True)
+    field_name = models.CharField(max_length=100, blank=True)
+    # Cache namespace to bump once the renditions exist
+    cache_namespace = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20,
+                              choices=STATUS_CHOICES,
+                              default=PENDING,
+                              db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Pixel width of the original
+    width = models.PositiveIntegerField(default=0)
+    # {"640": "products/foo_640.webp", ...}
+    renditions = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Renditions of {self.source}"
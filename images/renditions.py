@@ -0,0 +1,311 @@
+"""
+Responsive image renditions.
+
+Uploaded images are resized to each width in IMAGE_RENDITION_WIDTHS that
+is smaller than the original, saved as webp next to it (e.g.
+`products/guide.jpg` -> `products/guide_640.webp`) and recorded in
+ImageRendition. Templates use the `srcset` tag to offer them to browsers.
+
+Saving a tracked model only queues a pending ImageRendition; the
+`process_images` worker command does the resizing and uploading, so admin
+saves never wait on Pillow or S3. Until a job is done templates fall back
+to the original image.
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+from bouldering_cy.caching import bump_version
+from .models import ImageRendition
+
+logger = logging.getLogger(__name__)
+
+# (model, field names, cache namespace) registered with track_images
+TRACKED = []
+
+
+def _cache_key(source):
+    return f"image-renditions:{source}"
+
+
+def rendition_name(source, width):
+    """Storage name of the `width` rendition of `source`."""
+    stem, _ = os.path.splitext(source)
+    return f"{stem}_{width}.webp"
+
+
+def _prepare(image):
+    """Apply EXIF rotation and convert to a mode webp can store."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def _encode(image, width):
+    """
+    Resize `image` to `width` and return it as a webp file. The file is
+    spooled to disk once large so a full gallery doesn't sit in memory,
+    and is streamed to the storage by its save().
+    """
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    resized.save(spooled,
+                 format='WEBP',
+                 quality=settings.IMAGE_RENDITION_QUALITY,
+                 method=4)
+    spooled.seek(0)
+    return spooled
+
+
+def generate_renditions(storage, source):
+    """
+    Create the webp width ladder for `source` in `storage`.
+    Returns (original width, {width: name}).
+
+    Rendition names are fixed, and any existing file is replaced, so
+    running this again after a failure is safe.
+    """
+    with storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = _prepare(image)
+
+    renditions = {}
+    for width in sorted(settings.IMAGE_RENDITION_WIDTHS):
+        # Never upscale
+        if width >= image.width:
+            break
+        name = rendition_name(source, width)
+        # Replace rather than let the storage pick a new name
+        if storage.exists(name):
+            storage.delete(name)
+        with _encode(image, width) as content:
+            renditions[str(width)] = storage.save(name, File(content))
+    return image.width, renditions
+
+
+def get_renditions(source):
+    """
+    Return (original width, {width: name}) for `source`, or None if its
+    renditions are not ready yet. Cached, so templates listing many images
+    don't query for each one.
+    """
+    if not source:
+        return None
+    key = _cache_key(source)
+    found = cache.get(key)
+    if found is None:
+        rendition = ImageRendition.objects.filter(
+            source=source, status=ImageRendition.DONE).values_list(
+                'width', 'renditions').first()
+        # Cache misses too, as an empty tuple
+        found = tuple(rendition) if rendition else ()
+        cache.set(key, found, settings.CACHE_NAMESPACE_TIMEOUT)
+    return found or None
+
+
+def build_srcset(field_file):
+    """
+    Return the srcset value for an image, or '' until its renditions exist
+    so callers fall back to the original.
+    """
+    if not field_file:
+        return ''
+    found = get_renditions(field_file.name)
+    if not found:
+        return ''
+    width, renditions = found
+    storage = field_file.storage
+    candidates = [
+        f"{storage.url(name)} {size}w"
+        for size, name in sorted(renditions.items(), key=lambda r: int(r[0]))
+    ]
+    if width:
+        candidates.append(f"{field_file.url} {width}w")
+    return ', '.join(candidates)
+
+
+def enqueue_images(instance, field_names, namespace=''):
+    """
+    Queue rendition jobs for the instance's images, in one insert.
+    Images that already have a job are left alone.
+    """
+    label = instance._meta.label
+    jobs = [
+        ImageRendition(source=field_file.name,
+                       model_label=label,
+                       field_name=field_name,
+                       cache_namespace=namespace or '')
+        for field_name in field_names
+        for field_file in [getattr(instance, field_name)]
+        if field_file and field_file.name
+    ]
+    if jobs:
+        ImageRendition.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+def enqueue_existing(batch_size=500):
+    """
+    Queue jobs for every tracked image uploaded before the pipeline.
+    Returns the number of images seen, queued or already queued.
+    """
+    queued = 0
+    for model, field_names, namespace in TRACKED:
+        for field_name in field_names:
+            names = model.objects.exclude(
+                Q(**{f"{field_name}__isnull": True})
+                | Q(**{field_name: ''})).values_list(
+                    field_name, flat=True).iterator(chunk_size=batch_size)
+            batch = []
+            for name in names:
+                batch.append(
+                    ImageRendition(source=name,
+                                   model_label=model._meta.label,
+                                   field_name=field_name,
+                                   cache_namespace=namespace or ''))
+                if len(batch) >= batch_size:
+                    queued += len(
+                        ImageRendition.objects.bulk_create(
+                            batch, ignore_conflicts=True))
+                    batch = []
+            if batch:
+                queued += len(
+                    ImageRendition.objects.bulk_create(batch,
+                                                       ignore_conflicts=True))
+    return queued
+
+
+def claimable_jobs():
+    """
+    Jobs a worker may take: pending ones, and ones stuck processing
+    because their worker died.
+    """
+    stale = timezone.now() - timedelta(
+        seconds=settings.IMAGE_PROCESSING_TIMEOUT)
+    return ImageRendition.objects.filter(
+        Q(status=ImageRendition.PENDING)
+        | Q(status=ImageRendition.PROCESSING, claimed_at__lt=stale))
+
+
+def claim(job_id):
+    """
+    Atomically take a job. The conditional UPDATE only matches while the
+    job is still claimable, so two workers can never both win it.
+    """
+    return claimable_jobs().filter(pk=job_id).update(
+        status=ImageRendition.PROCESSING,
+        attempts=F('attempts') + 1,
+        claimed_at=timezone.now()) == 1
+
+
+def _get_storage(job):
+    """The storage of the field the image was uploaded through."""
+    try:
+        model = apps.get_model(job.model_label)
+        return model._meta.get_field(job.field_name).storage
+    except (LookupError, ValueError, FieldDoesNotExist):
+        return default_storage
+
+
+def process_job(job_id):
+    """
+    Claim and process one job. Failures are recorded on the job and
+    retried until IMAGE_PROCESSING_MAX_ATTEMPTS is reached.
+    Returns the job's final status, or None if another worker has it.
+    """
+    if not claim(job_id):
+        return None
+    job = ImageRendition.objects.get(pk=job_id)
+    try:
+        width, renditions = generate_renditions(_get_storage(job),
+                                                job.source)
+    except Exception as e:
+        logger.error(f"Could not generate renditions of {job.source} "
+                     f"(attempt {job.attempts}): {e}")
+        status = (ImageRendition.FAILED
+                  if job.attempts >= settings.IMAGE_PROCESSING_MAX_ATTEMPTS
+                  else ImageRendition.PENDING)
+        ImageRendition.objects.filter(pk=job_id).update(
+            status=status,
+            last_error=str(e)[:1000],
+            claimed_at=None,
+            updated_at=timezone.now())
+        return status
+
+    ImageRendition.objects.filter(pk=job_id).update(
+        status=ImageRendition.DONE,
+        width=width,
+        renditions=renditions,
+        last_error='',
+        claimed_at=None,
+        updated_at=timezone.now())
+    cache.delete(_cache_key(job.source))
+    # Cached pages rendered before the renditions existed
+    if job.cache_namespace:
+        bump_version(job.cache_namespace)
+    logger.info(f"Generated {len(renditions)} renditions of {job.source}")
+    return ImageRendition.DONE
+
+
+def _process_in_thread(job_id):
+    try:
+        return process_job(job_id)
+    finally:
+        # Worker threads hold their own database connection
+        connection.close()
+
+
+def process_pending(workers=None, limit=None):
+    """
+    Process claimable jobs, oldest first, on a pool of `workers` threads
+    (inline when workers is 1). Returns {status: count} for the jobs this
+    call processed.
+    """
+    if workers is None:
+        workers = settings.IMAGE_PROCESSING_WORKERS
+    job_ids = list(
+        claimable_jobs().order_by('id').values_list('id', flat=True)[:limit])
+    if workers <= 1:
+        statuses = [process_job(job_id) for job_id in job_ids]
+    else:
+        # Each job holds one decoded image, so the pool size bounds memory
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix='image-worker') as pool:
+            statuses = list(pool.map(_process_in_thread, job_ids))
+
+    results = {}
+    for status in statuses:
+        if status:
+            results[status] = results.get(status, 0) + 1
+    return results
+
+
+def track_images(model, *field_names, namespace=None):
+    """
+    Queue renditions for `model`'s image fields whenever it is saved with
+    a new image. `namespace` is the cache namespace to bump once they
+    exist.
+    """
+    TRACKED.append((model, field_names, namespace))
+
+    def on_save(sender, instance, **kwargs):
+        enqueue_images(instance, field_names, namespace)
+
+    post_save.connect(on_save,
+                      sender=model,
+                      weak=False,
+                      dispatch_uid=f"image-renditions:{model._meta.label}")
@@ -0,0 +1,18 @@
+from django import template
+from django.utils.html import format_html
+from images.renditions import build_srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(image, sizes='100vw'):
+    """
+    Render srcset and sizes attributes for an uploaded image, e.g.
+    <img src="{{ product.image.url }}" {% srcset product.image %}>
+    Renders nothing until the image's renditions exist.
+    """
+    value = build_srcset(image)
+    if not value:
+        return ''
+    return format_html('srcset="{}" sizes="{}"', value, sizes)
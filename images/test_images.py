@@ -0,0 +1,195 @@
+import io
+from io import StringIO
+import shutil
+import tempfile
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from model_bakery import baker
+from PIL import Image
+from shop.models import Product
+from .models import ImageRendition
+from .renditions import (generate_renditions, build_srcset, rendition_name,
+                         get_renditions, process_pending, claim,
+                         enqueue_existing)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(width=1500, height=1000, format='JPEG', mode='RGB',
+               color='red'):
+    """Return an in-memory image file of the given size."""
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   IMAGE_RENDITION_WIDTHS=(640, 1024, 1440, 1920))
+class ImageRenditionTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def make_product(self, content, name='guide.jpg', process=True):
+        product = baker.make(Product,
+                             price=Decimal('10.00'),
+                             image=SimpleUploadedFile(name, content),
+                             _fill_optional=False)
+        if process:
+            process_pending(workers=1)
+        return product
+
+    def test_upload_generates_width_ladder(self):
+        """Test saving an upload creates webp renditions below its width"""
+        product = self.make_product(make_image(1500, 1000))
+
+        rendition = ImageRendition.objects.get(source=product.image.name)
+        self.assertEqual(rendition.width, 1500)
+        self.assertEqual(sorted(rendition.renditions, key=int),
+                         ['640', '1024', '1440'])
+
+        storage = product.image.storage
+        name = rendition.renditions['640']
+        self.assertEqual(name, rendition_name(product.image.name, 640))
+        with storage.open(name) as f:
+            image = Image.open(f)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (640, 427))
+
+    def test_small_image_is_not_upscaled(self):
+        """Test images narrower than the ladder get no renditions"""
+        product = self.make_product(make_image(500, 500))
+        rendition = ImageRendition.objects.get(source=product.image.name)
+        self.assertEqual(rendition.renditions, {})
+
+    def test_transparent_png(self):
+        """Test transparency survives the conversion"""
+        product = self.make_product(
+            make_image(800, 400, format='PNG', mode='RGBA',
+                       color=(255, 0, 0, 0)), name='logo.png')
+        rendition = ImageRendition.objects.get(source=product.image.name)
+        with product.image.storage.open(rendition.renditions['640']) as f:
+            self.assertEqual(Image.open(f).mode, 'RGBA')
+
+    def test_regenerating_keeps_names(self):
+        """Test reprocessing replaces renditions instead of renaming"""
+        product = self.make_product(make_image(1100, 600))
+        first = ImageRendition.objects.get(source=product.image.name)
+        _, renditions = generate_renditions(product.image.storage,
+                                            product.image.name)
+        self.assertEqual(first.renditions, renditions)
+
+    def test_bad_upload_is_retried_then_failed(self):
+        """Test an unreadable image is retried and then marked failed"""
+        product = self.make_product(b'not an image', name='broken.jpg')
+        self.assertTrue(Product.objects.filter(pk=product.pk).exists())
+
+        job = ImageRendition.objects.get(source=product.image.name)
+        self.assertEqual(job.status, ImageRendition.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.last_error)
+
+        # Keeps being retried until it runs out of attempts
+        process_pending(workers=1)
+        process_pending(workers=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageRendition.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(process_pending(workers=1), {})
+        self.assertEqual(build_srcset(product.image), '')
+
+    def test_save_queues_job_without_processing(self):
+        """Test saving only queues the job and the original is used"""
+        product = self.make_product(make_image(1100, 600), process=False)
+
+        job = ImageRendition.objects.get(source=product.image.name)
+        self.assertEqual(job.status, ImageRendition.PENDING)
+        self.assertEqual(job.model_label, 'shop.Product')
+        self.assertEqual(job.cache_namespace, 'catalogue')
+        self.assertEqual(build_srcset(product.image), '')
+
+        process_pending(workers=1)
+        self.assertIn('640w', build_srcset(product.image))
+
+    def test_resaving_does_not_requeue(self):
+        """Test saving again without a new image keeps the finished job"""
+        product = self.make_product(make_image(700, 700))
+        product.name = 'Renamed'
+        product.save()
+        job = ImageRendition.objects.get(source=product.image.name)
+        self.assertEqual(job.status, ImageRendition.DONE)
+
+    def test_claim_is_exclusive(self):
+        """Test only one worker can claim a job"""
+        product = self.make_product(make_image(700, 700), process=False)
+        job = ImageRendition.objects.get(source=product.image.name)
+        self.assertTrue(claim(job.pk))
+        self.assertFalse(claim(job.pk))
+
+    def test_stale_claims_are_retaken(self):
+        """Test jobs left processing by a dead worker are picked up"""
+        product = self.make_product(make_image(700, 700), process=False)
+        job = ImageRendition.objects.get(source=product.image.name)
+        self.assertTrue(claim(job.pk))
+
+        with self.settings(IMAGE_PROCESSING_TIMEOUT=-1):
+            self.assertEqual(process_pending(workers=1),
+                             {ImageRendition.DONE: 1})
+
+    def test_process_images_command(self):
+        """Test the worker command drains the queue and backfills"""
+        product = self.make_product(make_image(700, 700), process=False)
+        # An image uploaded before the pipeline existed
+        ImageRendition.objects.all().delete()
+
+        out = StringIO()
+        call_command('process_images',
+                     '--once',
+                     '--backfill',
+                     '--workers=1',
+                     stdout=out)
+        self.assertIn('Processed jobs: 1 done', out.getvalue())
+        self.assertEqual(
+            ImageRendition.objects.get(source=product.image.name).status,
+            ImageRendition.DONE)
+        self.assertEqual(enqueue_existing(), 1)
+
+    def test_srcset_tag(self):
+        """Test the tag lists renditions and the original by width"""
+        product = self.make_product(make_image(1100, 600))
+        rendered = Template(
+            '{% load image_tags %}{% srcset image sizes="50vw" %}').render(
+                Context({'image': product.image}))
+
+        url = product.image.storage.url
+        self.assertIn(f'{url(rendition_name(product.image.name, 640))} 640w',
+                      rendered)
+        self.assertIn(f'{product.image.url} 1100w', rendered)
+        self.assertIn('sizes="50vw"', rendered)
+
+    def test_srcset_falls_back_without_renditions(self):
+        """Test nothing is rendered for images without renditions"""
+        product = baker.make(Product, price=Decimal('10.00'),
+                             _fill_optional=False)
+        product.image.name = 'products/missing.jpg'
+        self.assertEqual(build_srcset(product.image), '')
+        self.assertEqual(build_srcset(None), '')
+
+    def test_lookups_are_cached(self):
+        """Test repeated lookups don't query the database"""
+        product = self.make_product(make_image(700, 700))
+        get_renditions(product.image.name)
+        get_renditions('products/unknown.jpg')
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(get_renditions(product.image.name))
+            # Misses are cached too
+            self.assertIsNone(get_renditions('products/unknown.jpg'))
@@ -1,9 +1,9 @@
 from django.contrib import admin
 from django.contrib import messages
-from django.utils import timezone
 from django.utils.html import format_html
 from django_summernote.admin import SummernoteModelAdmin
-from .models import NewsletterSubscriber, NewsletterMail
+from .models import (NewsletterSubscriber, NewsletterMail, NewsletterEvent,
+                     NewsletterStats, WelcomeEmail)
 from .sendgrid_utils import send_newsletter_email
 
 
@@ -48,6 +48,36 @@ class NewsletterSubscriberAdmin(admin.ModelAdmin):
     activate_subscribers.short_description = "Activate selected subscribers"
 
 
+@admin.register(WelcomeEmail)
+class WelcomeEmailAdmin(admin.ModelAdmin):
+    list_display = ('subscriber', 'status', 'attempts', 'created_at',
+                    'updated_at')
+    list_filter = ('status', )
+    search_fields = ('subscriber__user__email', )
+    readonly_fields = ('subscriber', 'status', 'attempts', 'last_error',
+                       'claimed_at', 'created_at', 'updated_at')
+    actions = ['retry_emails']
+
+    def retry_emails(self, request, queryset):
+        updated = queryset.update(status=WelcomeEmail.PENDING, attempts=0)
+        self.message_user(
+            request, f"{updated} welcome emails were queued again. They are "
+            "sent with the next subscription or send_welcome_emails run.")
+
+    retry_emails.short_description = "Queue selected welcome emails again"
+
+
+class NewsletterStatsInline(admin.StackedInline):
+    model = NewsletterStats
+    can_delete = False
+    readonly_fields = ('processed', 'delivered', 'opened', 'clicked',
+                       'bounced', 'dropped', 'deferred', 'spam_reports',
+                       'unsubscribed', 'updated_at')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(NewsletterMail)
 class NewsletterMailAdmin(SummernoteModelAdmin):
     list_display = ('subject', 'created_at', 'sent_at')
@@ -55,6 +85,7 @@ class NewsletterMailAdmin(SummernoteModelAdmin):
     summernote_fields = ('html_content', )
     search_fields = ('subject', )
     readonly_fields = ('sent_at', 'template_variables_help')
+    inlines = [NewsletterStatsInline]
     actions = ['send_newsletter', 'send_test_newsletter']
 
     def template_variables_help(self, obj):
@@ -91,16 +122,25 @@ class NewsletterMailAdmin(SummernoteModelAdmin):
                               level=messages.WARNING)
             return
 
-        success = send_newsletter_email(newsletter, subscribers)
+        subscriber_count = subscribers.count()
+        result = send_newsletter_email(newsletter, subscribers)
 
-        if success:
-            newsletter.sent_at = timezone.now()
-            newsletter.save()
-            newsletter.sent_to.add(*subscribers)
+        # Only the subscribers it was sent to are recorded
+        if result.subscriber_ids:
+            newsletter.record_delivery(result.subscriber_ids)
+
+        if result:
             self.message_user(
                 request,
                 f"Newsletter '{newsletter.subject}' was successfully sent to "
-                f"{subscribers.count()} subscribers.")
+                f"{result.sent} subscribers.")
+        elif result.sent:
+            self.message_user(
+                request,
+                f"Newsletter '{newsletter.subject}' was sent to "
+                f"{result.sent} of {subscriber_count} subscribers, "
+                f"{result.failed} failed. Please check the logs.",
+                level=messages.WARNING)
         else:
             self.message_user(
                 request,
@@ -151,3 +191,18 @@ class NewsletterMailAdmin(SummernoteModelAdmin):
                 level=messages.ERROR)
 
     send_test_newsletter.short_description = "Send test newsletter to yourself"
+
+
+@admin.register(NewsletterEvent)
+class NewsletterEventAdmin(admin.ModelAdmin):
+    list_display = ('event', 'email', 'newsletter', 'bounce_type',
+                    'timestamp')
+    list_filter = ('event', 'timestamp')
+    list_select_related = ('newsletter', )
+    search_fields = ('email', 'sg_message_id')
+    readonly_fields = ('newsletter', 'sg_event_id', 'sg_message_id', 'event',
+                       'email', 'reason', 'bounce_type', 'timestamp',
+                       'created_at')
+
+    def has_add_permission(self, request):
+        return False
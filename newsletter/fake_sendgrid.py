@@ -0,0 +1,122 @@
+"""
+A local stand-in for the SendGrid v3 mail send API.
+
+Used to load-test newsletter delivery without sending real emails. Point
+`SendGridAPIClient` at it by setting SENDGRID_API_HOST to its url.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .throttling import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAIL_SEND_PATH = '/v3/mail/send'
+
+
+class FakeSendGridHandler(BaseHTTPRequestHandler):
+    """Answer mail send requests the way SendGrid would."""
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+
+        if self.path != MAIL_SEND_PATH:
+            self._respond(404, {'errors': [{'message': 'Not found'}]})
+            return
+
+        # Simulate the provider's response time
+        if server.latency:
+            time.sleep(server.latency)
+
+        if not server.limiter.try_acquire():
+            server.record('rate_limited')
+            self._respond(429, {'errors': [{'message': 'Too many requests'}]},
+                          headers={'Retry-After': str(server.retry_after)})
+        elif server.random.random() < server.error_rate:
+            server.record('errors')
+            self._respond(500, {'errors': [{'message': 'Internal error'}]})
+        else:
+            server.record('accepted', payload=body)
+            self._respond(202)
+
+    def _respond(self, status, data=None, headers=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load
+        logger.debug(format, *args)
+
+
+class FakeSendGridServer(ThreadingHTTPServer):
+    """
+    Threaded fake SendGrid server.
+
+    Args:
+        address (tuple): (host, port) to bind. Port 0 picks a free port.
+        latency (float): Seconds to wait before answering each request.
+        error_rate (float): Fraction of requests answered with a 500.
+        rate_limit (float, optional): Requests per second accepted before
+            answering with 429 Too Many Requests. None disables the limit.
+        retry_after (float): Retry-After value sent with 429 responses.
+        seed (int, optional): Seed for the error rate's random generator.
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 address=('127.0.0.1', 0),
+                 latency=0.0,
+                 error_rate=0.0,
+                 rate_limit=None,
+                 retry_after=0.1,
+                 seed=None):
+        super().__init__(address, FakeSendGridHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.limiter = TokenBucket(rate_limit)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'accepted': 0, 'errors': 0, 'rate_limited': 0}
+            self.last_payload = None
+
+    def record(self, outcome, payload=None):
+        with self._lock:
+            self.stats[outcome] += 1
+            if payload is not None:
+                self.last_payload = payload
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name='fake-sendgrid',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
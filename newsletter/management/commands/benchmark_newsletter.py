@@ -0,0 +1,210 @@
+import logging
+import time
+import tracemalloc
+from itertools import islice
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from newsletter.fake_sendgrid import FakeSendGridServer
+from newsletter.models import NewsletterSubscriber, NewsletterMail
+from newsletter.sendgrid_utils import send_newsletter_email, \
+    stream_subscribers
+
+User = get_user_model()
+
+SEED_PREFIX = 'newsletter-bench-'
+MODES = ('current', 'batched', 'concurrent')
+
+
+def batches(iterable, size):
+    """Split an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark newsletter delivery against a local fake SendGrid '
+            'service. Seeds N subscribers inside a transaction that is '
+            'rolled back afterwards, then reports sends/sec, batch latency '
+            'and peak memory for each send mode:\n'
+            '  current    - subscribers loaded into a list, users fetched '
+            'per row, one sender\n'
+            '  batched    - subscribers streamed in chunks, one sender\n'
+            '  concurrent - subscribers streamed in chunks, a pool of '
+            '--workers senders')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000)
+        parser.add_argument('--modes',
+                            type=str,
+                            default=','.join(MODES),
+                            help='Comma separated modes to run')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--rate',
+                            type=float,
+                            default=None,
+                            help='Client side send rate limit (sends/sec)')
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=500,
+                            help='Recipients per timed batch')
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            default=2000,
+                            help='Subscribers fetched per query')
+        parser.add_argument('--latency', type=float, default=0.02)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--rate-limit',
+                            type=float,
+                            default=None,
+                            help='Fake server sends/sec before 429s')
+        parser.add_argument(
+            '--sendgrid-host',
+            type=str,
+            default=None,
+            help='Use an already running fake SendGrid instead of starting '
+            'one in-process')
+        parser.add_argument('--keep',
+                            action='store_true',
+                            help='Keep the seeded subscribers')
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(unknown)}")
+
+        server = None
+        host = options['sendgrid_host']
+        if not host:
+            server = FakeSendGridServer(latency=options['latency'],
+                                        error_rate=options['error_rate'],
+                                        rate_limit=options['rate_limit'],
+                                        seed=0).start()
+            host = server.url
+        self.stdout.write(f"Using SendGrid stand-in at {host}")
+
+        # Per-recipient info logging would dominate the timings
+        send_logger = logging.getLogger('newsletter.sendgrid_utils')
+        previous_level = send_logger.level
+        send_logger.setLevel(logging.WARNING)
+
+        try:
+            with override_settings(SENDGRID_API_HOST=host,
+                                   EMAIL_HOST_PASSWORD='SG.benchmark'), \
+                    transaction.atomic():
+                self.seed(options['subscribers'])
+                newsletter = NewsletterMail.objects.create(
+                    subject='Benchmark newsletter',
+                    html_content='<p>Hello {{ first_name }}!</p>'
+                    '<a href="{{ unsubscribe_url }}">Unsubscribe</a>')
+
+                results = [
+                    self.run_mode(mode, newsletter, server, options)
+                    for mode in modes
+                ]
+
+                if not options['keep']:
+                    transaction.set_rollback(True)
+        finally:
+            send_logger.setLevel(previous_level)
+            if server:
+                server.stop()
+
+        self.report(results)
+
+    def seed(self, count):
+        """Bulk create `count` users with active subscriptions."""
+        self.stdout.write(f"Seeding {count} subscribers...")
+        for batch in batches(range(count), 1000):
+            User.objects.bulk_create([
+                User(username=f"{SEED_PREFIX}{i}",
+                     email=f"bench{i}@example.test",
+                     first_name='Bench',
+                     last_name=str(i),
+                     password='!') for i in batch
+            ])
+        user_ids = User.objects.filter(
+            username__startswith=SEED_PREFIX).values_list(
+                'id', flat=True).iterator(chunk_size=1000)
+        for batch in batches(user_ids, 1000):
+            NewsletterSubscriber.objects.bulk_create([
+                NewsletterSubscriber(user_id=user_id, is_active=True)
+                for user_id in batch
+            ])
+
+    def run_mode(self, mode, newsletter, server, options):
+        """Send the newsletter to every seeded subscriber using `mode`."""
+        self.stdout.write(f"Running {mode}...")
+        subscribers = NewsletterSubscriber.objects.filter(
+            is_active=True, user__username__startswith=SEED_PREFIX)
+        workers = options['workers'] if mode == 'concurrent' else 1
+        if server:
+            server.reset_stats()
+
+        latencies = []
+        sends = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        if mode == 'current':
+            recipients = list(subscribers)
+        else:
+            recipients = stream_subscribers(subscribers,
+                                            options['chunk_size'])
+
+        for batch in batches(recipients, options['batch_size']):
+            batch_start = time.perf_counter()
+            send_newsletter_email(newsletter,
+                                  batch,
+                                  workers=workers,
+                                  rate=options['rate'])
+            latencies.append(time.perf_counter() - batch_start)
+            sends += len(batch)
+
+        elapsed = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'mode': mode,
+            'workers': workers,
+            'sends': sends,
+            'stats': dict(server.stats) if server else {},
+            'elapsed': elapsed,
+            'sends_per_sec': sends / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'peak_mb': peak_memory / (1024 * 1024),
+        }
+
+    def report(self, results):
+        header = (f"{'mode':<11}{'workers':>8}{'sends':>8}{'accepted':>10}"
+                  f"{'errors':>8}{'429s':>7}{'secs':>8}{'sends/s':>9}"
+                  f"{'p50 ms':>9}{'p99 ms':>9}{'peak MB':>9}")
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            stats = r['stats']
+            self.stdout.write(
+                f"{r['mode']:<11}{r['workers']:>8}{r['sends']:>8}"
+                f"{stats.get('accepted', '-'):>10}"
+                f"{stats.get('errors', '-'):>8}"
+                f"{stats.get('rate_limited', '-'):>7}"
+                f"{r['elapsed']:>8.2f}{r['sends_per_sec']:>9.1f}"
+                f"{r['p50'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}"
+                f"{r['peak_mb']:>9.2f}")
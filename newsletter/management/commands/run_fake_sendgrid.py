@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from newsletter.fake_sendgrid import FakeSendGridServer
+
+
+class Command(BaseCommand):
+    help = ('Run a local fake SendGrid API for load testing newsletter '
+            'delivery. Set SENDGRID_API_HOST to the printed url.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency',
+                            type=float,
+                            default=0.05,
+                            help='Seconds to wait before each response')
+        parser.add_argument('--error-rate',
+                            type=float,
+                            default=0.0,
+                            help='Fraction of sends answered with a 500')
+        parser.add_argument(
+            '--rate-limit',
+            type=float,
+            default=None,
+            help='Sends per second accepted before answering with 429')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeSendGridServer(address=(options['host'],
+                                             options['port']),
+                                    latency=options['latency'],
+                                    error_rate=options['error_rate'],
+                                    rate_limit=options['rate_limit'],
+                                    seed=options['seed'])
+        self.stdout.write(
+            self.style.SUCCESS(f"Fake SendGrid listening on {server.url}"))
+        self.stdout.write(f"Run with SENDGRID_API_HOST={server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {server.stats}")
@@ -1,5 +1,5 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 from newsletter.models import NewsletterSubscriber, NewsletterMail
 from newsletter.sendgrid_utils import send_newsletter_email
 
@@ -19,10 +19,24 @@ class Command(BaseCommand):
             type=str,
             help='Send a test email to this address instead of all subscribers'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.NEWSLETTER_SEND_WORKERS,
+            help='Number of concurrent sending threads (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.NEWSLETTER_SEND_RATE,
+            help='Maximum sends per second across all workers '
+            '(default: unlimited)')
 
     def handle(self, *args, **options):
         newsletter_id = options.get('newsletter_id')
         test_email = options.get('test_email')
+        workers = max(options.get('workers') or 1, 1)
+        rate = options.get('rate')
 
         try:
             newsletter = NewsletterMail.objects.get(id=newsletter_id)
@@ -44,9 +58,11 @@ class Command(BaseCommand):
                 'email': test_email
             }
 
-            success = send_newsletter_email(newsletter,
-                                            recipient_list,
-                                            context=context)
+            result = send_newsletter_email(newsletter,
+                                           recipient_list,
+                                           context=context,
+                                           workers=workers,
+                                           rate=rate)
         else:
             subscribers = NewsletterSubscriber.objects.filter(is_active=True)
             subscriber_count = subscribers.count()
@@ -57,25 +73,33 @@ class Command(BaseCommand):
                 return
 
             self.stdout.write(
-                f"Sending newsletter to {subscriber_count} subscribers")
+                f"Sending newsletter to {subscriber_count} subscribers "
+                f"using {workers} worker(s)"
+                + (f" at up to {rate:g} sends/sec" if rate else ""))
 
-            success = send_newsletter_email(newsletter, subscribers)
+            result = send_newsletter_email(newsletter,
+                                           subscribers,
+                                           workers=workers,
+                                           rate=rate)
 
         # Update the newsletter record if using a database newsletter
-        if success and not test_email:
-            # Get the list of subscribers who received the newsletter
-            subscribers = NewsletterSubscriber.objects.filter(is_active=True)
-            newsletter.sent_at = timezone.now()
-            newsletter.save()
-
-            # Add subscribers to the sent_to field
-            newsletter.sent_to.add(*subscribers)
+        if result.subscriber_ids and not test_email:
+            # Record the send and the subscribers who received it
+            newsletter.record_delivery(result.subscriber_ids)
 
+        if result and not test_email:
             self.stdout.write(
                 self.style.SUCCESS(
                     f"Newsletter '{newsletter.subject}' sent successfully and "
                     "updated in database!"))
-        elif success:
+        elif result.sent and not test_email:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Newsletter '{newsletter.subject}' sent to "
+                    f"{result.sent} of {subscriber_count} subscribers, "
+                    f"{result.failed} failed. Only those sent to were "
+                    "recorded."))
+        elif result:
             self.stdout.write(
                 self.style.SUCCESS("Newsletter sent successfully!"))
         else:
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from newsletter.models import WelcomeEmail
+from newsletter.sendgrid_utils import send_queued_welcome_emails
+
+
+class Command(BaseCommand):
+    help = ('Send the queued welcome emails, including any left behind by '
+            'a process that restarted before sending them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed',
+                            action='store_true',
+                            help='Queue failed welcome emails again')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = WelcomeEmail.objects.filter(
+                status=WelcomeEmail.FAILED).update(
+                    status=WelcomeEmail.PENDING, attempts=0)
+            self.stdout.write(f"Retrying {retried} failed welcome emails")
+
+        results = send_queued_welcome_emails()
+        summary = ', '.join(f"{count} {status}"
+                            for status, count in results.items())
+        self.stdout.write(
+            self.style.SUCCESS(f"Welcome emails: {summary or 'none queued'}"))
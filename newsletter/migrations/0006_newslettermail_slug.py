@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def set_welcome_slug(apps, schema_editor):
+    """The welcome email used to be looked up as the mail with id 1."""
+    NewsletterMail = apps.get_model('newsletter', 'NewsletterMail')
+    NewsletterMail.objects.filter(id=1, slug__isnull=True).update(
+        slug='welcome')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0005_alter_newslettermail_html_content_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newslettermail',
+            name='slug',
+            field=models.SlugField(blank=True, help_text="Identifies system emails, e.g. 'welcome' for the email sent to new subscribers.", max_length=100, null=True, unique=True),
+        ),
+        migrations.RunPython(set_welcome_slug, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.18 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0006_newslettermail_slug'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(default=0)),
+                ('opened', models.PositiveIntegerField(default=0)),
+                ('clicked', models.PositiveIntegerField(default=0)),
+                ('bounced', models.PositiveIntegerField(default=0)),
+                ('dropped', models.PositiveIntegerField(default=0)),
+                ('deferred', models.PositiveIntegerField(default=0)),
+                ('spam_reports', models.PositiveIntegerField(default=0)),
+                ('unsubscribed', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('newsletter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='newsletter.newslettermail')),
+            ],
+            options={
+                'verbose_name_plural': 'Newsletter stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='NewsletterEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sg_event_id', models.CharField(max_length=100, unique=True)),
+                ('sg_message_id', models.CharField(blank=True, max_length=255)),
+                ('event', models.CharField(db_index=True, max_length=30)),
+                ('email', models.EmailField(max_length=254)),
+                ('reason', models.TextField(blank=True)),
+                ('bounce_type', models.CharField(blank=True, max_length=20)),
+                ('timestamp', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('newsletter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='newsletter.newslettermail')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+    ]
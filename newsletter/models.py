@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.template import Template, Context
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -33,8 +34,52 @@ class NewsletterSubscriber(models.Model):
         return self.user.last_name
 
 
+class WelcomeEmail(models.Model):
+    """
+    A welcome email queued for a new subscriber. Kept until it is sent, so
+    emails queued by a process that restarted before sending them are
+    picked up by the next run (see `send_queued_welcome_emails`).
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subscriber = models.ForeignKey(NewsletterSubscriber,
+                                   on_delete=models.CASCADE,
+                                   related_name='welcome_emails')
+    status = models.CharField(max_length=20,
+                              choices=STATUS_CHOICES,
+                              default=PENDING,
+                              db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Welcome email to {self.subscriber.email} ({self.status})"
+
+
 class NewsletterMail(models.Model):
     subject = models.CharField(max_length=255)
+    slug = models.SlugField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text=(
+            "Identifies system emails, e.g. 'welcome' for the email sent "
+            "to new subscribers."
+        )
+    )
     html_content = models.TextField(
         help_text=(
             "You can use template variables like {{ user.first_name }}, "
@@ -51,6 +96,39 @@ class NewsletterMail(models.Model):
     def __str__(self):
         return self.subject
 
+    def record_delivery(self, subscribers, chunk_size=None):
+        """
+        Mark the newsletter as sent and record the subscribers it went to,
+        given as a queryset or as their ids (e.g. a send's
+        `subscriber_ids`).
+
+        The subscriber ids are streamed and written to the `sent_to`
+        through table with chunked bulk inserts, so memory use stays flat
+        however many subscribers there are.
+        """
+        if chunk_size is None:
+            chunk_size = settings.NEWSLETTER_CHUNK_SIZE
+
+        self.sent_at = timezone.now()
+        self.save(update_fields=['sent_at', 'updated_at'])
+
+        through = NewsletterMail.sent_to.through
+        if isinstance(subscribers, models.QuerySet):
+            subscriber_ids = subscribers.values_list(
+                'pk', flat=True).iterator(chunk_size=chunk_size)
+        else:
+            subscriber_ids = subscribers
+        batch = []
+        for subscriber_id in subscriber_ids:
+            batch.append(
+                through(newslettermail_id=self.pk,
+                        newslettersubscriber_id=subscriber_id))
+            if len(batch) >= chunk_size:
+                through.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            through.objects.bulk_create(batch, ignore_conflicts=True)
+
     def render_content(self, context_dict=None):
         """Render the newsletter content with the given context."""
         if context_dict is None:
@@ -63,3 +141,50 @@ class NewsletterMail(models.Model):
         template = Template(self.html_content)
         context = Context(context_dict)
         return template.render(context)
+
+
+class NewsletterEvent(models.Model):
+    """A delivery or engagement event reported by SendGrid's event webhook."""
+    newsletter = models.ForeignKey(NewsletterMail,
+                                   on_delete=models.SET_NULL,
+                                   null=True,
+                                   blank=True,
+                                   related_name='events')
+    sg_event_id = models.CharField(max_length=100, unique=True)
+    sg_message_id = models.CharField(max_length=255, blank=True)
+    event = models.CharField(max_length=30, db_index=True)
+    email = models.EmailField()
+    # Bounce type ('bounce' or 'blocked') or drop reason where relevant
+    reason = models.TextField(blank=True)
+    bounce_type = models.CharField(max_length=20, blank=True)
+    timestamp = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+
+    def __str__(self):
+        return f"{self.event} - {self.email}"
+
+
+class NewsletterStats(models.Model):
+    """Running per-newsletter totals of the events received from SendGrid."""
+    newsletter = models.OneToOneField(NewsletterMail,
+                                      on_delete=models.CASCADE,
+                                      related_name='stats')
+    processed = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    opened = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    bounced = models.PositiveIntegerField(default=0)
+    dropped = models.PositiveIntegerField(default=0)
+    deferred = models.PositiveIntegerField(default=0)
+    spam_reports = models.PositiveIntegerField(default=0)
+    unsubscribed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Newsletter stats'
+
+    def __str__(self):
+        return f"Stats for {self.newsletter}"
@@ -1,19 +1,182 @@
 import logging
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from django.contrib.sites.models import Site
+from python_http_client.exceptions import TooManyRequestsError
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, CustomArg
 from django.conf import settings
-from .models import NewsletterSubscriber, NewsletterMail
+from django.core.cache import cache
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+from .models import NewsletterSubscriber, NewsletterMail, WelcomeEmail
 from django.contrib import messages
+from bouldering_cy.metrics import timed
+from .tasks import enqueue
+from .throttling import TokenBucket
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_active_subscribers():
+    """
+    Return the active subscribers with just the columns needed to
+    personalise a newsletter, joined to their user in the same query.
+    """
+    return stream_subscribers(
+        NewsletterSubscriber.objects.filter(is_active=True))
+
+
+def stream_subscribers(subscribers, chunk_size=None):
+    """
+    Iterate a subscriber queryset in chunks with the user joined in,
+    instead of loading every row into memory and querying each user.
+    """
+    if chunk_size is None:
+        chunk_size = settings.NEWSLETTER_CHUNK_SIZE
+    return subscribers.select_related('user').only(
+        'id', 'user', 'user__email', 'user__first_name',
+        'user__last_name').iterator(chunk_size=chunk_size)
+
+
+def get_sendgrid_client():
+    """Return a SendGrid client configured from the settings."""
+    return SendGridAPIClient(api_key=settings.EMAIL_HOST_PASSWORD,
+                             host=settings.SENDGRID_API_HOST)
+
+
+def _retry_after(error, attempt):
+    """
+    Work out how long to wait before retrying a rate-limited send, honouring
+    the provider's Retry-After header when present.
+    """
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        # Exponential backoff: 0.5s, 1s, 2s...
+        return 0.5 * (2**attempt)
+
+
+def _deliver(sg, message, recipient_email):
+    """
+    Send a single message, retrying when the provider responds with
+    429 Too Many Requests.
+    Returns True if the message was accepted, False otherwise.
+    """
+    max_retries = settings.NEWSLETTER_SEND_MAX_RETRIES
+    for attempt in range(max_retries + 1):
+        try:
+            with timed('sendgrid'):
+                response = sg.send(message)
+        except TooManyRequestsError as e:
+            if attempt < max_retries:
+                delay = _retry_after(e, attempt)
+                logger.warning(f"Rate limited sending to {recipient_email}, "
+                               f"retrying in {delay}s")
+                time.sleep(delay)
+                continue
+            logger.error(f"Failed to send newsletter to {recipient_email}: "
+                         "rate limit retries exhausted")
+            return False
+        except Exception as e:
+            logger.error(f"Failed to send newsletter to {recipient_email}:"
+                         f" {str(e)}")
+            return False
+
+        if response.status_code not in [200, 201, 202]:
+            logger.error(f"Failed to send newsletter to {recipient_email}:"
+                         f" {response.body}")
+            return False
+        logger.info(f"Newsletter sent to {recipient_email}")
+        return True
+    return False
+
+
+class SendResult:
+    """
+    The outcome of a newsletter send: how many messages were sent and
+    failed, and the ids of the subscribers they were sent to. True only
+    when every message was sent.
+    """
+
+    def __init__(self, sent=0, failed=0, subscriber_ids=None, error=None):
+        self.sent = sent
+        self.failed = failed
+        self.subscriber_ids = subscriber_ids or []
+        self.error = error
+
+    def __bool__(self):
+        return self.error is None and self.failed == 0
+
+    def __repr__(self):
+        return (f"SendResult(sent={self.sent}, failed={self.failed}, "
+                f"error={self.error!r})")
+
+
+def _send_messages(messages, workers=1, rate=None, on_sent=None):
+    """
+    Send the (recipient_email, message, subscriber_id) triples yielded by
+    `messages`, calling `on_sent(subscriber_id)` for each one accepted.
+
+    With more than one worker the sends are spread over a bounded thread
+    pool, each thread holding its own SendGrid client. All workers share one
+    token bucket so the combined send rate stays within `rate` per second.
+    Messages are built lazily by the caller's thread and only a small window
+    of them is in flight at any time, so memory use does not grow with the
+    number of recipients.
+
+    Returns a dict of per-worker results: {worker_name: {'sent', 'failed'}}.
+    """
+    bucket = TokenBucket(rate)
+    worker_stats = {}
+    stats_lock = threading.Lock()
+    local = threading.local()
+
+    def send(recipient_email, message, subscriber_id):
+        # Lazily set up a client and result counters for this worker
+        if not hasattr(local, 'client'):
+            local.client = get_sendgrid_client()
+            local.stats = {'sent': 0, 'failed': 0}
+            with stats_lock:
+                worker_stats[threading.current_thread().name] = local.stats
+        bucket.acquire()
+        if _deliver(local.client, message, recipient_email):
+            local.stats['sent'] += 1
+            if on_sent is not None and subscriber_id is not None:
+                on_sent(subscriber_id)
+        else:
+            local.stats['failed'] += 1
+
+    if workers <= 1:
+        for recipient_email, message, subscriber_id in messages:
+            send(recipient_email, message, subscriber_id)
+        return worker_stats
+
+    # Keep a bounded number of messages queued for the pool
+    max_in_flight = workers * 4
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='newsletter-send') as executor:
+        for recipient_email, message, subscriber_id in messages:
+            if len(in_flight) >= max_in_flight:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(
+                executor.submit(send, recipient_email, message,
+                                subscriber_id))
+        wait(in_flight)
+    return worker_stats
+
+
 def send_newsletter_email(newsletter,
                           recipient_list=None,
                           from_email=None,
-                          context=None):
+                          context=None,
+                          workers=None,
+                          rate=None):
     """
     Send a newsletter email using SendGrid.
 
@@ -25,12 +188,21 @@ def send_newsletter_email(newsletter,
         from_email (str, optional): Sender email. Defaults to
             settings.DEFAULT_FROM_EMAIL.
         context (dict, optional): Additional context for template rendering.
+        workers (int, optional): Number of concurrent sending threads.
+            Defaults to settings.NEWSLETTER_SEND_WORKERS.
+        rate (float, optional): Maximum sends per second across all workers.
+            Defaults to settings.NEWSLETTER_SEND_RATE (unlimited if None).
 
     Returns:
-        bool: True if successful, False otherwise
+        SendResult: True only if every message was sent. Its
+            `subscriber_ids` are the subscribers the newsletter went to.
     """
     if from_email is None:
         from_email = settings.DEFAULT_FROM_EMAIL
+    if workers is None:
+        workers = settings.NEWSLETTER_SEND_WORKERS
+    if rate is None:
+        rate = settings.NEWSLETTER_SEND_RATE
 
     # Get the site URL from settings or construct it
     if hasattr(settings, 'SITE_URL'):
@@ -54,26 +226,19 @@ def send_newsletter_email(newsletter,
     context['static_url'] = static_url
     logger.info(f"Base context: {context}")
 
-    try:
-        sg = SendGridAPIClient(api_key=settings.EMAIL_HOST_PASSWORD)
-
-        # If no recipient list is provided, get all active subscribers
-        if recipient_list is None:
-            subscribers = list(
-                NewsletterSubscriber.objects.filter(is_active=True))
-            logger.info(f"Fetched {len(subscribers)} activesubscribers")
-
-        # Otherwise use the provided recipient list
-        else:
-            subscribers = recipient_list
-
-        # For each recipient, create a personalized email
+    def build_messages(subscribers):
+        """
+        Yield a personalised (recipient_email, message, subscriber_id) per
+        subscriber. The id is None for plain email addresses.
+        """
         for subscriber in subscribers:
             # Prepare recipient-specific context
             recipient_context = context.copy()
+            subscriber_id = None
 
             if hasattr(subscriber, 'user'):
                 # It's a subscriber object
+                subscriber_id = subscriber.pk
                 recipient_email = subscriber.user.email
                 recipient_context['user'] = subscriber.user
                 recipient_context['first_name'] = subscriber.user.first_name
@@ -88,8 +253,9 @@ def send_newsletter_email(newsletter,
                 recipient_context['unsubscribe_url'] = \
                     f"{site_url}/newsletter/manage/"
 
-            logger.info(f"Processing subscriber: {recipient_email}")
-            logger.info(f"Recipient context: {recipient_context}")
+            # Lazy formatting: these run once per recipient
+            logger.debug("Processing subscriber: %s", recipient_email)
+            logger.debug("Recipient context: %s", recipient_context)
 
             # Render the content with the recipient-specific context
             html_content = newsletter.render_content(recipient_context)
@@ -105,41 +271,177 @@ def send_newsletter_email(newsletter,
                 f"{site_url}/newsletter/unsubscribe/{recipient_email}/"
             message.add_custom_arg(
                 CustomArg('unsubscribe_url', unsubscribe_url))
+            # Echoed back on webhook events to attribute them to this mail
+            if newsletter.pk:
+                message.add_custom_arg(
+                    CustomArg('newsletter_id', str(newsletter.pk)))
 
-            # Send the newsletter
-            response = sg.send(message)
+            yield recipient_email, message, subscriber_id
 
-            if response.status_code not in [200, 201, 202]:
-                logger.error(f"Failed to send newsletter to {recipient_email}:"
-                             f" {response.body}")
-            else:
-                logger.info(f"Newsletter sent to {recipient_email}")
+    result = SendResult()
+    try:
+        # If no recipient list is provided, stream all active subscribers
+        if recipient_list is None:
+            subscribers = get_active_subscribers()
+            logger.info("Streaming active subscribers")
 
-        return True
+        # Stream subscriber querysets rather than loading them all at once
+        elif isinstance(recipient_list, QuerySet):
+            subscribers = stream_subscribers(recipient_list)
+
+        # Otherwise use the provided recipient list
+        else:
+            subscribers = recipient_list
+
+        # Send the newsletters and aggregate the per-worker results
+        worker_stats = _send_messages(build_messages(subscribers),
+                                      workers=workers,
+                                      rate=rate,
+                                      on_sent=result.subscriber_ids.append)
+        result.sent = sum(stats['sent'] for stats in worker_stats.values())
+        result.failed = sum(
+            stats['failed'] for stats in worker_stats.values())
+        for worker, stats in sorted(worker_stats.items()):
+            logger.info(f"{worker}: sent {stats['sent']}, "
+                        f"failed {stats['failed']}")
+        logger.info(f"Newsletter '{newsletter.subject}' sent to "
+                    f"{result.sent} recipients ({result.failed} failed) "
+                    f"using {workers} worker(s)")
+        if result.failed:
+            logger.error(f"Newsletter '{newsletter.subject}' failed for "
+                         f"{result.failed} of "
+                         f"{result.sent + result.failed} recipients")
 
     except Exception as e:
         logger.error(f"Error sending newsletter: {str(e)}")
-        return False
+        result.error = str(e)
+    return result
 
 
-def send_welcome_email(request, subscriber):
+def get_welcome_email():
     """
-    Send a welcome email to a new subscriber.
+    Return the welcome email template, identified by the
+    NEWSLETTER_WELCOME_SLUG setting. Cached to avoid a query per signup.
     """
-    # Get the welcome email template
-    welcome_email = NewsletterMail.objects.get(id=1)
-    # Send the welcome email
+    slug = settings.NEWSLETTER_WELCOME_SLUG
+    cache_key = f"newsletter:mail:{slug}"
+    welcome_email = cache.get(cache_key)
+    if welcome_email is None:
+        welcome_email = NewsletterMail.objects.filter(slug=slug).first()
+        if welcome_email is not None:
+            cache.set(cache_key, welcome_email,
+                      settings.NEWSLETTER_MAIL_CACHE_TIMEOUT)
+    return welcome_email
+
+
+def deliver_welcome_email(subscriber_id):
+    """
+    Send the welcome email to a subscriber. Runs on the background
+    email worker for a queued WelcomeEmail, see `send_welcome_email`.
+    """
+    try:
+        subscriber = NewsletterSubscriber.objects.select_related(
+            'user').get(pk=subscriber_id)
+    except NewsletterSubscriber.DoesNotExist:
+        logger.warning(f"Subscriber {subscriber_id} no longer exists, "
+                       "skipping welcome email")
+        return False
+
+    welcome_email = get_welcome_email()
+    if welcome_email is None:
+        logger.error("No welcome email found with slug "
+                     f"'{settings.NEWSLETTER_WELCOME_SLUG}'")
+        return False
+
     logger.info(f"Sending welcome email to {subscriber.email}")
     success = send_newsletter_email(newsletter=welcome_email,
-                                    recipient_list=[subscriber])
+                                    recipient_list=[subscriber],
+                                    workers=1)
     if success:
         logger.info(f"Welcome email sent to {subscriber.email}")
-        messages.success(request,
-                         "Thank you for subscribing to our newsletter!")
     else:
         logger.error(f"Error sending welcome email for "
                      f"{subscriber.email}")
-        messages.error(
-            request, "An error occurred while processing your "
-            "subscribtion to our newsletter. Please try again "
-            "later or contact us at info@bouldering-cyprus.com.")
+    return bool(success)
+
+
+def claimable_welcome_emails():
+    """
+    Welcome emails a worker may send: pending ones, and ones stuck
+    sending because their process died.
+    """
+    stale = timezone.now() - timedelta(
+        seconds=settings.NEWSLETTER_WELCOME_TIMEOUT)
+    return WelcomeEmail.objects.filter(
+        Q(status=WelcomeEmail.PENDING)
+        | Q(status=WelcomeEmail.SENDING, claimed_at__lt=stale))
+
+
+def claim_welcome_email(job_id):
+    """
+    Atomically take a welcome email. The conditional UPDATE only matches
+    while it is still claimable, so two workers can never both send it.
+    """
+    return claimable_welcome_emails().filter(pk=job_id).update(
+        status=WelcomeEmail.SENDING,
+        attempts=F('attempts') + 1,
+        claimed_at=timezone.now()) == 1
+
+
+def process_welcome_email(job_id):
+    """
+    Claim and send one queued welcome email. Failures are retried until
+    NEWSLETTER_WELCOME_MAX_ATTEMPTS is reached.
+    Returns its final status, or None if another worker has it.
+    """
+    if not claim_welcome_email(job_id):
+        return None
+    job = WelcomeEmail.objects.get(pk=job_id)
+    try:
+        sent = deliver_welcome_email(job.subscriber_id)
+        error = '' if sent else 'The welcome email was not sent'
+    except Exception as e:
+        logger.error(f"Error sending welcome email {job_id}: {e}")
+        sent, error = False, str(e)
+
+    if sent:
+        status = WelcomeEmail.SENT
+    elif job.attempts >= settings.NEWSLETTER_WELCOME_MAX_ATTEMPTS:
+        status = WelcomeEmail.FAILED
+    else:
+        status = WelcomeEmail.PENDING
+    WelcomeEmail.objects.filter(pk=job_id).update(
+        status=status,
+        last_error=error[:1000],
+        claimed_at=None,
+        updated_at=timezone.now())
+    return status
+
+
+def send_queued_welcome_emails(limit=None):
+    """
+    Send the claimable welcome emails, oldest first, including any left
+    behind by a process that stopped before sending them.
+    Returns {status: count} for the emails this call processed.
+    """
+    job_ids = list(
+        claimable_welcome_emails().order_by('id').values_list(
+            'id', flat=True)[:limit])
+    results = {}
+    for job_id in job_ids:
+        status = process_welcome_email(job_id)
+        if status:
+            results[status] = results.get(status, 0) + 1
+    return results
+
+
+def send_welcome_email(request, subscriber):
+    """
+    Queue a welcome email to a new subscriber. The email is recorded in
+    the database and sent by a background worker, so the response doesn't
+    wait on SendGrid and a restart doesn't lose it.
+    """
+    logger.info(f"Queueing welcome email to {subscriber.email}")
+    WelcomeEmail.objects.create(subscriber=subscriber)
+    enqueue(send_queued_welcome_emails)
+    messages.success(request, "Thank you for subscribing to our newsletter!")
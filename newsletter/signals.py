@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import NewsletterMail
+
+
+@receiver([post_save, post_delete], sender=NewsletterMail)
+def clear_cached_mail(sender, instance, **kwargs):
+    """
+    Drop cached system emails when a mail is edited. The welcome email is
+    always cleared in case this mail's slug was changed away from it.
+    """
+    slugs = {settings.NEWSLETTER_WELCOME_SLUG, instance.slug}
+    cache.delete_many([f"newsletter:mail:{slug}" for slug in slugs if slug])
@@ -0,0 +1,49 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide pool that sends emails in the background."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NEWSLETTER_EMAIL_WORKERS,
+                thread_name_prefix='newsletter-email')
+        return _executor
+
+
+def _run(func, *args, background=True):
+    """Run a queued job, logging rather than raising any error."""
+    try:
+        func(*args)
+    except Exception as e:
+        logger.exception(f"Background email job {func.__name__} failed: {e}")
+    finally:
+        # Worker threads hold their own database connection
+        if background:
+            connection.close()
+
+
+def _dispatch(func, *args):
+    if settings.NEWSLETTER_EMAIL_ASYNC:
+        get_executor().submit(_run, func, *args)
+    else:
+        _run(func, *args, background=False)
+
+
+def enqueue(func, *args):
+    """
+    Run `func(*args)` on the background email worker once the current
+    transaction commits, so the job sees any rows the caller just saved.
+    Set NEWSLETTER_EMAIL_ASYNC to False to run jobs inline instead.
+    """
+    transaction.on_commit(lambda: _dispatch(func, *args))
@@ -1,11 +1,28 @@
-from django.test import TestCase, Client, RequestFactory
+import json
+import time
+from io import StringIO
+from datetime import timedelta
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
-
-from .models import NewsletterSubscriber, NewsletterMail
-from .sendgrid_utils import send_newsletter_email
+from python_http_client.exceptions import TooManyRequestsError
+from ellipticcurve.curve import prime256v1
+from ellipticcurve.ecdsa import Ecdsa
+from ellipticcurve.privateKey import PrivateKey
+
+from .models import (NewsletterSubscriber, NewsletterMail, NewsletterEvent,
+                     NewsletterStats, WelcomeEmail)
+from .sendgrid_utils import (send_newsletter_email, get_welcome_email,
+                             deliver_welcome_email,
+                             send_queued_welcome_emails, SendResult)
+from .throttling import TokenBucket
+from .webhook_handler import record_events
+from .fake_sendgrid import FakeSendGridServer
 
 User = get_user_model()
 
@@ -22,7 +39,7 @@ class NewsletterSubscriptionTests(TestCase):
 
         # Create a welcome email template
         self.welcome_email = NewsletterMail.objects.create(
-            id=1,  # ID 1 is used for welcome email in the code
+            slug='welcome',
             subject='Welcome to our Newsletter',
             html_content='<p>Welcome {{ first_name }}!</p>')
 
@@ -42,9 +59,12 @@ class NewsletterSubscriptionTests(TestCase):
         self.assertFalse(
             NewsletterSubscriber.objects.filter(user=self.user).exists())
 
-        # Subscribe the user
-        response = self.client.post(reverse('newsletter:manage_subscription'),
-                                    {'action': 'subscribe'})
+        # Subscribe the user, running the queued welcome email inline
+        with self.settings(NEWSLETTER_EMAIL_ASYNC=False), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('newsletter:manage_subscription'),
+                {'action': 'subscribe'})
 
         # Check redirect
         self.assertRedirects(response,
@@ -72,6 +92,97 @@ class NewsletterSubscriptionTests(TestCase):
         elif 'newsletter' in call_kwargs:
             self.assertEqual(call_kwargs['newsletter'], self.welcome_email)
 
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_subscribe_does_not_wait_for_welcome_email(self,
+                                                       mock_send_email):
+        """Test the welcome email is queued rather than sent inline"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('newsletter:manage_subscription'),
+                {'action': 'subscribe'},
+                follow=True)
+
+        # The user is told straight away, before anything is sent
+        self.assertContains(response,
+                            "Thank you for subscribing to our newsletter!")
+        mock_send_email.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_welcome_email_template_is_cached(self, mock_send_email):
+        """Test the welcome template is looked up by slug and cached"""
+        cache.clear()
+        self.assertEqual(get_welcome_email(), self.welcome_email)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_welcome_email(), self.welcome_email)
+
+        # Editing the template clears the cached copy
+        self.welcome_email.subject = 'Updated welcome'
+        self.welcome_email.save()
+        self.assertEqual(get_welcome_email().subject, 'Updated welcome')
+
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_deliver_welcome_email(self, mock_send_email):
+        """Test the background job sends the welcome template"""
+        mock_send_email.return_value = True
+        subscriber = NewsletterSubscriber.objects.create(user=self.user)
+
+        self.assertTrue(deliver_welcome_email(subscriber.pk))
+        call_kwargs = mock_send_email.call_args.kwargs
+        self.assertEqual(call_kwargs['newsletter'], self.welcome_email)
+        self.assertEqual(call_kwargs['recipient_list'], [subscriber])
+
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_deliver_welcome_email_missing_subscriber(self,
+                                                      mock_send_email):
+        """Test a subscriber deleted before the job runs is skipped"""
+        self.assertFalse(deliver_welcome_email(999))
+        mock_send_email.assert_not_called()
+
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_welcome_email_survives_a_restart(self, mock_send_email):
+        """Test a welcome email whose job was lost is sent by the next run"""
+        mock_send_email.return_value = True
+        # The process restarts before the queued job runs
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post(reverse('newsletter:manage_subscription'),
+                             {'action': 'subscribe'})
+        job = WelcomeEmail.objects.get(subscriber__user=self.user)
+        self.assertEqual(job.status, WelcomeEmail.PENDING)
+        mock_send_email.assert_not_called()
+
+        out = StringIO()
+        call_command('send_welcome_emails', stdout=out)
+        self.assertIn('1 sent', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, WelcomeEmail.SENT)
+        mock_send_email.assert_called_once()
+        # A sent email isn't sent again
+        self.assertEqual(send_queued_welcome_emails(), {})
+
+    @override_settings(NEWSLETTER_WELCOME_MAX_ATTEMPTS=2,
+                       NEWSLETTER_WELCOME_TIMEOUT=60)
+    @patch('newsletter.sendgrid_utils.send_newsletter_email')
+    def test_welcome_email_retries(self, mock_send_email):
+        """Test failed and abandoned welcome emails are retried"""
+        mock_send_email.return_value = False
+        subscriber = NewsletterSubscriber.objects.create(user=self.user)
+        job = WelcomeEmail.objects.create(subscriber=subscriber)
+
+        self.assertEqual(send_queued_welcome_emails(),
+                         {WelcomeEmail.PENDING: 1})
+        # Left sending by a process that died, recently and long ago
+        WelcomeEmail.objects.filter(pk=job.pk).update(
+            status=WelcomeEmail.SENDING, claimed_at=timezone.now())
+        self.assertEqual(send_queued_welcome_emails(), {})
+        WelcomeEmail.objects.filter(pk=job.pk).update(
+            claimed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(send_queued_welcome_emails(),
+                         {WelcomeEmail.FAILED: 1})
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(job.last_error)
+
     @patch('newsletter.sendgrid_utils.send_newsletter_email')
     def test_unsubscribe_flow(self, mock_send_email):
         """Test the unsubscription flow when a user unsubscribes"""
@@ -179,7 +290,8 @@ class NewsletterSendingTests(TestCase):
         'newsletter.management.commands.send_newsletter.send_newsletter_email')
     def test_send_newsletter_command(self, mock_send_email):
         """Test the send_newsletter management command"""
-        mock_send_email.return_value = True
+        mock_send_email.return_value = SendResult(
+            sent=1, subscriber_ids=[self.subscriber1.pk])
 
         # Call the command
         call_command('send_newsletter', newsletter_id=self.newsletter.id)
@@ -199,7 +311,7 @@ class NewsletterSendingTests(TestCase):
         'newsletter.management.commands.send_newsletter.send_newsletter_email')
     def test_send_newsletter_command_test_email(self, mock_send_email):
         """Test the send_newsletter command with test_email parameter"""
-        mock_send_email.return_value = True
+        mock_send_email.return_value = SendResult(sent=1)
         test_email = 'test@example.com'
 
         # Call the command with test_email
@@ -214,3 +326,451 @@ class NewsletterSendingTests(TestCase):
         self.assertEqual(args[0], self.newsletter)
         self.assertEqual(args[1], [test_email])
         self.assertIn('context', kwargs)
+
+    @patch('newsletter.sendgrid_utils.SendGridAPIClient')
+    def test_send_newsletter_email_concurrent(self, mock_sendgrid):
+        """Test concurrent sending delivers to every recipient"""
+        mock_client = MagicMock()
+        mock_sendgrid.return_value = mock_client
+        mock_client.send.return_value.status_code = 202
+        recipients = [f'user{i}@example.com' for i in range(20)]
+
+        result = send_newsletter_email(self.newsletter,
+                                       recipient_list=recipients,
+                                       workers=4)
+
+        self.assertTrue(result)
+        self.assertEqual(mock_client.send.call_count, 20)
+        # One client per worker thread, never more than the pool size
+        self.assertLessEqual(mock_sendgrid.call_count, 4)
+
+    @patch('newsletter.sendgrid_utils.time.sleep')
+    @patch('newsletter.sendgrid_utils.SendGridAPIClient')
+    def test_send_newsletter_email_retries_rate_limit(self, mock_sendgrid,
+                                                      mock_sleep):
+        """Test a 429 response is retried rather than failing the send"""
+        mock_client = MagicMock()
+        mock_sendgrid.return_value = mock_client
+        ok_response = MagicMock(status_code=202)
+        mock_client.send.side_effect = [
+            TooManyRequestsError(429, 'Too Many Requests', b'', {}),
+            ok_response,
+        ]
+
+        result = send_newsletter_email(self.newsletter,
+                                       recipient_list=['user@example.com'])
+
+        self.assertTrue(result)
+        self.assertEqual(mock_client.send.call_count, 2)
+        mock_sleep.assert_called_once()
+
+    @patch('newsletter.sendgrid_utils.SendGridAPIClient')
+    def test_send_newsletter_email_all_failed(self, mock_sendgrid):
+        """Test the send reports failure when nothing was delivered"""
+        mock_client = MagicMock()
+        mock_sendgrid.return_value = mock_client
+        mock_client.send.side_effect = Exception('Connection refused')
+
+        result = send_newsletter_email(self.newsletter,
+                                       recipient_list=['user@example.com'])
+
+        self.assertFalse(result)
+
+    @patch(
+        'newsletter.management.commands.send_newsletter.send_newsletter_email')
+    def test_send_newsletter_command_workers_and_rate(self, mock_send_email):
+        """Test the --workers and --rate options are passed through"""
+        mock_send_email.return_value = SendResult(sent=1)
+
+        call_command('send_newsletter',
+                     newsletter_id=self.newsletter.id,
+                     workers=8,
+                     rate=50)
+
+        args, kwargs = mock_send_email.call_args
+        self.assertEqual(kwargs['workers'], 8)
+        self.assertEqual(kwargs['rate'], 50)
+
+    @patch('newsletter.sendgrid_utils.SendGridAPIClient')
+    def test_send_to_subscriber_queryset_avoids_n_plus_one(
+            self, mock_sendgrid):
+        """Test subscribers are streamed with their users in one query"""
+        mock_client = MagicMock()
+        mock_sendgrid.return_value = mock_client
+        mock_client.send.return_value.status_code = 202
+        for i in range(10):
+            user = User.objects.create_user(username=f'bulk{i}',
+                                            email=f'bulk{i}@example.com',
+                                            password='password123')
+            NewsletterSubscriber.objects.create(user=user, is_active=True)
+
+        subscribers = NewsletterSubscriber.objects.filter(is_active=True)
+        with self.assertNumQueries(1):
+            result = send_newsletter_email(self.newsletter, subscribers)
+
+        self.assertTrue(result)
+        self.assertEqual(mock_client.send.call_count, 11)
+
+    @patch('newsletter.sendgrid_utils.SendGridAPIClient')
+    def test_partial_send_records_only_recipients_sent_to(self,
+                                                          mock_sendgrid):
+        """Test a partly failed send is reported and only records the
+        subscribers it was sent to"""
+        failing = User.objects.create_user(username='failing',
+                                           email='failing@example.com',
+                                           password='password123')
+        NewsletterSubscriber.objects.create(user=failing, is_active=True)
+        mock_client = MagicMock()
+        mock_sendgrid.return_value = mock_client
+        mock_client.send.side_effect = [
+            MagicMock(status_code=202),
+            Exception('Connection reset'),
+        ]
+
+        out, err = StringIO(), StringIO()
+        with self.assertLogs('newsletter.sendgrid_utils', 'ERROR') as logs:
+            call_command('send_newsletter',
+                         newsletter_id=self.newsletter.id,
+                         stdout=out,
+                         stderr=err)
+
+        self.assertIn('1 of 2 recipients', logs.output[-1])
+        self.assertIn('sent to 1 of 2 subscribers, 1 failed', err.getvalue())
+        self.assertEqual(list(self.newsletter.sent_to.all()),
+                         [self.subscriber1])
+
+    @patch('newsletter.admin.send_newsletter_email')
+    def test_admin_reports_partial_send(self, mock_send_email):
+        """Test the admin action warns when some sends failed"""
+        mock_send_email.return_value = SendResult(
+            sent=1, failed=1, subscriber_ids=[self.subscriber1.pk])
+        admin = User.objects.create_superuser('admin', 'a@example.com', 'pw')
+        NewsletterSubscriber.objects.create(user=admin, is_active=True)
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            reverse('admin:newsletter_newslettermail_changelist'), {
+                'action': 'send_newsletter',
+                '_selected_action': [self.newsletter.pk],
+            },
+            follow=True)
+
+        self.assertContains(response, 'was sent to 1 of 2 subscribers')
+        self.assertEqual(list(self.newsletter.sent_to.all()),
+                         [self.subscriber1])
+
+    def test_record_delivery_writes_sent_to_in_chunks(self):
+        """Test sent_to rows are bulk inserted in chunks"""
+        for i in range(5):
+            user = User.objects.create_user(username=f'chunk{i}',
+                                            email=f'chunk{i}@example.com',
+                                            password='password123')
+            NewsletterSubscriber.objects.create(user=user, is_active=True)
+        subscribers = NewsletterSubscriber.objects.filter(is_active=True)
+
+        # 1 update + 1 select + 3 chunked inserts of up to 2 rows
+        with self.assertNumQueries(5):
+            self.newsletter.record_delivery(subscribers, chunk_size=2)
+
+        self.newsletter.refresh_from_db()
+        self.assertIsNotNone(self.newsletter.sent_at)
+        self.assertEqual(self.newsletter.sent_to.count(), 6)
+
+        # Recording again doesn't duplicate rows
+        self.newsletter.record_delivery(subscribers, chunk_size=2)
+        self.assertEqual(self.newsletter.sent_to.count(), 6)
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        # Use a fake clock so the tests don't actually sleep
+        self.now = 0.0
+        self.sleeps = []
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+        self.bucket = TokenBucket(rate=10,
+                                  clock=lambda: self.now,
+                                  sleep=sleep)
+
+    def test_burst_within_capacity_does_not_wait(self):
+        """Test sends up to the bucket capacity go straight through"""
+        for _ in range(10):
+            self.bucket.acquire()
+        self.assertEqual(self.sleeps, [])
+
+    def test_acquire_waits_when_empty(self):
+        """Test sends beyond the capacity are throttled to the rate"""
+        for _ in range(15):
+            self.bucket.acquire()
+        # 5 extra tokens at 10 tokens/sec take half a second to accrue
+        self.assertAlmostEqual(sum(self.sleeps), 0.5)
+
+    def test_no_rate_disables_throttling(self):
+        """Test a bucket without a rate never blocks"""
+        bucket = TokenBucket(rate=None, sleep=self.fail)
+        for _ in range(1000):
+            bucket.acquire()
+
+
+class FakeSendGridTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeSendGridServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        self.newsletter = NewsletterMail.objects.create(
+            subject='Test Newsletter',
+            html_content='<p>Hello {{ first_name }}!</p>')
+
+    def test_send_newsletter_through_fake_sendgrid(self):
+        """Test the SendGrid client can be pointed at the fake service"""
+        with override_settings(SENDGRID_API_HOST=self.server.url):
+            result = send_newsletter_email(
+                self.newsletter,
+                recipient_list=['a@example.com', 'b@example.com'])
+
+        self.assertTrue(result)
+        self.assertEqual(self.server.stats['accepted'], 2)
+        payload = json.loads(self.server.last_payload)
+        self.assertEqual(payload['subject'], 'Test Newsletter')
+
+    def test_fake_sendgrid_errors(self):
+        """Test the fake answers with errors at the configured rate"""
+        self.server.error_rate = 1.0
+        with override_settings(SENDGRID_API_HOST=self.server.url):
+            result = send_newsletter_email(
+                self.newsletter, recipient_list=['a@example.com'])
+
+        self.assertFalse(result)
+        self.assertEqual(self.server.stats['errors'], 1)
+
+    @patch('newsletter.sendgrid_utils.time.sleep')
+    def test_fake_sendgrid_rate_limit(self, mock_sleep):
+        """Test sends over the fake's rate limit get 429s and are retried"""
+        self.server.limiter = TokenBucket(rate=1, capacity=1)
+        with override_settings(SENDGRID_API_HOST=self.server.url,
+                               NEWSLETTER_SEND_MAX_RETRIES=0):
+            send_newsletter_email(
+                self.newsletter,
+                recipient_list=['a@example.com', 'b@example.com'])
+
+        self.assertEqual(self.server.stats['accepted'], 1)
+        self.assertEqual(self.server.stats['rate_limited'], 1)
+
+    def test_benchmark_newsletter_command(self):
+        """Test the benchmark seeds, sends in every mode and cleans up"""
+        out = StringIO()
+        call_command('benchmark_newsletter',
+                     subscribers=12,
+                     batch_size=5,
+                     workers=3,
+                     latency=0,
+                     stdout=out)
+
+        output = out.getvalue()
+        for mode in ('current', 'batched', 'concurrent'):
+            self.assertIn(mode, output)
+        self.assertIn('sends/s', output)
+        # The seeded data is rolled back
+        self.assertFalse(
+            User.objects.filter(
+                username__startswith='newsletter-bench-').exists())
+
+
+class SendGridWebhookTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # SendGrid signs events with an ECDSA P-256 key
+        cls.private_key = PrivateKey(curve=prime256v1)
+        pem = cls.private_key.publicKey().toPem()
+        cls.public_key = ''.join(line for line in pem.strip().splitlines()
+                                 if not line.startswith('-----'))
+
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('newsletter:sendgrid_webhook')
+        self.newsletter = NewsletterMail.objects.create(
+            subject='Spring news', html_content='<p>Hi</p>')
+        self.users = [
+            User.objects.create_user(username=f'user{i}',
+                                     email=f'user{i}@example.com')
+            for i in range(3)
+        ]
+        self.subscribers = [
+            NewsletterSubscriber.objects.create(user=user, is_active=True)
+            for user in self.users
+        ]
+        settings_override = override_settings(
+            SENDGRID_WEBHOOK_PUBLIC_KEY=self.public_key)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def event(self, event_id, event, email='user0@example.com', **extra):
+        data = {
+            'sg_event_id': event_id,
+            'sg_message_id': f'msg-{event_id}',
+            'event': event,
+            'email': email,
+            'timestamp': 1700000000,
+            'newsletter_id': str(self.newsletter.pk),
+        }
+        data.update(extra)
+        return data
+
+    def post_events(self, events, timestamp=None, signature=None):
+        body = json.dumps(events)
+        timestamp = str(timestamp or int(time.time()))
+        if signature is None:
+            signature = Ecdsa.sign(timestamp + body,
+                                   self.private_key).toBase64()
+        return self.client.post(
+            self.url,
+            data=body,
+            content_type='application/json',
+            HTTP_X_TWILIO_EMAIL_EVENT_WEBHOOK_SIGNATURE=signature,
+            HTTP_X_TWILIO_EMAIL_EVENT_WEBHOOK_TIMESTAMP=timestamp)
+
+    def test_signed_batch_is_stored_and_counted(self):
+        """Test a signed batch is stored and rolled up per newsletter"""
+        response = self.post_events([
+            self.event('e1', 'delivered'),
+            self.event('e2', 'delivered', email='user1@example.com'),
+            self.event('e3', 'open'),
+            self.event('e4', 'click'),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(NewsletterEvent.objects.count(), 4)
+        stats = NewsletterStats.objects.get(newsletter=self.newsletter)
+        self.assertEqual(stats.delivered, 2)
+        self.assertEqual(stats.opened, 1)
+        self.assertEqual(stats.clicked, 1)
+
+    def test_counters_accumulate_across_batches(self):
+        """Test later batches add to the existing counters"""
+        self.post_events([self.event('e1', 'open')])
+        self.post_events([self.event('e2', 'open')])
+
+        stats = NewsletterStats.objects.get(newsletter=self.newsletter)
+        self.assertEqual(stats.opened, 2)
+
+    def test_redelivered_events_are_ignored(self):
+        """Test events SendGrid retries are not stored or counted twice"""
+        batch = [self.event('e1', 'delivered'), self.event('e2', 'open')]
+        self.post_events(batch)
+        self.post_events(batch + [self.event('e3', 'open')])
+
+        self.assertEqual(NewsletterEvent.objects.count(), 3)
+        stats = NewsletterStats.objects.get(newsletter=self.newsletter)
+        self.assertEqual(stats.delivered, 1)
+        self.assertEqual(stats.opened, 2)
+
+    def test_concurrent_redelivery_is_counted_once(self):
+        """Test events stored by another delivery while this one starts
+        are not counted again"""
+        batch = [self.event('e1', 'open'), self.event('e2', 'delivered')]
+        atomic = transaction.atomic
+        raced = []
+
+        def racing_atomic(*args, **kwargs):
+            # The other delivery commits just before this one's transaction
+            if not raced:
+                raced.append(True)
+                self.assertEqual(record_events(batch), 2)
+            return atomic(*args, **kwargs)
+
+        with patch('newsletter.webhook_handler.transaction.atomic',
+                   side_effect=racing_atomic):
+            self.assertEqual(record_events(batch), 0)
+
+        self.assertEqual(NewsletterEvent.objects.count(), 2)
+        stats = NewsletterStats.objects.get(newsletter=self.newsletter)
+        self.assertEqual(stats.opened, 1)
+        self.assertEqual(stats.delivered, 1)
+
+    def test_hard_bounces_deactivate_subscribers(self):
+        """Test hard bounces deactivate subscribers and soft ones don't"""
+        self.post_events([
+            self.event('e1', 'bounce', email='user0@example.com',
+                       type='bounce', reason='550 No such user'),
+            self.event('e2', 'bounce', email='user1@example.com',
+                       type='blocked'),
+        ])
+
+        states = dict(
+            NewsletterSubscriber.objects.values_list('user__email',
+                                                     'is_active'))
+        self.assertFalse(states['user0@example.com'])
+        self.assertTrue(states['user1@example.com'])
+        self.assertTrue(states['user2@example.com'])
+        stats = NewsletterStats.objects.get(newsletter=self.newsletter)
+        self.assertEqual(stats.bounced, 2)
+
+    def test_batch_writes_are_constant(self):
+        """Test the query count doesn't grow with the batch size"""
+        events = [
+            self.event(f'e{i}', 'bounce', email=f'user{i % 3}@example.com',
+                       type='bounce') for i in range(50)
+        ]
+        # Savepoints, lookups, stats insert and lock, bulk insert, stats
+        # update, and one subscriber update
+        with self.assertNumQueries(9):
+            self.post_events(events)
+        self.assertEqual(NewsletterEvent.objects.count(), 50)
+        self.assertFalse(
+            NewsletterSubscriber.objects.filter(is_active=True).exists())
+
+    def test_unknown_newsletter_is_not_counted(self):
+        """Test events for deleted newsletters are kept but not counted"""
+        self.post_events([self.event('e1', 'open', newsletter_id='999')])
+
+        event = NewsletterEvent.objects.get()
+        self.assertIsNone(event.newsletter)
+        self.assertFalse(NewsletterStats.objects.exists())
+
+    def test_invalid_signature_is_rejected(self):
+        """Test requests with a bad signature are rejected"""
+        other_key = PrivateKey(curve=prime256v1)
+        body = json.dumps([self.event('e1', 'open')])
+        timestamp = str(int(time.time()))
+        signature = Ecdsa.sign(timestamp + body, other_key).toBase64()
+
+        response = self.post_events([self.event('e1', 'open')],
+                                    timestamp=timestamp,
+                                    signature=signature)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(NewsletterEvent.objects.exists())
+
+    def test_stale_timestamp_is_rejected(self):
+        """Test old signed requests can't be replayed"""
+        response = self.post_events([self.event('e1', 'open')],
+                                    timestamp=int(time.time()) - 3600)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_public_key_is_rejected(self):
+        """Test the endpoint is closed until a verification key is set"""
+        with self.settings(SENDGRID_WEBHOOK_PUBLIC_KEY=None):
+            response = self.post_events([self.event('e1', 'open')])
+
+        self.assertEqual(response.status_code, 403)
+
+    @patch('newsletter.sendgrid_utils.get_sendgrid_client')
+    def test_outgoing_mail_carries_newsletter_id(self, mock_get_client):
+        """Test sent mails tag events with the newsletter id"""
+        mock_client = MagicMock()
+        mock_client.send.return_value = MagicMock(status_code=202)
+        mock_get_client.return_value = mock_client
+
+        send_newsletter_email(self.newsletter, [self.subscribers[0]])
+
+        message = mock_client.send.call_args[0][0]
+        custom_args = message.get()['custom_args']
+        self.assertEqual(custom_args['newsletter_id'],
+                         str(self.newsletter.pk))
@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep outbound email sends within the
+    provider's rate limits.
+
+    Tokens are refilled continuously at `rate` tokens per second up to
+    `capacity`. Each call to `acquire` blocks until a token is available.
+    A rate of None (or 0) disables throttling.
+    """
+
+    def __init__(self, rate=None, capacity=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = float(rate) if rate else None
+        # Allow short bursts of up to one second's worth of sends by default
+        self.capacity = float(capacity or max(self.rate or 1, 1))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accrued since the last refill."""
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` tokens if available, without blocking."""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens can be taken from the bucket."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                # Work out how long until enough tokens have accrued
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
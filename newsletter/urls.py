@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from . import webhooks
 
 app_name = 'newsletter'
 
@@ -8,4 +9,7 @@ urlpatterns = [
          views.unsubscribe_view,
          name='unsubscribe'),
     path('manage/', views.manage_subscription, name='manage_subscription'),
+    path('sendgrid-webhook/',
+         webhooks.sendgrid_webhook,
+         name='sendgrid_webhook'),
 ]
@@ -0,0 +1,146 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import (NewsletterEvent, NewsletterMail, NewsletterStats,
+                     NewsletterSubscriber)
+
+logger = logging.getLogger(__name__)
+
+# SendGrid event type -> NewsletterStats counter
+STATS_FIELDS = {
+    'processed': 'processed',
+    'delivered': 'delivered',
+    'open': 'opened',
+    'click': 'clicked',
+    'bounce': 'bounced',
+    'dropped': 'dropped',
+    'deferred': 'deferred',
+    'spamreport': 'spam_reports',
+    'unsubscribe': 'unsubscribed',
+    'group_unsubscribe': 'unsubscribed',
+}
+
+
+def _parse_newsletter_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromtimestamp(int(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return datetime.now(tz=dt_timezone.utc)
+
+
+def build_events(payload):
+    """
+    Turn SendGrid's event array into unsaved NewsletterEvent objects,
+    skipping malformed entries and duplicates within the batch.
+    """
+    events = {}
+    for item in payload:
+        if not isinstance(item, dict):
+            continue
+        event_id = item.get('sg_event_id')
+        event_type = item.get('event')
+        if not event_id or not event_type:
+            logger.warning(f"Skipping malformed SendGrid event: {item}")
+            continue
+        events[event_id] = NewsletterEvent(
+            newsletter_id=_parse_newsletter_id(item.get('newsletter_id')),
+            sg_event_id=event_id[:100],
+            sg_message_id=(item.get('sg_message_id') or '')[:255],
+            event=event_type[:30],
+            email=(item.get('email') or '')[:254],
+            reason=item.get('reason') or '',
+            bounce_type=(item.get('type') or '')[:20],
+            timestamp=_parse_timestamp(item.get('timestamp')))
+    return list(events.values())
+
+
+def is_hard_bounce(event):
+    """SendGrid reports soft bounces as 'blocked' and hard ones as 'bounce'."""
+    return event.event == 'bounce' and event.bounce_type in ('', 'bounce')
+
+
+def record_events(payload):
+    """
+    Store a batch of SendGrid events and apply their side effects.
+
+    Events already stored (SendGrid retries deliveries it thinks failed)
+    are dropped, the rest are written with one bulk insert, each
+    newsletter's counters are bumped with a single F-expression UPDATE,
+    and hard-bounced addresses are deactivated with one UPDATE. The
+    newsletters' counter rows are locked before stored events are looked
+    up, so concurrent deliveries of the same events count them once.
+
+    Returns the number of new events stored.
+    """
+    events = build_events(payload)
+    if not events:
+        return 0
+
+    # Custom args can outlive the newsletter they point at
+    newsletter_ids = {e.newsletter_id for e in events if e.newsletter_id}
+    if newsletter_ids:
+        newsletter_ids = set(
+            NewsletterMail.objects.filter(pk__in=newsletter_ids).values_list(
+                'pk', flat=True))
+    for event in events:
+        if event.newsletter_id not in newsletter_ids:
+            event.newsletter_id = None
+    counted_ids = {
+        e.newsletter_id
+        for e in events if e.newsletter_id and e.event in STATS_FIELDS
+    }
+
+    with transaction.atomic():
+        if counted_ids:
+            NewsletterStats.objects.bulk_create(
+                [NewsletterStats(newsletter_id=pk) for pk in counted_ids],
+                ignore_conflicts=True)
+            # Another delivery of these events waits here until it commits
+            list(
+                NewsletterStats.objects.select_for_update().filter(
+                    newsletter_id__in=counted_ids).order_by('pk').values_list(
+                        'pk', flat=True))
+
+        seen = set(
+            NewsletterEvent.objects.filter(
+                sg_event_id__in=[e.sg_event_id for e in events]).values_list(
+                    'sg_event_id', flat=True))
+        events = [e for e in events if e.sg_event_id not in seen]
+        if not events:
+            return 0
+        NewsletterEvent.objects.bulk_create(events,
+                                            batch_size=500,
+                                            ignore_conflicts=True)
+
+        counts = defaultdict(Counter)
+        for event in events:
+            field = STATS_FIELDS.get(event.event)
+            if event.newsletter_id and field:
+                counts[event.newsletter_id][field] += 1
+        now = timezone.now()
+        for newsletter_id, fields in counts.items():
+            NewsletterStats.objects.filter(newsletter_id=newsletter_id).update(
+                updated_at=now,
+                **{field: F(field) + n
+                   for field, n in fields.items()})
+
+        bounced_emails = {e.email for e in events if is_hard_bounce(e)}
+        if bounced_emails:
+            deactivated = NewsletterSubscriber.objects.filter(
+                is_active=True,
+                user__email__in=bounced_emails).update(is_active=False,
+                                                       updated_at=now)
+            logger.info(f"Deactivated {deactivated} hard-bounced subscribers")
+
+    logger.info(f"Recorded {len(events)} SendGrid events")
+    return len(events)
@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+from functools import lru_cache
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_POST
+from django.views.decorators.csrf import csrf_exempt
+from sendgrid.helpers.eventwebhook import EventWebhook
+from sendgrid.helpers.eventwebhook.eventwebhook_header import \
+    EventWebhookHeader
+from .webhook_handler import record_events
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def get_verifier(public_key):
+    """Parse the verification key once rather than on every request."""
+    return EventWebhook(public_key)
+
+
+def verify_signature(request):
+    """Check the request was signed by SendGrid recently."""
+    signature = request.headers.get(EventWebhookHeader.SIGNATURE)
+    timestamp = request.headers.get(EventWebhookHeader.TIMESTAMP)
+    if not signature or not timestamp:
+        return False
+
+    # Reject stale requests so captured payloads can't be replayed
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False
+    if age > settings.SENDGRID_WEBHOOK_TOLERANCE:
+        return False
+
+    try:
+        verifier = get_verifier(settings.SENDGRID_WEBHOOK_PUBLIC_KEY)
+        return verifier.verify_signature(request.body.decode('utf-8'),
+                                         signature, timestamp)
+    except Exception as e:
+        logger.error(f"Could not verify SendGrid signature: {e}")
+        return False
+
+
+@require_POST
+@csrf_exempt
+def sendgrid_webhook(request):
+    """Listen for batched delivery and engagement events from SendGrid"""
+    if not settings.SENDGRID_WEBHOOK_PUBLIC_KEY:
+        logger.error("SENDGRID_WEBHOOK_PUBLIC_KEY is not configured")
+        return HttpResponse(status=403)
+
+    if not verify_signature(request):
+        logger.error("Invalid SendGrid webhook signature")
+        return HttpResponse(status=403)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError as e:
+        logger.error(f"Invalid SendGrid webhook payload: {e}")
+        return HttpResponse(status=400)
+    if not isinstance(payload, list):
+        return HttpResponse(status=400)
+
+    record_events(payload)
+    return HttpResponse(status=200)
@@ -1,8 +1,23 @@
 from django.contrib import admin
+from .exports import export_response
 from .models import Order, OrderItem
 from rentals.models import CrashpadBooking
 
 
+def export_action(kind, fmt, description):
+    """
+    Admin action streaming the `kind` export of the selected orders, or of
+    all orders matching the changelist filters with "select all".
+    """
+
+    def action(modeladmin, request, queryset):
+        return export_response(request, kind, fmt, orders=queryset)
+
+    action.__name__ = f"export_{kind}_{fmt}"
+    action.short_description = description
+    return action
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     readonly_fields = ('price', 'item_total')
@@ -42,6 +57,16 @@ class OrderAdmin(admin.ModelAdmin):
 
     list_filter = ('date_created', 'country', 'order_type')
 
+    actions = (
+        export_action('orders', 'csv', 'Export orders as CSV'),
+        export_action('items', 'csv', 'Export order items as CSV'),
+        export_action('bookings', 'csv', 'Export crashpad bookings as CSV'),
+        export_action('orders', 'jsonl', 'Export orders as JSON Lines'),
+        export_action('items', 'jsonl', 'Export order items as JSON Lines'),
+        export_action('bookings', 'jsonl',
+                      'Export crashpad bookings as JSON Lines'),
+    )
+
     fieldsets = (
         ('Order Details', {
             'fields': ('order_number', 'id', 'date_created', 'date_updated',
@@ -73,11 +98,10 @@ class OrderAdmin(admin.ModelAdmin):
     def delete_queryset(self, request, queryset):
         """
         Override the bulk deletion method to ensure stock is released
-        for each order being deleted
+        for the orders being deleted
         """
-        # Process each order individually to ensure stock release
-        for order in queryset:
-            order.delete()  # This will call our custom delete method
+        # OrderQuerySet.delete releases the stock of all orders at once
+        queryset.delete()
 
 
 @admin.register(OrderItem)
@@ -0,0 +1,150 @@
+"""
+Accounting exports of orders, order items and crashpad bookings.
+
+Rows are read with `values_list(...).iterator(chunk_size=...)`, joining
+the few related columns needed in the same query, and written out one at a
+time as CSV or JSON Lines. Nothing is held in memory beyond a chunk, so
+exports of any size can be streamed to a file or an HTTP response, and a
+CSV header goes out before the first query has even run.
+
+Under ASGI, Django buffers a sync iterator into a list before streaming
+it, so responses to ASGI requests read the rows a chunk at a time in a
+thread instead.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rentals.models import CrashpadBooking
+from .models import Order, OrderItem
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+# kind: (model, path from the model to its order, exported columns)
+EXPORTS = {
+    'orders': (Order, '', (
+        'order_number', 'date_created', 'first_name', 'last_name', 'email',
+        'country', 'order_type', 'order_total', 'delivery_cost',
+        'handling_fee', 'grand_total', 'stripe_piid')),
+    'items': (OrderItem, 'order__', (
+        'order__order_number', 'order__date_created', 'product_id',
+        'product__name', 'quantity', 'item_total')),
+    'bookings': (CrashpadBooking, 'order__', (
+        'order__order_number', 'order__date_created', 'crashpad_id',
+        'crashpad__name', 'check_in', 'check_out', 'rental_days',
+        'daily_rate', 'total_price', 'status')),
+}
+
+
+class Echo:
+    """A file-like object whose write() just returns what it's given."""
+
+    def write(self, value):
+        return value
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(kind, start=None, end=None, orders=None):
+    """
+    The rows to export for `kind`, for orders placed from `start` to `end`
+    (inclusive dates), or belonging to the `orders` queryset.
+    """
+    model, to_order, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    # Compare with datetimes, not __date, so the date_created index can
+    # be used
+    if start:
+        queryset = queryset.filter(
+            **{f"{to_order}date_created__gte": _day_start(start)})
+    if end:
+        queryset = queryset.filter(**{
+            f"{to_order}date_created__lt":
+            _day_start(end + timedelta(days=1))
+        })
+    if orders is not None:
+        queryset = queryset.filter(
+            **{f"{to_order}pk__in": orders.values('pk')})
+    return queryset.order_by(f"{to_order}date_created", 'pk').values_list(
+        *columns)
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # As a string, so amounts keep their exact value in JSON
+        return str(value)
+    return value
+
+
+def _formatter(kind, fmt):
+    """
+    The header line of the `kind` export in `fmt`, if it has one, and a
+    function formatting a row as a line.
+    """
+    headers = [column.replace('__', '_') for column in EXPORTS[kind][2]]
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        return writer.writerow(headers), lambda row: writer.writerow(
+            [_serialize(value) for value in row])
+    if fmt == 'jsonl':
+        return None, lambda row: json.dumps(
+            dict(zip(headers, (_serialize(value) for value in row)))) + '\n'
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def stream_export(kind, fmt='csv', chunk_size=CHUNK_SIZE, **filters):
+    """Yield the export of `kind` line by line, header first."""
+    header, format_row = _formatter(kind, fmt)
+    rows = export_queryset(kind, **filters).iterator(chunk_size=chunk_size)
+
+    if header is not None:
+        yield header
+    for row in rows:
+        yield format_row(row)
+
+
+async def astream_export(kind, fmt='csv', chunk_size=CHUNK_SIZE,
+                         **filters):
+    """
+    Asynchronously yield the export of `kind` line by line, header first.
+    Django 4.2's aiterator() runs values_list() queries in the event loop,
+    so the rows are fetched a chunk at a time with sync_to_async instead.
+    """
+    header, format_row = _formatter(kind, fmt)
+    rows = export_queryset(kind, **filters).iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+
+    if header is not None:
+        yield header
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield format_row(row)
+
+
+def export_response(request, kind, fmt='csv', **filters):
+    """Stream an export as a file download."""
+    content_type, extension = FORMATS[fmt]
+    # A sync iterator would be read in full before an ASGI response starts
+    stream = (astream_export if isinstance(request, ASGIRequest) else
+              stream_export)
+    response = StreamingHttpResponse(stream(kind, fmt, **filters),
+                                     content_type=content_type)
+    filename = f"{kind}-{timezone.localdate():%Y%m%d}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,68 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from orders.exports import EXPORTS, FORMATS, CHUNK_SIZE, stream_export
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if not parsed:
+        raise CommandError(f"Invalid date {value}, expected YYYY-MM-DD")
+    return parsed
+
+
+def _month(value):
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        return date(year, month, 1)
+    except ValueError:
+        raise CommandError(f"Invalid month {value}, expected YYYY-MM")
+
+
+class Command(BaseCommand):
+    help = ('Export orders, order items or crashpad bookings for '
+            'accounting, streamed as CSV or JSON Lines.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format',
+                            choices=sorted(FORMATS),
+                            default='csv',
+                            help='Output format (default: %(default)s)')
+        parser.add_argument('--start',
+                            type=_date,
+                            help='First order date included (YYYY-MM-DD)')
+        parser.add_argument('--end',
+                            type=_date,
+                            help='Last order date included (YYYY-MM-DD)')
+        parser.add_argument(
+            '--month',
+            type=_month,
+            help='Export a whole month (YYYY-MM) instead of --start/--end')
+        parser.add_argument('--output',
+                            help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            default=CHUNK_SIZE,
+                            help='Rows fetched per query (default: '
+                            '%(default)s)')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if options['month']:
+            start = options['month']
+            next_month = date(start.year + start.month // 12,
+                              start.month % 12 + 1, 1)
+            end = date.fromordinal(next_month.toordinal() - 1)
+
+        lines = stream_export(options['kind'],
+                              options['format'],
+                              chunk_size=options['chunk_size'],
+                              start=start,
+                              end=end)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
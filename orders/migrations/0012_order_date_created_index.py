@@ -0,0 +1,18 @@
+# Generated by Django 4.2.18 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='date_created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
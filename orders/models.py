@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum, prefetch_related_objects
 from shop.models import Product
+from shop.reservations import return_stock
 from django.conf import settings
 from django_countries.fields import CountryField
 import uuid
@@ -11,6 +13,29 @@ from django.contrib.auth.models import User
 logger = logging.getLogger(__name__)
 
 
+class OrderQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Delete the orders, with their items and bookings, releasing the
+        ordered product stock and taking them out of the sales rollups.
+        The quantities to release are summed per product in one query and
+        added back in one UPDATE, however many orders are deleted.
+        """
+        # Imported here as the reports app depends on this one
+        from reports.rollups import removing_orders
+        with transaction.atomic(), removing_orders(self):
+            released = dict(
+                OrderItem.objects.filter(order__in=self).order_by().values(
+                    'product_id').annotate(total=Sum('quantity')).values_list(
+                        'product_id', 'total'))
+            return_stock(released)
+            deleted = super().delete()
+        logger.info(f"Deleted {deleted[1].get(self.model._meta.label, 0)} "
+                    f"orders, released stock: {released}")
+        return deleted
+
+
 class Order(models.Model):
     """Order model holding successful order details"""
     ORDER_TYPES = [
@@ -39,7 +64,7 @@ class Order(models.Model):
     town_or_city = models.CharField(max_length=100, null=False, blank=False)
     postal_code = models.CharField(max_length=20, null=False, blank=False)
     country = CountryField(blank_label="Country *", null=False, blank=False)
-    date_created = models.DateTimeField(auto_now_add=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
     date_updated = models.DateTimeField(auto_now=True)
     stripe_piid = models.CharField(
         max_length=255,
@@ -67,6 +92,8 @@ class Order(models.Model):
                                        default=0)
     comments = models.TextField(null=True, blank=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ("-date_created", )
 
@@ -131,38 +158,26 @@ class Order(models.Model):
                             (self.handling_fee or Decimal('0')))
         self.save()
 
+    def prefetch_lines(self):
+        """
+        Load the order's items and bookings, with their products and
+        crashpads, up front so templates listing them don't query per line
+        """
+        prefetch_related_objects([self], 'items__product',
+                                 'crashpads__crashpad')
+        return self
+
     def delete(self, *args, **kwargs):
         """
         Override the delete method to release product stock
         before deleting the order
         """
-        try:
-            logger.info(
-                f"Starting delete process for order {self.order_number}")
-            # Release stock for each order item
-            items_count = self.items.count()
-            logger.info(f"Found {items_count} items to process")
-
-            for order_item in self.items.all():
-                product = order_item.product
-                old_stock = product.stock
-                product.stock += order_item.quantity
-                product.save()
-                logger.info(
-                    f"Released {order_item.quantity} units back to stock "
-                    f"for product {product.name} "
-                    f"(ID: {product.id}) from deleted order "
-                    f"{self.order_number}. "
-                    f"Stock changed from {old_stock} to {product.stock}")
-        except Exception as e:
-            logger.error(f"Error releasing stock for "
-                         f"order {self.order_number}: {e}")
-            # Re-raise the exception to prevent deletion if stock release fails
-            raise
-
-        # Finally call the delete method
-        logger.info(f"Proceeding with deletion of order {self.order_number}")
-        super().delete(*args, **kwargs)
+        if self.pk is None:
+            # Let Django raise its usual error for unsaved orders
+            return super().delete(*args, **kwargs)
+        logger.info(f"Starting delete process for order {self.order_number}")
+        # Shares the bulk path, which releases the stock in one UPDATE
+        return type(self).objects.filter(pk=self.pk).delete()
 
     def __str__(self):
         return f"Order {self.order_number}"
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
+from orders import exports
+from orders.exports import stream_export
+from orders.models import Order, OrderItem
+from rentals.models import Crashpad, CrashpadBooking
+from shop.models import Product
+
+
+class OrderExportTest(TestCase):
+
+    def setUp(self):
+        """Set up an order in September and one in October"""
+        self.product = baker.make(Product, name='Chalk', price=Decimal('5'))
+        self.crashpad = baker.make(Crashpad, name='Big Pad')
+        self.september = baker.make(Order, grand_total=Decimal('12.50'))
+        self.october = baker.make(Order, grand_total=Decimal('20.00'))
+        Order.objects.filter(pk=self.september.pk).update(
+            date_created=timezone.make_aware(
+                datetime(2026, 9, 30, 23, 30)))
+        Order.objects.filter(pk=self.october.pk).update(
+            date_created=timezone.make_aware(
+                datetime(2026, 10, 1, 0, 30)))
+        for order in (self.september, self.october):
+            baker.make(OrderItem, order=order, product=self.product,
+                       quantity=2)
+        baker.make(CrashpadBooking,
+                   order=self.october,
+                   crashpad=self.crashpad,
+                   check_in=date.today() + timedelta(days=5),
+                   check_out=date.today() + timedelta(days=7))
+
+    def read_csv(self, lines):
+        return list(csv.reader(io.StringIO(''.join(lines))))
+
+    def test_csv_export(self):
+        """Test orders are exported as CSV with a header, oldest first"""
+        rows = self.read_csv(stream_export('orders'))
+        self.assertEqual(rows[0][:2], ['order_number', 'date_created'])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [self.september.order_number,
+                          self.october.order_number])
+        self.assertEqual(rows[1][10], '12.50')
+
+    def test_date_range_uses_local_dates(self):
+        """Test the date range covers whole local days"""
+        rows = self.read_csv(
+            stream_export('items',
+                          start=date(2026, 10, 1),
+                          end=date(2026, 10, 31)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], self.october.order_number)
+        self.assertEqual(rows[1][3], 'Chalk')
+
+    def test_jsonl_export(self):
+        """Test bookings are exported one JSON object per line"""
+        lines = list(stream_export('bookings', 'jsonl'))
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['crashpad_name'], 'Big Pad')
+        self.assertEqual(record['order_order_number'],
+                         self.october.order_number)
+
+    def test_export_is_lazy(self):
+        """Test the CSV header is produced before any query runs"""
+        lines = stream_export('orders')
+        with self.assertNumQueries(0):
+            next(lines)
+        # All rows come from a single query
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(lines)), 2)
+
+    def test_command_exports_month(self):
+        """Test the command exports a whole month"""
+        out = io.StringIO()
+        call_command('export_orders', 'orders', '--month=2026-09',
+                     stdout=out)
+        rows = self.read_csv([out.getvalue()])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [self.september.order_number])
+
+    def test_admin_action_streams_export(self):
+        """Test the admin action streams the selected orders"""
+        admin = User.objects.create_superuser('admin', 'a@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:orders_order_changelist'), {
+                'action': 'export_orders_csv',
+                '_selected_action': [self.october.pk],
+            })
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = self.read_csv(
+            [chunk.decode() for chunk in response.streaming_content])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [self.october.order_number])
+
+    async def test_admin_action_streams_under_asgi(self):
+        """Test an ASGI request's export is read as it is sent, not
+        buffered in full first"""
+        admin = await sync_to_async(User.objects.create_superuser)(
+            'admin', 'a@example.com', 'pw')
+        await sync_to_async(self.async_client.force_login)(admin)
+        response = await self.async_client.post(
+            reverse('admin:orders_order_changelist'), {
+                'action': 'export_orders_csv',
+                '_selected_action': [self.september.pk, self.october.pk],
+            })
+        self.assertTrue(response.is_async)
+
+        with patch('orders.exports._serialize',
+                   wraps=exports._serialize) as serialize:
+            chunks = aiter(response.streaming_content)
+            header = await anext(chunks)
+            # Buffered, every row would be read and formatted by now
+            self.assertEqual(serialize.call_count, 0)
+            rest = [chunk async for chunk in chunks]
+            self.assertEqual(serialize.call_count,
+                             2 * len(exports.EXPORTS['orders'][2]))
+
+        rows = self.read_csv(
+            [chunk.decode() for chunk in [header, *rest]])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [self.september.order_number,
+                          self.october.order_number])
@@ -1,11 +1,14 @@
 from decimal import Decimal
+from datetime import date, timedelta
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
+from django.db import connection
 from model_bakery import baker
 from orders.models import Order, OrderItem
 from shop.models import Product
 from django.contrib.auth.models import User
-from rentals.models import CrashpadBooking
+from rentals.models import Crashpad, CrashpadBooking
 import uuid
 
 
@@ -128,6 +131,47 @@ class TestOrderModel(TestCase):
         # Stock should be increased by the quantity in the order
         self.assertEqual(self.product.stock, initial_stock + 3)
 
+    def make_orders(self, count, other_product, crashpad):
+        orders = baker.make(Order, _quantity=count)
+        for i, order in enumerate(orders):
+            baker.make(OrderItem, order=order, product=self.product,
+                       quantity=1)
+            baker.make(OrderItem, order=order, product=other_product,
+                       quantity=2)
+            check_in = date.today() + timedelta(days=10 * i + 10)
+            baker.make(CrashpadBooking, order=order, crashpad=crashpad,
+                       check_in=check_in,
+                       check_out=check_in + timedelta(days=2))
+        return Order.objects.filter(pk__in=[order.pk for order in orders])
+
+    def test_bulk_delete_releases_stock(self):
+        """Test deleting a queryset of orders releases all their stock"""
+        other_product = baker.make(Product, price=Decimal('5.00'), stock=0)
+        crashpad = baker.make(Crashpad)
+        orders = self.make_orders(4, other_product, crashpad)
+
+        orders.delete()
+
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertEqual(self.product.stock, 14)
+        self.assertEqual(other_product.stock, 8)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(CrashpadBooking.objects.exists())
+
+    def test_bulk_delete_queries_dont_grow_with_orders(self):
+        """Test bulk deletion uses the same queries for 2 or 10 orders"""
+        other_product = baker.make(Product, price=Decimal('5.00'), stock=0)
+        crashpad = baker.make(Crashpad)
+        counts = []
+        for count in (2, 10):
+            orders = self.make_orders(count, other_product, crashpad)
+            with CaptureQueriesContext(connection) as queries:
+                orders.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
     def test_determine_order_type(self):
         """Test the _determine_order_type method"""
         # Instead of trying to mock the related managers directly,
@@ -0,0 +1,353 @@
+"""
+A local stand-in for the parts of the Stripe API checkout uses.
+
+Emulates PaymentIntents (create, retrieve, update and confirm) and sends
+`payment_intent.succeeded` / `payment_intent.payment_failed` webhooks,
+signed with the configured webhook secret, to the site once a payment is
+confirmed. Used to load-test checkout without contacting Stripe: point the
+Stripe library at it by setting STRIPE_API_BASE to its url.
+
+Confirming a PaymentIntent (`POST /v1/payment_intents/<id>/confirm`)
+stands in for what Stripe.js does in the browser when the customer pays.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_FIELDS = ('city', 'country', 'line1', 'line2', 'postal_code', 'state')
+
+INTENT_PATH = re.compile(
+    r'^/v1/payment_intents(?:/(?P<id>pi_\w+)(?P<confirm>/confirm)?)?/?$')
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """The Stripe-Signature header for `payload` (bytes)."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(),
+                         f"{timestamp}.".encode() + payload,
+                         hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def parse_form(body):
+    """
+    Decode the form encoding the Stripe library sends, where nested
+    values are keyed like `shipping[address][city]` and lists like
+    `payment_method_types[0]`.
+    """
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return _lists(data)
+
+
+def _lists(value):
+    if not isinstance(value, dict):
+        return value
+    if value and all(key.isdigit() for key in value):
+        return [_lists(value[key]) for key in sorted(value, key=int)]
+    return {key: _lists(item) for key, item in value.items()}
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Answer PaymentIntent requests the way Stripe would."""
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_form(self.rfile.read(length).decode())
+        match = INTENT_PATH.match(urlsplit(self.path).path)
+        if not match:
+            self._error(404, 'invalid_request_error',
+                        f"Unrecognized request URL ({method}: {self.path})")
+            return
+
+        # Simulate the provider's response time
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.random.random() < server.error_rate:
+            server.record('errors')
+            self._error(500, 'api_error', 'Internal error')
+            return
+
+        intent_id = match.group('id')
+        if intent_id is None:
+            if method != 'POST':
+                self._error(405, 'invalid_request_error', 'Not allowed')
+                return
+            self._respond(200, server.create_intent(params))
+            return
+
+        intent = server.get_intent(intent_id)
+        if intent is None:
+            self._error(404,
+                        'invalid_request_error',
+                        f"No such payment_intent: '{intent_id}'",
+                        code='resource_missing')
+        elif method == 'GET':
+            server.record('retrieved')
+            self._respond(200, intent)
+        elif match.group('confirm'):
+            if intent['status'] == 'succeeded':
+                self._error(400,
+                            'invalid_request_error',
+                            'This PaymentIntent has already succeeded.',
+                            code='payment_intent_unexpected_state')
+                return
+            self._respond(200, server.confirm_intent(intent_id))
+        else:
+            self._respond(200, server.update_intent(intent_id, params))
+
+    def _error(self, status, error_type, message, code=None):
+        error = {'type': error_type, 'message': message}
+        if code:
+            error['code'] = code
+        self._respond(status, {'error': error})
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', f"req_{secrets.token_hex(7)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load
+        logger.debug(format, *args)
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """
+    Threaded fake Stripe server.
+
+    Args:
+        address (tuple): (host, port) to bind. Port 0 picks a free port.
+        webhook_url (str, optional): Where to send webhooks once payments
+            are confirmed. None sends none.
+        webhook_secret (str): Secret the webhooks are signed with.
+        latency (float): Seconds to wait before answering each request.
+        error_rate (float): Fraction of requests answered with a 500.
+        decline_rate (float): Fraction of confirmations declined.
+        webhook_delay (float): Seconds between a confirmation and its
+            webhook, as Stripe delivers them asynchronously.
+        duplicate_rate (float): Fraction of webhooks delivered twice, as
+            Stripe may do.
+        seed (int, optional): Seed for the random rates.
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 address=('127.0.0.1', 0),
+                 webhook_url=None,
+                 webhook_secret='whsec_fake',
+                 latency=0.0,
+                 error_rate=0.0,
+                 decline_rate=0.0,
+                 webhook_delay=0.0,
+                 duplicate_rate=0.0,
+                 seed=None):
+        super().__init__(address, FakeStripeHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.webhook_delay = webhook_delay
+        self.duplicate_rate = duplicate_rate
+        self.random = random.Random(seed)
+        self.intents = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._deliveries = []
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {
+                'created': 0,
+                'updated': 0,
+                'retrieved': 0,
+                'succeeded': 0,
+                'declined': 0,
+                'errors': 0,
+                'webhooks': 0,
+                'webhook_failures': 0,
+            }
+            self.webhook_latencies = []
+
+    def record(self, outcome, latency=None):
+        with self._lock:
+            self.stats[outcome] += 1
+            if latency is not None:
+                self.webhook_latencies.append(latency)
+
+    def get_intent(self, intent_id):
+        """A copy of the PaymentIntent `intent_id`, or None."""
+        with self._lock:
+            intent = self.intents.get(intent_id)
+            return json.loads(json.dumps(intent)) if intent else None
+
+    def create_intent(self, params):
+        intent_id = f"pi_fake{secrets.token_hex(12)}"
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'eur'),
+            'client_secret': f"{intent_id}_secret_{secrets.token_hex(12)}",
+            'created': int(time.time()),
+            'livemode': False,
+            'metadata': {},
+            'payment_method_types': params.get('payment_method_types',
+                                               ['card']),
+            'receipt_email': None,
+            'shipping': None,
+            'last_payment_error': None,
+            'status': 'requires_payment_method',
+        }
+        with self._lock:
+            self.intents[intent_id] = intent
+        self.record('created')
+        return self._update(intent_id, params)
+
+    def update_intent(self, intent_id, params):
+        self.record('updated')
+        return self._update(intent_id, params)
+
+    def _update(self, intent_id, params):
+        with self._lock:
+            intent = self.intents[intent_id]
+            for field in ('amount', 'currency', 'receipt_email', 'shipping'):
+                if field in params:
+                    intent[field] = params[field]
+            if intent['shipping']:
+                # Stripe returns every address field, blank ones as null
+                address = intent['shipping'].get('address', {})
+                intent['shipping']['address'] = {
+                    field: address.get(field) or None
+                    for field in ADDRESS_FIELDS
+                }
+            intent['amount'] = int(intent['amount'])
+            # Metadata is merged; an empty value removes the key
+            for key, value in params.get('metadata', {}).items():
+                if value == '':
+                    intent['metadata'].pop(key, None)
+                else:
+                    intent['metadata'][key] = value
+            return json.loads(json.dumps(intent))
+
+    def confirm_intent(self, intent_id):
+        """Pay `intent_id` and send the webhook for the outcome."""
+        declined = self.random.random() < self.decline_rate
+        with self._lock:
+            intent = self.intents[intent_id]
+            if declined:
+                intent['last_payment_error'] = {
+                    'code': 'card_declined',
+                    'message': 'Your card was declined.',
+                }
+            else:
+                intent['status'] = 'succeeded'
+                intent['last_payment_error'] = None
+            snapshot = json.loads(json.dumps(intent))
+        self.record('declined' if declined else 'succeeded')
+
+        if self.webhook_url:
+            event_type = ('payment_intent.payment_failed'
+                          if declined else 'payment_intent.succeeded')
+            event = self.build_event(event_type, snapshot)
+            copies = 2 if self.random.random() < self.duplicate_rate else 1
+            for _ in range(copies):
+                delivery = threading.Thread(target=self.deliver,
+                                            args=(event, ),
+                                            name='fake-stripe-webhook',
+                                            daemon=True)
+                with self._lock:
+                    self._deliveries.append(delivery)
+                delivery.start()
+        return snapshot
+
+    def build_event(self, event_type, intent):
+        return {
+            'id': f"evt_fake{secrets.token_hex(12)}",
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'livemode': False,
+            'data': {
+                'object': intent
+            },
+        }
+
+    def deliver(self, event):
+        """POST the signed `event` to the webhook url."""
+        if self.webhook_delay:
+            time.sleep(self.webhook_delay)
+        payload = json.dumps(event).encode()
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=payload,
+            headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign_payload(payload,
+                                                 self.webhook_secret),
+            })
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+            self.record('webhooks', time.perf_counter() - start)
+        except Exception as e:
+            logger.warning(f"Webhook {event['type']} for "
+                           f"{event['data']['object']['id']} failed: {e}")
+            self.record('webhook_failures', time.perf_counter() - start)
+
+    def wait_for_webhooks(self, timeout=None):
+        """Wait until every webhook sent so far has been delivered."""
+        with self._lock:
+            deliveries = list(self._deliveries)
+        for delivery in deliveries:
+            delivery.join(timeout)
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name='fake-stripe',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
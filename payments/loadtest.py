@@ -0,0 +1,299 @@
+"""
+Checkout load test.
+
+Virtual users go through checkout the way a browser does: add a product,
+and for some a crashpad, to the cart, open checkout, submit the order
+form, pay at the fake Stripe (see `payments.fake_stripe`) and land on the
+success page while the fake Stripe sends the webhook. Each user has its
+own session and every step is timed.
+
+Afterwards the database is checked for what must never happen however
+many customers check out at once: stock or crashpad dates sold twice,
+payments without an order, and orders with lines written twice.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from django.db.models import Count, Sum
+from django.urls import reverse
+import requests
+from orders.models import Order, OrderItem
+from rentals.models import CrashpadBooking
+
+logger = logging.getLogger(__name__)
+
+STEPS = ('shop', 'add_product', 'add_rental', 'checkout', 'metadata',
+         'pay', 'success')
+OUTCOMES = ('ordered', 'sold_out', 'declined', 'failed')
+
+CLIENT_SECRET = re.compile(r'id="stripe-client-secret"[^>]*value="([^"]+)"'
+                           r'|value="([^"]+)"[^>]*id="stripe-client-secret"')
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+ORDER_FORM = {
+    'first_name': 'Load',
+    'last_name': 'Test',
+    'phone': '99123456',
+    'address_line1': '1 Test Street',
+    'address_line2': '',
+    'town_or_city': 'Nicosia',
+    'postal_code': '1010',
+    'country': 'CY',
+    'comments': '',
+}
+
+
+class StepFailed(Exception):
+    """A step answered with an error or an unexpected page."""
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class VirtualUser:
+    """A stream of customers checking out one after the other."""
+
+    def __init__(self, load_test, number):
+        self.load_test = load_test
+        self.number = number
+        self.random = random.Random(f"{load_test.seed}-{number}")
+        self.session = None
+
+    def url(self, name):
+        return f"{self.load_test.base_url}{reverse(name)}"
+
+    def request(self, step, method, url, **kwargs):
+        """Make the request for `step`, timing it."""
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=120,
+                                            **kwargs)
+        except requests.RequestException as e:
+            self.load_test.record(step, time.perf_counter() - start, False)
+            raise StepFailed(f"{step}: {e}")
+        ok = response.status_code < 400
+        self.load_test.record(step, time.perf_counter() - start, ok)
+        # The site sets Secure cookies, which a browser also sends to a
+        # local http server
+        for cookie in self.session.cookies:
+            cookie.secure = False
+        if not ok:
+            raise StepFailed(f"{step}: HTTP {response.status_code}")
+        return response
+
+    def csrf_token(self, response):
+        match = CSRF_TOKEN.search(response.text)
+        return match.group(1) if match else self.session.cookies.get(
+            'csrftoken', '')
+
+    def checkout(self):
+        """Check out once as a new customer; return the outcome."""
+        load_test = self.load_test
+        self.session = requests.Session()
+        # Starting on the shop page sets the CSRF cookie
+        response = self.request('shop', 'GET', self.url('shop'))
+        token = self.csrf_token(response)
+
+        product = self.random.choice(load_test.product_ids)
+        response = self.request(
+            'add_product', 'POST',
+            f"{load_test.base_url}{reverse('cart_add', args=['product'])}",
+            data={
+                'product_id': product,
+                'quantity': self.random.randint(1, 2),
+                'csrfmiddlewaretoken': token,
+            })
+        if not response.url.endswith(reverse('cart_detail')):
+            return 'sold_out'
+
+        if (load_test.crashpad_ids
+                and self.random.random() < load_test.rental_share):
+            self.request(
+                'add_rental', 'POST',
+                f"{load_test.base_url}{reverse('cart_add', args=['rental'])}",
+                json={
+                    'crashpad_ids': [self.random.choice(
+                        load_test.crashpad_ids)],
+                    'check_in': load_test.check_in.isoformat(),
+                    'check_out': load_test.check_out.isoformat(),
+                },
+                headers={'X-CSRFToken': token})
+
+        response = self.request('checkout', 'GET', self.url('checkout'))
+        match = CLIENT_SECRET.search(response.text)
+        if not match:
+            # Sent back to the cart: sold out, or dates taken, meanwhile
+            return 'sold_out'
+        client_secret = match.group(1) or match.group(2)
+        intent_id = client_secret.split('_secret_')[0]
+
+        self.request(
+            'metadata', 'POST', self.url('store_order_metadata'),
+            data={
+                **ORDER_FORM,
+                'email': f"loadtest{self.number}@example.test",
+                'stripe-client-secret': client_secret,
+                'csrfmiddlewaretoken': self.csrf_token(response),
+            })
+
+        # What Stripe.js does when the customer pays
+        intent = self.request(
+            'pay', 'POST',
+            f"{load_test.stripe_url}/v1/payment_intents/{intent_id}/confirm"
+        ).json()
+        if intent['status'] != 'succeeded':
+            return 'declined'
+        load_test.paid(intent_id)
+
+        response = self.request(
+            'success', 'GET', self.url('checkout_success'),
+            params={'payment_intent': intent_id,
+                    'redirect_status': 'succeeded'})
+        if not response.url.split('?')[0].endswith(
+                reverse('checkout_success')):
+            raise StepFailed(f"success: sent to {response.url}")
+        return 'ordered'
+
+
+class LoadTest:
+    """
+    Run `users` concurrent virtual users through `journeys` checkouts
+    each, buying the products with `product_ids` and renting the crashpads
+    with `crashpad_ids` from `check_in` to `check_out`.
+    """
+
+    def __init__(self,
+                 base_url,
+                 stripe_url,
+                 product_ids,
+                 crashpad_ids=(),
+                 check_in=None,
+                 check_out=None,
+                 users=10,
+                 journeys=5,
+                 rental_share=0.3,
+                 seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.stripe_url = stripe_url.rstrip('/')
+        self.product_ids = list(product_ids)
+        self.crashpad_ids = list(crashpad_ids)
+        self.check_in = check_in
+        self.check_out = check_out
+        self.users = users
+        self.journeys = journeys
+        self.rental_share = rental_share
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.paid_intents = set()
+        self.failures = []
+
+    def record(self, step, seconds, ok):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+    def paid(self, intent_id):
+        with self._lock:
+            self.paid_intents.add(intent_id)
+
+    def run_user(self, number):
+        user = VirtualUser(self, number)
+        for _ in range(self.journeys):
+            try:
+                outcome = user.checkout()
+            except StepFailed as e:
+                outcome = 'failed'
+                with self._lock:
+                    self.failures.append(str(e))
+            with self._lock:
+                self.outcomes[outcome] += 1
+
+    def run(self):
+        """Run every user to completion; return the elapsed seconds."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.users) as executor:
+            list(executor.map(self.run_user, range(self.users)))
+        return time.perf_counter() - start
+
+    def step_stats(self):
+        """[(step, requests, errors, p50, p95, p99)], latencies in s."""
+        return [(step, len(self.latencies[step]), self.errors[step],
+                 percentile(self.latencies[step], 50),
+                 percentile(self.latencies[step], 95),
+                 percentile(self.latencies[step], 99))
+                for step in STEPS if self.latencies[step]]
+
+
+def check_integrity(products, crashpad_ids, paid_intents):
+    """
+    What went wrong after a load test.
+
+    Args:
+        products (dict): {product id: stock before the test}.
+        crashpad_ids (iterable): The crashpads that could be rented.
+        paid_intents (set): The PaymentIntents that were paid.
+
+    Returns:
+        dict: Lists of oversold products, double-booked crashpads,
+        payments without an order and orders with duplicated lines.
+    """
+    sold = dict(
+        OrderItem.objects.filter(product_id__in=products).values(
+            'product_id').annotate(units=Sum('quantity')).values_list(
+                'product_id', 'units'))
+    oversold = [
+        f"product {pk}: sold {sold[pk]} of {stock}"
+        for pk, stock in products.items() if sold.get(pk, 0) > stock
+    ]
+
+    bookings = defaultdict(list)
+    for booking in CrashpadBooking.objects.filter(
+            crashpad_id__in=crashpad_ids, status='confirmed').only(
+                'id', 'crashpad_id', 'check_in', 'check_out'):
+        bookings[booking.crashpad_id].append(booking)
+    double_booked = [
+        f"crashpad {pk}: bookings {a.pk} and {b.pk}"
+        for pk, booked in bookings.items()
+        for a, b in combinations(booked, 2)
+        if a.check_in <= b.check_out and b.check_in <= a.check_out
+    ]
+
+    ordered = set(
+        Order.objects.filter(stripe_piid__in=paid_intents).values_list(
+            'stripe_piid', flat=True))
+    missing_orders = sorted(paid_intents - ordered)
+
+    duplicate_items = OrderItem.objects.filter(
+        order__stripe_piid__in=paid_intents).values(
+            'order_id', 'product_id').annotate(
+                lines=Count('id')).filter(lines__gt=1)
+    duplicate_bookings = CrashpadBooking.objects.filter(
+        order__stripe_piid__in=paid_intents).values(
+            'order_id', 'crashpad_id').annotate(
+                lines=Count('id')).filter(lines__gt=1)
+    duplicate_lines = [
+        f"order {row['order_id']}: {row['lines']} lines for one item"
+        for row in list(duplicate_items) + list(duplicate_bookings)
+    ]
+
+    return {
+        'oversold': oversold,
+        'double_booked': double_booked,
+        'missing_orders': missing_orders,
+        'duplicate_lines': duplicate_lines,
+    }
@@ -0,0 +1,271 @@
+import logging
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+import stripe
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler,
+                                          get_internal_wsgi_application)
+from django.db.models import Q
+from django.test.utils import override_settings
+from django.urls import reverse
+from orders.models import Order, OrderItem
+from payments.fake_stripe import FakeStripeServer
+from payments.loadtest import LoadTest, check_integrity, percentile
+from rentals.models import Crashpad, CrashpadBooking
+from shop.models import Product
+
+SEED_PREFIX = 'Load test'
+WEBHOOK_SECRET = 'whsec_loadtest'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Load-test checkout: concurrent users add to cart, check out, '
+            'pay at a local fake Stripe and reach the success page while '
+            'the webhook is delivered. Seeds products with limited stock '
+            'and crashpads for the same dates so users compete for them, '
+            'then reports throughput, latency per step, oversold stock, '
+            'double-booked crashpads, payments without an order and '
+            'duplicated order lines. Exits with an error if any of these '
+            'is found.\n'
+            'By default the site and fake Stripe run in-process, with '
+            'emails discarded. Use --base-url and --stripe-url to test a '
+            'running site configured with `run_fake_stripe`.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users',
+                            type=int,
+                            default=10,
+                            help='Concurrent users')
+        parser.add_argument('--journeys',
+                            type=int,
+                            default=5,
+                            help='Checkouts per user')
+        parser.add_argument('--products', type=int, default=3)
+        parser.add_argument('--stock',
+                            type=int,
+                            default=20,
+                            help='Units in stock per product')
+        parser.add_argument('--crashpads', type=int, default=3)
+        parser.add_argument('--rental-share',
+                            type=float,
+                            default=0.3,
+                            help='Fraction of checkouts renting a crashpad')
+        parser.add_argument('--latency',
+                            type=float,
+                            default=0.1,
+                            help='Fake Stripe response time (seconds)')
+        parser.add_argument('--decline-rate', type=float, default=0.0)
+        parser.add_argument('--webhook-delay', type=float, default=0.5)
+        parser.add_argument('--duplicate-rate',
+                            type=float,
+                            default=0.0,
+                            help='Fraction of webhooks delivered twice')
+        parser.add_argument(
+            '--retry-delay',
+            type=float,
+            default=None,
+            help='Override ORDER_CREATION_RETRY_DELAY (in-process only)')
+        parser.add_argument('--base-url',
+                            type=str,
+                            default=None,
+                            help='Test an already running site')
+        parser.add_argument('--stripe-url',
+                            type=str,
+                            default=None,
+                            help='The fake Stripe that site is using')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep',
+                            action='store_true',
+                            help='Keep the seeded data and orders')
+
+    def handle(self, *args, **options):
+        if bool(options['base_url']) != bool(options['stripe_url']):
+            raise CommandError(
+                '--base-url and --stripe-url must be given together')
+
+        products, crashpad_ids = self.seed(options)
+        check_in = date.today() + timedelta(days=30)
+        load_test = None
+        try:
+            if options['base_url']:
+                load_test, elapsed, stats = self.run(
+                    options['base_url'], options['stripe_url'], products,
+                    crashpad_ids, check_in, options)
+            else:
+                load_test, elapsed, stats = self.run_in_process(
+                    products, crashpad_ids, check_in, options)
+            problems = check_integrity(products, crashpad_ids,
+                                       load_test.paid_intents)
+            self.report(load_test, elapsed, stats, problems)
+        finally:
+            if not options['keep']:
+                self.clean_up(products, crashpad_ids,
+                              load_test.paid_intents if load_test else ())
+
+        found = sum(len(found) for found in problems.values())
+        if found:
+            raise CommandError(f"{found} integrity problems found")
+
+    def seed(self, options):
+        """{product id: stock} and crashpad ids for the users to buy."""
+        self.stdout.write(
+            f"Seeding {options['products']} products with "
+            f"{options['stock']} in stock and {options['crashpads']} "
+            "crashpads...")
+        products = {
+            Product.objects.create(name=f"{SEED_PREFIX} product {i}",
+                                   price=Decimal('25.00'),
+                                   stock=options['stock']).pk:
+            options['stock']
+            for i in range(options['products'])
+        }
+        crashpad_ids = [
+            Crashpad.objects.create(name=f"{SEED_PREFIX} crashpad {i}",
+                                    brand='Load',
+                                    model='Test',
+                                    dimensions='100x100x10',
+                                    description='Load test crashpad',
+                                    day_rate=Decimal('10.00'),
+                                    seven_day_rate=Decimal('8.00'),
+                                    fourteen_day_rate=Decimal('6.00')).pk
+            for i in range(options['crashpads'])
+        ]
+        return products, crashpad_ids
+
+    def run(self, base_url, stripe_url, products, crashpad_ids, check_in,
+            options, stripe_server=None):
+        load_test = LoadTest(base_url,
+                             stripe_url,
+                             products,
+                             crashpad_ids,
+                             check_in=check_in,
+                             check_out=check_in + timedelta(days=2),
+                             users=options['users'],
+                             journeys=options['journeys'],
+                             rental_share=options['rental_share'],
+                             seed=options['seed'])
+        self.stdout.write(
+            f"Running {options['users']} users x {options['journeys']} "
+            f"checkouts against {base_url}...")
+        elapsed = load_test.run()
+        stats = {}
+        if stripe_server:
+            # Orders may still be created by webhooks in flight
+            stripe_server.wait_for_webhooks(timeout=120)
+            stats = dict(stripe_server.stats,
+                         webhook_latencies=stripe_server.webhook_latencies)
+        return load_test, elapsed, stats
+
+    def run_in_process(self, products, crashpad_ids, check_in, options):
+        """Run the site and a fake Stripe in background threads."""
+        site = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        site.set_app(get_internal_wsgi_application())
+        host, port = site.server_address[:2]
+        base_url = f"http://{host}:{port}"
+        stripe_server = FakeStripeServer(
+            webhook_url=f"{base_url}{reverse('stripe_webhook')}",
+            webhook_secret=WEBHOOK_SECRET,
+            latency=options['latency'],
+            decline_rate=options['decline_rate'],
+            webhook_delay=options['webhook_delay'],
+            duplicate_rate=options['duplicate_rate'],
+            seed=options['seed']).start()
+        site_thread = threading.Thread(target=site.serve_forever,
+                                       name='loadtest-site',
+                                       daemon=True)
+        site_thread.start()
+
+        overrides = {
+            'ALLOWED_HOSTS': [host],
+            'STRIPE_SECRET_KEY': 'sk_test_loadtest',
+            'STRIPE_WEBHOOK_SECRET': WEBHOOK_SECRET,
+            'EMAIL_BACKEND': 'django.core.mail.backends.dummy.EmailBackend',
+        }
+        if options['retry_delay'] is not None:
+            overrides['ORDER_CREATION_RETRY_DELAY'] = options['retry_delay']
+        api_key, api_base = stripe.api_key, stripe.api_base
+        # Per-request info logging would dominate the timings
+        loggers = [logging.getLogger(name) for name in ('', 'bouldering_cy')]
+        previous_levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.WARNING)
+        try:
+            with override_settings(**overrides):
+                stripe.api_key = overrides['STRIPE_SECRET_KEY']
+                stripe.api_base = stripe_server.url
+                return self.run(base_url, stripe_server.url, products,
+                                crashpad_ids, check_in, options,
+                                stripe_server)
+        finally:
+            stripe.api_key, stripe.api_base = api_key, api_base
+            for logger, level in zip(loggers, previous_levels):
+                logger.setLevel(level)
+            site.shutdown()
+            site.server_close()
+            site_thread.join()
+            stripe_server.stop()
+
+    def clean_up(self, products, crashpad_ids, paid_intents):
+        """Delete the seeded data and the orders placed for it."""
+        orders = Order.objects.filter(
+            Q(stripe_piid__in=paid_intents)
+            | Q(pk__in=OrderItem.objects.filter(
+                product_id__in=products).values('order_id'))
+            | Q(pk__in=CrashpadBooking.objects.filter(
+                crashpad_id__in=crashpad_ids).values('order_id')))
+        orders.delete()
+        Product.objects.filter(pk__in=products).delete()
+        Crashpad.objects.filter(pk__in=crashpad_ids).delete()
+
+    def report(self, load_test, elapsed, stats, problems):
+        outcomes = load_test.outcomes
+        journeys = sum(outcomes.values())
+        self.stdout.write(
+            f"\n{journeys} checkouts in {elapsed:.2f}s: "
+            f"{journeys / elapsed:.2f} checkouts/s, "
+            f"{outcomes['ordered'] / elapsed:.2f} orders/s")
+        self.stdout.write(', '.join(f"{outcome} {count}"
+                                    for outcome, count in outcomes.items()))
+
+        header = (f"\n{'step':<13}{'requests':>9}{'errors':>8}"
+                  f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        self.stdout.write(header)
+        self.stdout.write('-' * (len(header) - 1))
+        rows = load_test.step_stats()
+        if stats.get('webhook_latencies') is not None:
+            latencies = stats['webhook_latencies']
+            rows.append(('webhook', len(latencies),
+                         stats['webhook_failures'],
+                         *(percentile(latencies, pct)
+                           for pct in (50, 95, 99))))
+        for step, count, errors, p50, p95, p99 in rows:
+            self.stdout.write(f"{step:<13}{count:>9}{errors:>8}"
+                              f"{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}"
+                              f"{p99 * 1000:>9.1f}")
+
+        if stats:
+            self.stdout.write(
+                f"\nStripe: {stats['created']} intents, "
+                f"{stats['succeeded']} paid, {stats['declined']} declined, "
+                f"{stats['webhooks']} webhooks delivered")
+        for failure in load_test.failures[:10]:
+            self.stdout.write(self.style.WARNING(f"Failed: {failure}"))
+
+        self.stdout.write('')
+        for problem, found in problems.items():
+            label = problem.replace('_', ' ').capitalize()
+            if found:
+                self.stdout.write(
+                    self.style.ERROR(f"{label}: {len(found)}"))
+                for detail in found[:10]:
+                    self.stdout.write(f"  {detail}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{label}: none"))
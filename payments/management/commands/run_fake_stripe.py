@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from payments.fake_stripe import FakeStripeServer
+
+
+class Command(BaseCommand):
+    help = ('Run a local fake Stripe API for load testing checkout. Set '
+            'STRIPE_API_BASE to the printed url and STRIPE_WEBHOOK_SECRET '
+            'to the webhook secret.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument(
+            '--webhook-url',
+            type=str,
+            default=f"{settings.SITE_URL}{reverse('stripe_webhook')}",
+            help='Where to send webhooks once payments are confirmed')
+        parser.add_argument('--webhook-secret',
+                            type=str,
+                            default=settings.STRIPE_WEBHOOK_SECRET
+                            or 'whsec_fake')
+        parser.add_argument('--latency',
+                            type=float,
+                            default=0.1,
+                            help='Seconds to wait before each response')
+        parser.add_argument('--error-rate',
+                            type=float,
+                            default=0.0,
+                            help='Fraction of requests answered with a 500')
+        parser.add_argument('--decline-rate',
+                            type=float,
+                            default=0.0,
+                            help='Fraction of payments declined')
+        parser.add_argument(
+            '--webhook-delay',
+            type=float,
+            default=0.5,
+            help='Seconds between a payment and its webhook')
+        parser.add_argument('--duplicate-rate',
+                            type=float,
+                            default=0.0,
+                            help='Fraction of webhooks delivered twice')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer(address=(options['host'], options['port']),
+                                  webhook_url=options['webhook_url'],
+                                  webhook_secret=options['webhook_secret'],
+                                  latency=options['latency'],
+                                  error_rate=options['error_rate'],
+                                  decline_rate=options['decline_rate'],
+                                  webhook_delay=options['webhook_delay'],
+                                  duplicate_rate=options['duplicate_rate'],
+                                  seed=options['seed'])
+        self.stdout.write(
+            self.style.SUCCESS(f"Fake Stripe listening on {server.url}"))
+        self.stdout.write(f"Sending webhooks to {options['webhook_url']}")
+        self.stdout.write(
+            f"Run with STRIPE_API_BASE={server.url} "
+            f"STRIPE_WEBHOOK_SECRET={options['webhook_secret']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {server.stats}")
@@ -0,0 +1,90 @@
+import asyncio
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from orders.models import Order
+from shop.models import Product, StockReservation
+from payments import views
+from payments.utils import check_existing_order
+
+real_sleep = asyncio.sleep
+
+
+class AsyncPaymentViewsTest(TestCase):
+    """Test the payment views run async under ASGI"""
+
+    def setUp(self):
+        self.product = baker.make(Product,
+                                  name="Guidebook",
+                                  price=Decimal("30.00"),
+                                  stock=5,
+                                  is_active=True)
+
+    def fill_cart(self):
+        session = self.async_client.session
+        session[settings.CART_SESSION_ID] = {
+            f"product_{self.product.id}": {
+                'quantity': 2,
+                'price': str(self.product.price),
+                'type': 'product'
+            }
+        }
+        session.save()
+
+    def test_views_are_async(self):
+        """Test the views that call Stripe are coroutines"""
+        for view in (views.checkout, views.store_order_metadata,
+                     views.checkout_success):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_method_not_allowed(self):
+        """Test the async views still only accept their methods"""
+        response = await self.async_client.post(reverse('checkout'))
+        self.assertEqual(response.status_code, 405)
+        response = await self.async_client.get(
+            reverse('store_order_metadata'))
+        self.assertEqual(response.status_code, 405)
+
+    @patch('stripe.PaymentIntent.create_async')
+    async def test_checkout(self, mock_create):
+        """Test checkout through the async middleware stack"""
+        mock_create.return_value = MagicMock(id='pi_async',
+                                             client_secret='pi_async_secret')
+        await sync_to_async(self.fill_cart)()
+
+        response = await self.async_client.get(reverse('checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pi_async_secret', response.content.decode())
+        # The holds were placed and the queries measured
+        self.assertTrue(await StockReservation.objects.filter(
+            reference='pi_async').aexists())
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    @override_settings(ORDER_CREATION_RETRIES=2,
+                       ORDER_CREATION_RETRY_DELAY=3)
+    async def test_waiting_for_order_does_not_block(self):
+        """Test checkouts waiting for the webhook's order wait together"""
+        order = await sync_to_async(baker.make)(Order,
+                                                stripe_piid='pi_waiting')
+        intents = [MagicMock(id='pi_waiting') for _ in range(5)]
+        waiting = []
+        most_waiting = 0
+
+        async def sleep(delay):
+            nonlocal most_waiting
+            waiting.append(delay)
+            most_waiting = max(most_waiting, len(waiting))
+            # Let the other checkouts run, without actually waiting
+            await real_sleep(0)
+            waiting.pop()
+
+        with patch('payments.utils.asyncio.sleep', sleep):
+            found = await asyncio.gather(*map(check_existing_order, intents))
+
+        self.assertEqual([o.pk for o in found], [order.pk] * 5)
+        # Every checkout was waiting at once, rather than in turn
+        self.assertEqual(most_waiting, 5)
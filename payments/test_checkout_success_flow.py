@@ -2,14 +2,17 @@ from django.test import TestCase, Client, RequestFactory
 from django.urls import reverse
 from django.contrib.auth.models import User
 from decimal import Decimal
+from datetime import date
 import json
 import stripe
 from unittest.mock import patch, MagicMock
+from asgiref.sync import async_to_sync
 
 from orders.models import Order, OrderItem
 from shop.models import Product
 from rentals.models import Crashpad, CrashpadBooking
 from model_bakery import baker
+from payments.utils import OrderConflict
 from payments.views import create_or_return_order
 
 
@@ -111,7 +114,7 @@ class CheckoutSuccessFlowTest(TestCase):
         }
         session.save()
 
-    @patch('stripe.PaymentIntent.retrieve')
+    @patch('stripe.PaymentIntent.retrieve_async')
     @patch('payments.views.create_or_return_order')
     def test_checkout_success_view(self, mock_create_order, mock_retrieve):
         """Test the checkout success view with a valid payment intent"""
@@ -146,7 +149,7 @@ class CheckoutSuccessFlowTest(TestCase):
         # Check that the create_or_return_order function was called
         mock_create_order.assert_called_once()
 
-    @patch('stripe.PaymentIntent.retrieve')
+    @patch('stripe.PaymentIntent.retrieve_async')
     def test_checkout_success_view_with_failed_payment(self, mock_retrieve):
         """Test the checkout success view with a failed payment"""
         # Set up the mock
@@ -181,7 +184,7 @@ class CheckoutSuccessFlowTest(TestCase):
                              reverse('checkout'),
                              fetch_redirect_response=False)
 
-    @patch('stripe.PaymentIntent.retrieve')
+    @patch('stripe.PaymentIntent.retrieve_async')
     def test_checkout_success_view_with_stripe_error(self, mock_retrieve):
         """Test the checkout success view with a Stripe error"""
         # Set up the mock to raise a Stripe error
@@ -222,7 +225,8 @@ class CheckoutSuccessFlowTest(TestCase):
         request.session = self.client.session
 
         # Call the function
-        order = create_or_return_order(request, self.payment_intent)
+        order = async_to_sync(create_or_return_order)(request,
+                                                      self.payment_intent)
 
         # Check that the existing order was returned
         self.assertEqual(order, existing_order)
@@ -253,9 +257,77 @@ class CheckoutSuccessFlowTest(TestCase):
 
         # Call the function and check that it raises a ValueError
         with self.assertRaises(ValueError):
-            create_or_return_order(request, self.payment_intent)
+            async_to_sync(create_or_return_order)(request, self.payment_intent)
+
+    @patch('stripe.PaymentIntent.retrieve_async')
+    @patch('payments.views.check_existing_order', return_value=None)
+    @patch('payments.views.validate_stock', return_value=(True, None))
+    def test_checkout_success_flags_double_booked_days(
+            self, mock_validate_stock, mock_check_existing, mock_retrieve):
+        """Test a paid checkout whose days were booked meanwhile is flagged
+        to the admins, and leaves no order behind"""
+        self.payment_intent.metadata['cart_items'] = json.dumps([{
+            'id': self.product.id,
+            'quantity': 1,
+            'price': '29.99',
+        }])
+        self.payment_intent.metadata['rental_items'] = json.dumps([{
+            'id': self.crashpad.id,
+            'price': '50.00',
+            'check_in': '2023-01-01',
+            'check_out': '2023-01-05',
+            'daily_rate': '10.00',
+            'rental_days': 5,
+            'total_price': '50.00',
+        }])
+        mock_retrieve.return_value = self.payment_intent
+        # Someone else booked the days after the checkout was validated
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad,
+                   order=baker.make(Order),
+                   check_in=date(2023, 1, 3),
+                   check_out=date(2023, 1, 4))
+
+        url = (reverse('checkout_success') +
+               f"?payment_intent={self.payment_intent.id}")
+        with self.assertLogs('payments.utils', level='ERROR') as logs:
+            response = self.client.get(url)
+
+        self.assertRedirects(response,
+                             reverse('cart_detail'),
+                             fetch_redirect_response=False)
+        self.assertIn(self.payment_intent.id, logs.output[0])
+        self.assertIn('must be refunded by hand', logs.output[0])
+        # The order and its product line were rolled back with the booking
+        self.assertFalse(
+            Order.objects.filter(stripe_piid=self.payment_intent.id).exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    @patch('stripe.PaymentIntent.retrieve_async')
+    @patch('payments.views.create_or_return_order')
+    def test_checkout_success_conflict_after_webhook_order(
+            self, mock_create_order, mock_retrieve):
+        """Test a conflict raised after the webhook created the order shows
+        the order rather than flagging the payment"""
+        mock_retrieve.return_value = self.payment_intent
+        order = baker.make(Order, stripe_piid=self.payment_intent.id)
+
+        async def conflict(request, payment_intent):
+            raise OrderConflict("Sorry, these days are no longer available.")
+
+        mock_create_order.side_effect = conflict
+
+        url = (reverse('checkout_success') +
+               f"?payment_intent={self.payment_intent.id}")
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'payments/checkout_success.html')
+        self.assertEqual(response.context['order'], order)
 
-    @patch('stripe.PaymentIntent.retrieve')
+    @patch('stripe.PaymentIntent.retrieve_async')
     @patch('payments.views.create_or_return_order')
     def test_checkout_success_template_with_products_and_rentals(
             self, mock_create_order, mock_retrieve):
@@ -132,7 +132,7 @@ class CheckoutViewTests(TestCase):
                 messages = list(get_messages(response.wsgi_request))
                 self.assertEqual(str(messages[0]), error_msg)
 
-    @patch('stripe.PaymentIntent.create')
+    @patch('stripe.PaymentIntent.create_async')
     def test_checkout_with_product(self, mock_stripe_create):
         """Test checkout view with product in cart - integration test"""
         # Set up the mock Stripe response
@@ -170,7 +170,7 @@ class CheckoutViewTests(TestCase):
             self.assertIn('cart', response.context)
             self.assertIn('order_form', response.context)
 
-    @patch('stripe.PaymentIntent.create')
+    @patch('stripe.PaymentIntent.create_async')
     def test_checkout_with_rental(self, mock_stripe_create):
         """Test checkout view with crashpad rental in
         cart - integration test"""
@@ -0,0 +1,256 @@
+import json
+import threading
+import urllib.request
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import stripe
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from model_bakery import baker
+from orders.models import Order, OrderItem
+from rentals.models import Crashpad
+from shop.models import Product
+from .fake_stripe import FakeStripeServer, parse_form, sign_payload
+from .loadtest import CLIENT_SECRET, check_integrity, percentile
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    """Record the webhooks posted to the server"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((body, self.headers['Stripe-Signature']))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStripeTestCase(TestCase):
+
+    def setUp(self):
+        """Point the Stripe library at a fake Stripe"""
+        self.server = FakeStripeServer(seed=0).start()
+        self.addCleanup(self.server.stop)
+        api_key, api_base = stripe.api_key, stripe.api_base
+        self.addCleanup(setattr, stripe, 'api_key', api_key)
+        self.addCleanup(setattr, stripe, 'api_base', api_base)
+        stripe.api_key = 'sk_test_fake'
+        stripe.api_base = self.server.url
+
+    def confirm(self, intent_id):
+        """Pay `intent_id`, as Stripe.js would"""
+        request = urllib.request.Request(
+            f"{self.server.url}/v1/payment_intents/{intent_id}/confirm",
+            data=b'',
+            method='POST')
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+
+class FakeStripeTests(FakeStripeTestCase):
+    """Test the fake Stripe through the Stripe library"""
+
+    def test_parse_form(self):
+        """Test nested keys and lists are decoded"""
+        self.assertEqual(
+            parse_form('amount=100&metadata[a]=1&shipping[address][city]=N'
+                       '&payment_method_types[0]=card'
+                       '&payment_method_types[1]=link'), {
+                           'amount': '100',
+                           'metadata': {
+                               'a': '1'
+                           },
+                           'shipping': {
+                               'address': {
+                                   'city': 'N'
+                               }
+                           },
+                           'payment_method_types': ['card', 'link'],
+                       })
+
+    def test_payment_intent_lifecycle(self):
+        """Test creating, updating, paying and retrieving an intent"""
+        intent = stripe.PaymentIntent.create(amount=1000,
+                                             currency='eur',
+                                             payment_method_types=['card'])
+        self.assertTrue(intent.client_secret.startswith(
+            f"{intent.id}_secret_"))
+        self.assertEqual(intent.status, 'requires_payment_method')
+
+        stripe.PaymentIntent.modify(intent.id,
+                                    amount=1500,
+                                    metadata={
+                                        'order_type': 'shop',
+                                        'comments': ''
+                                    },
+                                    shipping={
+                                        'name': 'Test User',
+                                        'address': {
+                                            'line1': '1 Street',
+                                            'line2': '',
+                                        }
+                                    })
+        self.assertEqual(self.confirm(intent.id)['status'], 'succeeded')
+
+        intent = stripe.PaymentIntent.retrieve(intent.id)
+        self.assertEqual(intent.status, 'succeeded')
+        self.assertEqual(intent.amount, 1500)
+        self.assertEqual(dict(intent.metadata), {'order_type': 'shop'})
+        self.assertIsNone(intent.shipping.address.line2)
+        self.assertEqual(self.server.stats['succeeded'], 1)
+
+    def test_unknown_payment_intent(self):
+        """Test unknown intents raise Stripe's error"""
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            stripe.PaymentIntent.retrieve('pi_missing')
+
+    def test_declined_payment(self):
+        """Test payments are declined at the configured rate"""
+        self.server.decline_rate = 1
+        intent = stripe.PaymentIntent.create(amount=1000, currency='eur')
+        confirmed = self.confirm(intent.id)
+        self.assertEqual(confirmed['status'], 'requires_payment_method')
+        self.assertEqual(confirmed['last_payment_error']['code'],
+                         'card_declined')
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+    def test_webhook_signature_accepted(self):
+        """Test the site verifies the webhooks the fake signs"""
+        intent = stripe.PaymentIntent.create(amount=1000, currency='eur')
+        payload = json.dumps(
+            self.server.build_event('payment_intent.created',
+                                    self.server.get_intent(
+                                        intent.id))).encode()
+        url = reverse('stripe_webhook')
+
+        response = self.client.post(
+            url,
+            payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, WEBHOOK_SECRET))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            url,
+            payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, 'whsec_wrong'))
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ORDER_CREATION_RETRY_DELAY=0)
+class FakeStripeCheckoutTest(FakeStripeTestCase):
+    """Test checkout end to end against the fake Stripe"""
+
+    def test_checkout(self):
+        """Test an order is placed for a cart paid at the fake Stripe"""
+        product = baker.make(Product, price=Decimal('20.00'), stock=5)
+        self.client.post(reverse('cart_add', args=['product']), {
+            'product_id': product.id,
+            'quantity': 2
+        })
+
+        response = self.client.get(reverse('checkout'))
+        match = CLIENT_SECRET.search(response.content.decode())
+        client_secret = match.group(1) or match.group(2)
+        intent_id = client_secret.split('_secret_')[0]
+        self.assertIn(intent_id, self.server.intents)
+
+        response = self.client.post(
+            reverse('store_order_metadata'), {
+                'first_name': 'Test',
+                'last_name': 'User',
+                'email': 'test@example.com',
+                'phone': '12345678',
+                'address_line1': '1 Test Street',
+                'town_or_city': 'Nicosia',
+                'postal_code': '1000',
+                'country': 'CY',
+                'stripe-client-secret': client_secret,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.confirm(intent_id)
+
+        response = self.client.get(reverse('checkout_success'),
+                                   {'payment_intent': intent_id})
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(stripe_piid=intent_id)
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(self.server.intents[intent_id]['amount'],
+                         int(order.grand_total * 100))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+        self.assertNotIn(settings.CART_SESSION_ID, self.client.session)
+
+
+class CheckIntegrityTests(TestCase):
+    """Test the checks run after a load test"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.product = baker.make(Product, price=Decimal('10.00'), stock=0)
+        self.crashpad = baker.make(Crashpad, day_rate=Decimal('10.00'))
+        self.order = baker.make(Order, stripe_piid='pi_paid')
+
+    def test_no_problems(self):
+        """Test a clean run reports nothing"""
+        baker.make(OrderItem, order=self.order, product=self.product,
+                   quantity=2)
+        problems = check_integrity({self.product.pk: 2}, [self.crashpad.pk],
+                                   {'pi_paid'})
+        self.assertEqual(sum(map(len, problems.values())), 0)
+
+    def test_problems_found(self):
+        """Test oversold stock, lost orders and duplicated lines"""
+        for _ in range(2):
+            baker.make(OrderItem, order=self.order, product=self.product,
+                       quantity=2)
+        problems = check_integrity({self.product.pk: 3}, [self.crashpad.pk],
+                                   {'pi_paid', 'pi_lost'})
+        self.assertEqual(len(problems['oversold']), 1)
+        self.assertEqual(problems['missing_orders'], ['pi_lost'])
+        self.assertEqual(len(problems['duplicate_lines']), 1)
+        self.assertEqual(problems['double_booked'], [])
+
+    def test_percentile(self):
+        """Test percentiles of latencies"""
+        latencies = [i / 100 for i in range(1, 101)]
+        self.assertEqual(percentile(latencies, 50), 0.51)
+        self.assertEqual(percentile(latencies, 99), 0.99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class FakeStripeWebhookDeliveryTest(FakeStripeTestCase):
+    """Test the fake Stripe sends webhooks once payments are confirmed"""
+
+    def setUp(self):
+        """Set up a site receiving the webhooks"""
+        super().setUp()
+        self.site = ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        self.site.received = []
+        threading.Thread(target=self.site.serve_forever, daemon=True).start()
+        self.addCleanup(self.site.server_close)
+        self.addCleanup(self.site.shutdown)
+        host, port = self.site.server_address[:2]
+        self.server.webhook_url = f"http://{host}:{port}/"
+        self.server.webhook_secret = WEBHOOK_SECRET
+
+    def test_webhooks_sent(self):
+        """Test a signed webhook is sent, twice when duplicated"""
+        self.server.duplicate_rate = 1
+        intent = stripe.PaymentIntent.create(amount=1000, currency='eur')
+        self.confirm(intent.id)
+        self.server.wait_for_webhooks(timeout=10)
+
+        self.assertEqual(len(self.site.received), 2)
+        body, signature = self.site.received[0]
+        event = stripe.Webhook.construct_event(body, signature,
+                                               WEBHOOK_SECRET)
+        self.assertEqual(event.type, 'payment_intent.succeeded')
+        self.assertEqual(event.data.object.id, intent.id)
+        self.assertEqual(self.server.stats['webhooks'], 2)
@@ -1,4 +1,4 @@
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import date, timedelta
 from decimal import Decimal
 
@@ -159,9 +159,9 @@ class TestValidateStock(TestCase):
 class TestCheckExistingOrder(TestCase):
     """Tests for the check_existing_order function"""
 
-    @patch('payments.utils.time.sleep')
+    @patch('payments.utils.asyncio.sleep')
     @patch('payments.utils.Order.objects.filter')
-    def test_order_found_immediately(self, mock_filter, mock_sleep):
+    async def test_order_found_immediately(self, mock_filter, mock_sleep):
         """Test when order is found immediately after initial delay"""
         # Setup mocks
         payment_intent = MagicMock()
@@ -171,23 +171,23 @@ class TestCheckExistingOrder(TestCase):
         mock_order.order_number = 'TEST123'
 
         # Configure filter to return the order on first call
-        mock_filter.return_value.first.return_value = mock_order
+        mock_filter.return_value.afirst = AsyncMock(return_value=mock_order)
 
         # Set retry settings for test
         settings.ORDER_CREATION_RETRIES = 3
         settings.ORDER_CREATION_RETRY_DELAY = 0.1
 
         # Call the function
-        result = check_existing_order(payment_intent)
+        result = await check_existing_order(payment_intent)
 
         # Check the result
         self.assertEqual(result, mock_order)
         mock_filter.assert_called_with(stripe_piid='pi_test123')
         mock_sleep.assert_called_once_with(0.1)  # Initial delay only
 
-    @patch('payments.utils.time.sleep')
+    @patch('payments.utils.asyncio.sleep')
     @patch('payments.utils.Order.objects.filter')
-    def test_order_found_after_retries(self, mock_filter, mock_sleep):
+    async def test_order_found_after_retries(self, mock_filter, mock_sleep):
         """Test when order is found after a few retries"""
         # Setup mocks
         payment_intent = MagicMock()
@@ -197,37 +197,38 @@ class TestCheckExistingOrder(TestCase):
         mock_order.order_number = 'TEST123'
 
         # Configure filter to return None for first call, then the order
-        mock_filter.return_value.first.side_effect = [None, None, mock_order]
+        mock_filter.return_value.afirst = AsyncMock(
+            side_effect=[None, None, mock_order])
 
         # Set retry settings for test
         settings.ORDER_CREATION_RETRIES = 3
         settings.ORDER_CREATION_RETRY_DELAY = 0.1
 
         # Call the function
-        result = check_existing_order(payment_intent)
+        result = await check_existing_order(payment_intent)
 
         # Check the result
         self.assertEqual(result, mock_order)
         self.assertEqual(mock_filter.call_count, 3)
         self.assertEqual(mock_sleep.call_count, 3)  # Initial + 2 retries
 
-    @patch('payments.utils.time.sleep')
+    @patch('payments.utils.asyncio.sleep')
     @patch('payments.utils.Order.objects.filter')
-    def test_order_not_found(self, mock_filter, mock_sleep):
+    async def test_order_not_found(self, mock_filter, mock_sleep):
         """Test when order is not found after all retries"""
         # Setup mocks
         payment_intent = MagicMock()
         payment_intent.id = 'pi_test123'
 
         # Configure filter to always return None
-        mock_filter.return_value.first.return_value = None
+        mock_filter.return_value.afirst = AsyncMock(return_value=None)
 
         # Set retry settings for test
         settings.ORDER_CREATION_RETRIES = 3
         settings.ORDER_CREATION_RETRY_DELAY = 0.1
 
         # Call the function
-        result = check_existing_order(payment_intent)
+        result = await check_existing_order(payment_intent)
 
         # Check the result
         self.assertIsNone(result)
@@ -243,7 +244,9 @@ class TestCreateOrderItems(TestCase):
     @patch('rentals.models.Crashpad')
     @patch('orders.models.OrderItem.objects.create')
     @patch('rentals.models.CrashpadBooking.objects.create')
-    def test_create_product_order_items(self, mock_booking_create,
+    @patch('payments.utils.sell_stock')
+    def test_create_product_order_items(self, mock_sell_stock,
+                                        mock_booking_create,
                                         mock_order_item_create, mock_crashpad,
                                         mock_product, mock_order):
         """Test creating order items for products"""
@@ -274,9 +277,9 @@ class TestCreateOrderItems(TestCase):
             quantity=2,
             item_total=Decimal("39.98"))
 
-        # Check stock was updated
-        self.assertEqual(product.stock, 8)
-        product.save.assert_called_once()
+        # Check the held stock was sold
+        mock_sell_stock.assert_called_once_with(order.stripe_piid,
+                                                {product.pk: 2})
 
         # Check booking was not created
         mock_booking_create.assert_not_called()
@@ -334,7 +337,9 @@ class TestCreateOrderItems(TestCase):
     @patch('rentals.models.Crashpad')
     @patch('orders.models.OrderItem.objects.create')
     @patch('rentals.models.CrashpadBooking.objects.create')
-    def test_create_mixed_order_items(self, mock_booking_create,
+    @patch('payments.utils.sell_stock')
+    def test_create_mixed_order_items(self, mock_sell_stock,
+                                      mock_booking_create,
                                       mock_order_item_create, mock_crashpad,
                                       mock_product, mock_order):
         """Test creating order items for both products and rentals"""
@@ -390,9 +395,9 @@ class TestCreateOrderItems(TestCase):
             rental_days=3,
             total_price=Decimal("30.00"))
 
-        # Check stock was updated
-        self.assertEqual(product.stock, 9)
-        product.save.assert_called_once()
+        # Check the held stock was sold
+        mock_sell_stock.assert_called_once_with(order.stripe_piid,
+                                                {product.pk: 1})
 
     def test_order_without_pk(self):
         """Test creating order items for an order without a primary key"""
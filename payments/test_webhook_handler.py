@@ -9,9 +9,10 @@ from django.conf import settings
 from model_bakery import baker
 
 from payments.webhook_handler import StripeWH_Handler
+from payments.utils import OrderConflict, report_conflicting_payment
 from orders.models import Order
 from shop.models import Product
-from rentals.models import Crashpad
+from rentals.models import Crashpad, CrashpadBooking
 
 
 class MockEvent:
@@ -201,6 +202,53 @@ class TestStripeWebhookHandler(TestCase):
         except ValueError as e:
             self.assertEqual(str(e), "Product out of stock")
 
+    def double_book(self):
+        """Book the crashpad for days the mock intent paid for."""
+        check_in = datetime.now().date() + timedelta(days=10)
+        self.mock_intent.metadata['cart_items'] = json.dumps([])
+        self.mock_intent.metadata['rental_items'] = json.dumps([{
+            'id': self.crashpad.id,
+            'price': '30.00',
+            'check_in': str(check_in),
+            'check_out': str(check_in + timedelta(days=2)),
+            'daily_rate': '10.00',
+            'rental_days': 3,
+            'total_price': '30.00',
+        }])
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad,
+                   order=baker.make(Order),
+                   check_in=check_in + timedelta(days=1),
+                   check_out=check_in + timedelta(days=1))
+
+    def test_handle_payment_intent_succeeded_double_booked(self):
+        """Test a payment for days booked meanwhile is flagged to be
+        refunded by hand"""
+        self.double_book()
+        handler = StripeWH_Handler(self.factory.post('/webhook/'))
+        event = MockEvent('payment_intent.succeeded', self.mock_intent)
+
+        with self.assertLogs('payments.utils', level='ERROR') as logs:
+            response = handler.handle_payment_intent_succeeded(event)
+
+        # Acknowledged, so Stripe doesn't retry it
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['status'], 'conflict')
+        self.assertIn('pi_test123456', logs.output[0])
+        self.assertIn('must be refunded by hand', logs.output[0])
+        self.assertFalse(
+            Order.objects.filter(stripe_piid='pi_test123456').exists())
+
+    def test_conflict_not_flagged_once_ordered(self):
+        """Test a conflicting payment whose order exists isn't flagged"""
+        order = baker.make(Order, stripe_piid='pi_test123456')
+
+        with self.assertNoLogs('payments.utils', level='ERROR'):
+            self.assertEqual(
+                report_conflicting_payment('pi_test123456',
+                                           OrderConflict("Sold out")),
+                order)
+
     @patch('stripe.PaymentIntent.retrieve')
     def test_handle_payment_intent_failed(self, mock_retrieve):
         """Test handling a failed payment intent webhook"""
@@ -1,16 +1,29 @@
-import time
+import asyncio
 import logging
 from orders.models import Order, OrderItem
 from rentals.models import CrashpadBooking
+from shop.reservations import sell_stock, InsufficientStock
+from rentals.holds import release_rental_holds
+from reports.rollups import record_product_sales
+from bouldering_cy.metrics import timed
 from datetime import datetime
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
 from django.template.loader import render_to_string
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+class OrderConflict(ValueError):
+    """
+    Raised when a paid cart can no longer be fulfilled, because its stock
+    was sold or its crashpad days booked by someone else after its holds
+    expired.
+    """
+
+
 def get_error_message(error):
     """
     Map the error message for the given error.
@@ -38,8 +51,10 @@ def validate_stock(cart):
 
     if has_errors:
         if error_dict['error'] == 'insufficient_stock':
+            available = error_dict.get('available',
+                                       error_dict['product'].stock)
             error_message = (f"Sorry, {error_dict['product'].name} only has "
-                             f"{error_dict['product'].stock} items in stock. "
+                             f"{available} items in stock. "
                              f"Please adjust your quantity.")
         elif error_dict['error'] == 'dates_unavailable':
             error_message = (
@@ -56,21 +71,23 @@ def validate_stock(cart):
     return (True, None)
 
 
-def check_existing_order(payment_intent):
+async def check_existing_order(payment_intent):
     """
     Check if an order already exists for the given payment intent.
+    Waits without blocking, so the worker can serve other requests while
+    the webhook gets a chance to create the order.
     """
     max_retries = settings.ORDER_CREATION_RETRIES
     retry_delay = settings.ORDER_CREATION_RETRY_DELAY
 
     # Wait briefly to give webhook priority
-    time.sleep(retry_delay)
+    await asyncio.sleep(retry_delay)
 
     # Start checking for existing order a few times after delay
     for attempt in range(max_retries):
         # Check for existing order
-        existing_order = Order.objects.filter(
-            stripe_piid=payment_intent.id).first()
+        existing_order = await Order.objects.filter(
+            stripe_piid=payment_intent.id).afirst()
         if existing_order:
             logger.info("View handler found existing order after "
                         f"delay: {existing_order.order_number}")
@@ -80,13 +97,13 @@ def check_existing_order(payment_intent):
         if attempt < max_retries - 1:
             logger.info(f"Retry attempt {attempt + 1}: Fetching order "
                         "failed, waiting...")
-            time.sleep(retry_delay)
+            await asyncio.sleep(retry_delay)
         # If max retries reached, check for existing order one last time
         else:
             logger.info("Max retries reached, checking one last time "
                         "for existing order")
-            existing_order = Order.objects.filter(
-                stripe_piid=payment_intent.id).first()
+            existing_order = await Order.objects.filter(
+                stripe_piid=payment_intent.id).afirst()
             if existing_order:
                 # Return the order if found
                 return existing_order
@@ -100,7 +117,8 @@ def check_existing_order(payment_intent):
 def create_order_items(order, cart):
     """
     Create order items/bookings for the given order and cart.
-    Updates stock and availability.
+    Converts the checkout's stock and rental holds into the sale and
+    bookings, all in one transaction.
     """
     logger.info(f"Creating order items for order {order.order_number}")
     logger.info(f"Order PK: {order.pk}")
@@ -111,47 +129,89 @@ def create_order_items(order, cart):
         logger.error("Order does not have a primary key!")
         raise ValueError("Order must be saved before creating order items")
 
-    for i, item in enumerate(cart):
-        logger.info(f"Processing item {i+1}: {item}")
-
-        # Create order items for products
-        if item['type'] == 'product':
-            product = item['item']
-            quantity = item['quantity']
-            total_price = item['total_price']
-
-            # Create order item
-            OrderItem.objects.create(order=order,
-                                     product=product,
-                                     quantity=quantity,
-                                     item_total=total_price)
-
-            # Update product stock
-            product.stock -= quantity
-            product.save()
-            logger.info(f"Updated stock for {product.name}: "
-                        f"new stock level = {product.stock}")
-
-        # Create bookings for crashpad rentals
-        elif item['type'] == 'rental':
-            crashpad = item['item']
-            check_in = datetime.strptime(item['check_in'], '%Y-%m-%d').date()
-            check_out = datetime.strptime(item['check_out'], '%Y-%m-%d').date()
-            daily_rate = item['daily_rate']
-            rental_days = item['rental_days']
-            total_price = item['total_price']
-
-            # Create rental booking
-            CrashpadBooking.objects.create(crashpad=crashpad,
-                                           order=order,
-                                           check_in=check_in,
-                                           check_out=check_out,
-                                           daily_rate=daily_rate,
-                                           rental_days=rental_days,
-                                           total_price=total_price)
-
-            logger.info(f"Created booking for {crashpad.name}"
-                        f": {check_in} to {check_out}")
+    with transaction.atomic():
+        sold = {}
+        booked = False
+        for i, item in enumerate(cart):
+            logger.info(f"Processing item {i+1}: {item}")
+
+            # Create order items for products
+            if item['type'] == 'product':
+                product = item['item']
+                quantity = item['quantity']
+                total_price = item['total_price']
+
+                # Create order item
+                OrderItem.objects.create(order=order,
+                                         product=product,
+                                         quantity=quantity,
+                                         item_total=total_price)
+                sold[product.pk] = sold.get(product.pk, 0) + quantity
+
+            # Create bookings for crashpad rentals
+            elif item['type'] == 'rental':
+                crashpad = item['item']
+                check_in = datetime.strptime(item['check_in'],
+                                             '%Y-%m-%d').date()
+                check_out = datetime.strptime(item['check_out'],
+                                              '%Y-%m-%d').date()
+                daily_rate = item['daily_rate']
+                rental_days = item['rental_days']
+                total_price = item['total_price']
+
+                # Create rental booking; a day booked since the checkout
+                # breaks the unique constraint on the booked days
+                try:
+                    CrashpadBooking.objects.create(crashpad=crashpad,
+                                                   order=order,
+                                                   check_in=check_in,
+                                                   check_out=check_out,
+                                                   daily_rate=daily_rate,
+                                                   rental_days=rental_days,
+                                                   total_price=total_price)
+                except IntegrityError:
+                    raise OrderConflict(
+                        f"Sorry, {crashpad.name} has been booked by someone "
+                        f"else between {check_in} and {check_out}.")
+
+                logger.info(f"Created booking for {crashpad.name}"
+                            f": {check_in} to {check_out}")
+                booked = True
+
+        # Decrement stock and drop the checkout's holds
+        if sold:
+            try:
+                sell_stock(order.stripe_piid, sold)
+            except InsufficientStock as e:
+                raise OrderConflict(
+                    f"Sorry, {e.product.name} sold out before your order "
+                    "could be completed.")
+            logger.info(f"Updated stock for order {order.order_number}: "
+                        f"{sold}")
+            # Bookings are added to the rollups as they are saved
+            record_product_sales([order.pk])
+        # The bookings now block the dates
+        if booked:
+            release_rental_holds(order.stripe_piid)
+
+
+def report_conflicting_payment(payment_intent_id, conflict):
+    """
+    Flag a payment whose order couldn't be created because of an
+    OrderConflict, unless its order was created meanwhile, by the webhook
+    or the success page. The conflict is logged as an error, which emails
+    the admins, so staff can refund the payment and follow up with the
+    customer.
+    Returns the payment's order if it exists after all.
+    """
+    order = Order.objects.filter(stripe_piid=payment_intent_id).first()
+    if order is not None:
+        logger.warning(f"Payment {payment_intent_id} conflicted, but its "
+                       f"order {order.order_number} was created")
+        return order
+    logger.error(f"Payment {payment_intent_id} must be refunded by hand, "
+                 f"its order can't be created: {conflict}")
+    return None
 
 
 def send_confirmation_email(order):
@@ -168,7 +228,9 @@ def send_confirmation_email(order):
                 'contact_email': settings.DEFAULT_FROM_EMAIL,
                 'whatsapp_number': settings.WHATSAPP_NUMBER,
             })
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [order.email])
+        with timed('sendgrid'):
+            send_mail(subject, body, settings.DEFAULT_FROM_EMAIL,
+                      [order.email])
 
         logger.info(f"Confirmation email sent for order {order.order_number}")
         return True
@@ -193,7 +255,9 @@ def send_rental_confirmation_email(order):
                 'contact_email': settings.DEFAULT_FROM_EMAIL,
                 'whatsapp_number': settings.WHATSAPP_NUMBER,
             })
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [order.email])
+        with timed('sendgrid'):
+            send_mail(subject, body, settings.DEFAULT_FROM_EMAIL,
+                      [order.email])
         logger.info("Rental confirmation email sent "
                     f"for order {order.order_number}")
         return True
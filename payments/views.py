@@ -2,52 +2,82 @@ import stripe
 import logging
 import json
 from decimal import Decimal
+from functools import wraps
+from asgiref.sync import sync_to_async
 from django.urls import reverse
 from django.shortcuts import render, redirect
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponseNotAllowed, JsonResponse
 from django.contrib import messages
-from django.views.decorators.http import require_POST, require_GET
 from orders.forms import OrderForm
 from orders.models import Order
 from cart.cart import Cart
 from cart.contexts import cart_summary
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from payments.utils import (validate_stock, check_existing_order,
                             create_order_items, send_confirmation_email,
-                            send_rental_confirmation_email)
-from shop.models import Product
-from rentals.models import Crashpad
+                            send_rental_confirmation_email, OrderConflict,
+                            report_conflicting_payment)
+from shop.reservations import place_holds, InsufficientStock
+from rentals.holds import place_rental_holds, RentalUnavailable
+from bouldering_cy.metrics import timed
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Set Stripe API key
 stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe.api_base = settings.STRIPE_API_BASE
 
 
-def create_payment_intent(cart):
+def require_http_methods_async(request_method_list):
+    """
+    `require_http_methods` for async views. Django 4.2's decorator calls
+    the view synchronously, which would hand back an unawaited coroutine.
+    """
+
+    def decorator(func):
+
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                logger.warning(f"Method Not Allowed ({request.method}): "
+                               f"{request.path}")
+                return HttpResponseNotAllowed(request_method_list)
+            return await func(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+require_GET_async = require_http_methods_async(["GET"])
+require_POST_async = require_http_methods_async(["POST"])
+
+
+async def create_payment_intent(cart):
     """Helper function to create a payment intent."""
     try:
         # Calculate the total amount
         stripe_total = int(cart.cart_total() * 100)
         # Create a PaymentIntent with the order amount and currency
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-            payment_method_types=['card', 'link'],
-        )
+        with timed('stripe'):
+            intent = await stripe.PaymentIntent.create_async(
+                amount=stripe_total,
+                currency=settings.STRIPE_CURRENCY,
+                payment_method_types=['card', 'link'],
+            )
         return intent
     except Exception as e:
         logger.error(f"Error creating payment intent: {str(e)}")
         raise Exception(f"Error creating payment intent: {str(e)}")
 
 
-@require_GET
-def checkout(request):
-    """Endpoint to handle the checkout process."""
-    logger.info("Checkout view called")
-
+def validate_checkout(request):
+    """
+    Load the cart and check it can be checked out. Returns the cart and,
+    if it can't, the redirect back to the cart.
+    """
     # Check if the cart is empty
     cart = Cart(request)
     logger.info(f"Cart items: {list(cart)}")
@@ -56,7 +86,7 @@ def checkout(request):
     if not len(cart):
         logger.info("Cart is empty, redirecting to cart_detail")
         messages.error(request, "Your cart is empty.")
-        return redirect("cart_detail")
+        return cart, redirect("cart_detail")
 
     # Validate stock and availability before proceeding
     try:
@@ -67,196 +97,206 @@ def checkout(request):
         if not valid_stock:
             logger.error(f"Stock validation failed: {error_message}")
             messages.error(request, error_message)
-            return redirect("cart_detail")
+            return cart, redirect("cart_detail")
     except ValueError as e:
         logger.error(f"ValueError in validate_stock: {str(e)}")
         messages.error(request, str(e))
-        return redirect("cart_detail")
+        return cart, redirect("cart_detail")
     except Exception as e:
         logger.error(f"Unexpected error in validate_stock: {str(e)}")
         messages.error(request, f"An error occurred: {str(e)}")
-        return redirect("cart_detail")
+        return cart, redirect("cart_detail")
+
+    return cart, None
+
+
+def render_checkout(request, cart, intent):
+    """Hold the cart's stock and crashpads, then render the checkout."""
+    # Hold the stock and crashpads while the customer pays, replacing
+    # the holds of any earlier checkout of this cart
+    previous = request.session.get(settings.STOCK_HOLD_SESSION_ID)
+    with transaction.atomic():
+        place_holds(intent.id, cart.product_quantities(), previous=previous)
+        place_rental_holds(intent.id,
+                           cart.rental_dates(),
+                           previous=previous)
+    request.session[settings.STOCK_HOLD_SESSION_ID] = intent.id
+
+    # Get initial data for authenticated users
+    initial_data = {}
+    if request.user.is_authenticated:
+        initial_data = {
+            'first_name': request.user.first_name,
+            'last_name': request.user.last_name,
+            'email': request.user.email,
+        }
+        logger.info(f"Pre-populating form with user data: {initial_data}")
+
+    # Create the order form with initial data
+    order_form = OrderForm(
+        initial=initial_data,
+        stripe_public_key=settings.STRIPE_PUBLIC_KEY,
+        stripe_client_secret=intent.client_secret,
+    )
+
+    context = {
+        "cart": cart,
+        "order_form": order_form,
+        **cart_summary(request),
+    }
+
+    # Render the checkout template
+    logger.info("Rendering checkout template")
+    return render(request, 'payments/checkout.html', context)
+
+
+@require_GET_async
+async def checkout(request):
+    """
+    Endpoint to handle the checkout process. Async, so the worker isn't
+    tied up while Stripe creates the payment intent; the session,
+    database and template work runs in `sync_to_async` sections.
+    """
+    logger.info("Checkout view called")
+
+    cart, response = await sync_to_async(validate_checkout)(request)
+    if response:
+        return response
 
     try:
         # Proceed with checkout and create payment intent
         logger.info("Creating payment intent")
-        intent = create_payment_intent(cart)
+        intent = await create_payment_intent(cart)
         logger.info(f"Payment intent created: {intent.id}")
 
-        # Get initial data for authenticated users
-        initial_data = {}
-        if request.user.is_authenticated:
-            initial_data = {
-                'first_name': request.user.first_name,
-                'last_name': request.user.last_name,
-                'email': request.user.email,
-            }
-            logger.info(f"Pre-populating form with user data: {initial_data}")
-
-        # Create the order form with initial data
-        order_form = OrderForm(
-            initial=initial_data,
-            stripe_public_key=settings.STRIPE_PUBLIC_KEY,
-            stripe_client_secret=intent.client_secret,
-        )
-
-        context = {
-            "cart": cart,
-            "order_form": order_form,
-        }
-
-        # Render the checkout template
-        logger.info("Rendering checkout template")
-        return render(request, 'payments/checkout.html', context)
+        return await sync_to_async(render_checkout)(request, cart, intent)
 
+    except InsufficientStock as e:
+        logger.error(f"Could not hold stock: {str(e)}")
+        messages.error(
+            request, f"Sorry, {e.product.name} only has {e.available} "
+            "items in stock. Please adjust your quantity.")
+        return redirect("cart_detail")
+    except RentalUnavailable as e:
+        logger.error(f"Could not hold crashpad: {str(e)}")
+        messages.error(request, f"Sorry, {e}.")
+        return redirect("cart_detail")
     except Exception as e:
         logger.error(f"Error in checkout view: {str(e)}")
         messages.error(request, f"An error occurred: {str(e)}")
         return redirect("cart_detail")
 
 
-@require_POST
-def store_order_metadata(request):
-    """Endpoint to store order data in PaymentIntent metadata and session."""
-    try:
-        logger.info("\n=== Storing Order Metadata ===")
-        logger.info(f"POST data: {request.POST}")
+def prepare_order_metadata(request):
+    """
+    Validate the order form and store it in the session. Returns the
+    error response if it isn't valid, or the payment intent id and the
+    changes to make to the payment intent.
+    """
+    logger.info(f"POST data: {request.POST}")
 
-        form = OrderForm(request.POST)
-        if form.is_valid():
-            # Get the cleaned form data
-            form_data = form.cleaned_data
-            logger.info(f"Form data: {form_data}")
+    form = OrderForm(request.POST)
+    if not form.is_valid():
+        logger.error(f"Form validation failed: {form.errors}")
+        return JsonResponse(
+            {
+                'status': 'error',
+                'errors': form.errors,
+                'message': 'Form validation failed'
+            },
+            status=400), None, None
 
-            # Store form data in session
-            request.session['order_form_data'] = form_data
+    # Get the cleaned form data
+    form_data = form.cleaned_data
+    logger.info(f"Form data: {form_data}")
 
-            # Get cart from the session object and use its methods
-            cart = Cart(request)
-            cart_items = cart.to_json()['cart_items']
-            rental_items = cart.to_json()['rental_items']
-            cart_context = cart_summary(request)
-            cart_total = cart_context['cart_total']
-            delivery_cost = cart_context['delivery_cost']
-            handling_fee = cart_context['handling_fee']
-            grand_total = cart_context['grand_total']
-            order_type = cart_context['order_type']
-            # Get client secret
-            client_secret = request.POST.get('stripe-client-secret')
-            if not client_secret:
-                logger.error("No client secret found in request POST data")
-                return JsonResponse(
-                    {
-                        'status': 'error',
-                        'error': 'No client secret provided'
-                    },
-                    status=400)
+    # Store form data in session
+    request.session['order_form_data'] = form_data
 
-            try:
-                payment_intent_id = client_secret.split('_secret_')[0]
-
-                # Prepare metadata
-                metadata = {
-                    'cart_items': json.dumps(cart_items),
-                    'rental_items': json.dumps(rental_items),
-                    'cart_total': cart_total,
-                    'delivery_cost': delivery_cost,
-                    'handling_fee': handling_fee,
-                    'grand_total': grand_total,
-                    'order_type': order_type,
-                    'comments': form_data.get('comments', ''),
-                    'order_form_data': json.dumps(form_data),
-                    'session_id': request.session.session_key
-                }
-
-                # Add user ID to metadata if user is authenticated
-                if request.user.is_authenticated:
-                    metadata['user_id'] = request.user.id
-                    logger.info(
-                        f"Adding user ID {request.user.id} to payment intent "
-                        "metadata")
-
-                # Update PaymentIntent with metadata
-                stripe.PaymentIntent.modify(
-                    payment_intent_id,
-                    amount=int(cart_context['grand_total'] * 100),
-                    metadata=metadata,
-                    # Shipping details
-                    shipping={
-                        'name':
-                        " ".join([
-                            form_data.get('first_name'),
-                            form_data.get('last_name')
-                        ]),
-                        'phone':
-                        form_data.get('phone'),
-                        'address': {
-                            'line1': form_data.get('address_line1'),
-                            'line2': form_data.get('address_line2', ''),
-                            'city': form_data.get('town_or_city'),
-                            'postal_code': form_data.get('postal_code'),
-                            'country': form_data.get('country'),
-                        },
-                    },
-                    # Receipt email
-                    receipt_email=form_data.get('email'))
-
-                logger.info("Successfully stored metadata in PaymentIntent")
-
-                # For shop products - prefetch in a single query
-                product_ids = []
-                crashpad_ids = []
-
-                # Extract IDs from cart items
-                for item in cart_items:
-                    if hasattr(item, 'product') and item.product:
-                        product_ids.append(item.product.id)
-                    if hasattr(item, 'crashpad') and item.crashpad:
-                        crashpad_ids.append(item.crashpad.id)
-
-                # Fetch all products in a single query
-                if product_ids:
-                    products = {
-                        p.id: p
-                        for p in Product.objects.filter(id__in=product_ids)
-                    }
-
-                # Fetch all crashpads in a single query
-                if crashpad_ids:
-                    crashpads = {
-                        cp.id: cp
-                        for cp in Crashpad.objects.filter(id__in=crashpad_ids)
-                    }
-
-                # Use the prefetched objects when processing cart items
-                for item in cart_items:
-                    if hasattr(
-                            item, 'product'
-                    ) and item.product and item.product.id in products:
-                        item.product = products[item.product.id]
-                    if hasattr(
-                            item, 'crashpad'
-                    ) and item.crashpad and item.crashpad.id in crashpads:
-                        item.crashpad = crashpads[item.crashpad.id]
-
-                return JsonResponse({'status': 'success'})
-
-            except stripe.error.StripeError as e:
-                logger.error(f"Stripe error: {str(e)}")
-                return JsonResponse(
-                    {
-                        'status': 'error',
-                        'error': 'Error updating PaymentIntent'
-                    },
-                    status=400)
+    # Get client secret
+    client_secret = request.POST.get('stripe-client-secret')
+    if not client_secret:
+        logger.error("No client secret found in request POST data")
+        return JsonResponse(
+            {
+                'status': 'error',
+                'error': 'No client secret provided'
+            },
+            status=400), None, None
+    payment_intent_id = client_secret.split('_secret_')[0]
 
-        else:
-            logger.error(f"Form validation failed: {form.errors}")
+    # Get cart from the session object and use its methods
+    cart = Cart(request)
+    cart_json = cart.to_json()
+    cart_context = cart_summary(request)
+
+    # Prepare metadata
+    metadata = {
+        'cart_items': json.dumps(cart_json['cart_items']),
+        'rental_items': json.dumps(cart_json['rental_items']),
+        'cart_total': cart_context['cart_total'],
+        'delivery_cost': cart_context['delivery_cost'],
+        'handling_fee': cart_context['handling_fee'],
+        'grand_total': cart_context['grand_total'],
+        'order_type': cart_context['order_type'],
+        'comments': form_data.get('comments', ''),
+        'order_form_data': json.dumps(form_data),
+        'session_id': request.session.session_key
+    }
+
+    # Add user ID to metadata if user is authenticated
+    if request.user.is_authenticated:
+        metadata['user_id'] = request.user.id
+        logger.info(f"Adding user ID {request.user.id} to payment intent "
+                    "metadata")
+
+    return None, payment_intent_id, {
+        'amount': int(cart_context['grand_total'] * 100),
+        'metadata': metadata,
+        # Shipping details
+        'shipping': {
+            'name':
+            " ".join([form_data.get('first_name'),
+                      form_data.get('last_name')]),
+            'phone': form_data.get('phone'),
+            'address': {
+                'line1': form_data.get('address_line1'),
+                'line2': form_data.get('address_line2', ''),
+                'city': form_data.get('town_or_city'),
+                'postal_code': form_data.get('postal_code'),
+                'country': form_data.get('country'),
+            },
+        },
+        # Receipt email
+        'receipt_email': form_data.get('email'),
+    }
+
+
+@require_POST_async
+async def store_order_metadata(request):
+    """Endpoint to store order data in PaymentIntent metadata and session."""
+    try:
+        logger.info("\n=== Storing Order Metadata ===")
+
+        error_response, payment_intent_id, changes = await sync_to_async(
+            prepare_order_metadata)(request)
+        if error_response:
+            return error_response
+
+        try:
+            # Update PaymentIntent with metadata
+            with timed('stripe'):
+                await stripe.PaymentIntent.modify_async(
+                    payment_intent_id, **changes)
+            logger.info("Successfully stored metadata in PaymentIntent")
+            return JsonResponse({'status': 'success'})
+
+        except stripe.error.StripeError as e:
+            logger.error(f"Stripe error: {str(e)}")
             return JsonResponse(
                 {
                     'status': 'error',
-                    'errors': form.errors,
-                    'message': 'Form validation failed'
+                    'error': 'Error updating PaymentIntent'
                 },
                 status=400)
 
@@ -270,23 +310,28 @@ def store_order_metadata(request):
             status=500)
 
 
-def create_or_return_order(request, payment_intent):
+async def create_or_return_order(request, payment_intent):
     """Helper function to create an order from a payment intent
     and form data."""
-    try:
-        logger.info("\n=== Starting Order Creation ===")
-        logger.info(f"Payment Intent ID: {payment_intent.id}")
-
-        # First, check if order was already created by the webhook handler
-        existing_order = check_existing_order(payment_intent)
-        if existing_order:
-            logger.info("View handler found existing order: "
-                        f"{existing_order.order_number}")
-            return existing_order
-        else:
-            logger.info("View handler found no existing order. "
-                        "Creating new order.")
+    logger.info("\n=== Starting Order Creation ===")
+    logger.info(f"Payment Intent ID: {payment_intent.id}")
+
+    # First, check if order was already created by the webhook handler
+    existing_order = await check_existing_order(payment_intent)
+    if existing_order:
+        logger.info("View handler found existing order: "
+                    f"{existing_order.order_number}")
+        return existing_order
+    else:
+        logger.info("View handler found no existing order. "
+                    "Creating new order.")
+
+    return await sync_to_async(create_order)(request, payment_intent)
 
+
+def create_order(request, payment_intent):
+    """Create the order for a payment intent no order exists for yet."""
+    try:
         # Get the order form data from session
         form_data = request.session.get('order_form_data')
 
@@ -304,7 +349,7 @@ def create_or_return_order(request, payment_intent):
 
         # Try to get cart from session first
         if settings.CART_SESSION_ID in request.session:
-            cart = Cart(request=request)
+            cart = Cart(request=request, hold_reference=payment_intent.id)
             cart_context = cart_summary(request)
             cart_total = cart_context['cart_total']
             delivery_cost = cart_context['delivery_cost']
@@ -319,18 +364,20 @@ def create_or_return_order(request, payment_intent):
                 'rental_items':
                 json.loads(payment_intent.metadata.get('rental_items')),
             }
-            cart = Cart(cart_data=cart_data)
+            cart = Cart(cart_data=cart_data,
+                        hold_reference=payment_intent.id)
             cart_total = Decimal(payment_intent.metadata.get('cart_total'))
             delivery_cost = Decimal(
                 payment_intent.metadata.get('delivery_cost'))
             handling_fee = Decimal(payment_intent.metadata.get('handling_fee'))
             grand_total = Decimal(payment_intent.metadata.get('grand_total'))
+            order_type = payment_intent.metadata.get('order_type')
         logger.info(f"Cart processed: {cart}")
         # Verify stock and availability one last time before creating order
         valid_stock, error_message = validate_stock(cart)
         if not valid_stock:
             logger.error(f"Stock validation failed: {error_message}")
-            raise ValueError(error_message)
+            raise OrderConflict(error_message)
         logger.info(f"Stock validated: {valid_stock}")
 
         # Log the form data we're using to create the order
@@ -363,26 +410,32 @@ def create_or_return_order(request, payment_intent):
             logger.info(f"Associating order with authenticated user: "
                         f"{request.user.username}")
 
-        # Get or create the order object
+        # Get or create the order object, with its items, so a conflict
+        # while creating the items leaves no order behind
         logger.info("Attempting to get or create order")
-        order, created = Order.objects.get_or_create(
-            stripe_piid=payment_intent.id, defaults=order_data)
+        with transaction.atomic():
+            order, created = Order.objects.get_or_create(
+                stripe_piid=payment_intent.id, defaults=order_data)
+
+            logger.info(f"Order {'created' if created else 'retrieved'}")
+            logger.info(f"Order: {order}")
+            logger.info(f"Order PK: {order.pk}")
+            logger.info(f"Order number: {order.order_number}")
+
+            # Only create order items if this is a new order
+            if created:
+                # Create order items/bookings and update stock/availability
+                logger.info("About to create order items")
+                create_order_items(order, cart)
+                logger.info("Order items created successfully")
+
+                # Update order totals
+                order.update_total()
+                logger.info("Order totals updated")
 
-        logger.info(f"Order {'created' if created else 'retrieved'}")
-        logger.info(f"Order: {order}")
-        logger.info(f"Order PK: {order.pk}")
-        logger.info(f"Order number: {order.order_number}")
-
-        # Only create order items if this is a new order
         if created:
-            # Create order items/bookings and update stock/availability
-            logger.info("About to create order items")
-            create_order_items(order, cart)
-            logger.info("Order items created successfully")
-
-            # Update order totals
-            order.update_total()
-            logger.info("Order totals updated")
+            # The emails and pages below list every line
+            order.prefetch_lines()
 
             # Send confirmation emails
             send_confirmation_email(order)
@@ -399,9 +452,23 @@ def create_or_return_order(request, payment_intent):
         raise e
 
 
-@require_GET
-def checkout_success(request):
-    """Endpoint to handle successful checkout and create order."""
+def render_checkout_success(request, order):
+    """Render the success page with order details, contact details,
+    and crashpad pickup address."""
+    order.prefetch_lines()
+    context = {
+        'order': order,
+        **cart_summary(request),
+    }
+    return render(request, 'payments/checkout_success.html', context)
+
+
+@require_GET_async
+async def checkout_success(request):
+    """
+    Endpoint to handle successful checkout and create order. Waiting on
+    Stripe and for the webhook's order doesn't tie up the worker.
+    """
     logger.info("\n=== Starting Checkout Success ===")
 
     payment_intent_id = request.GET.get('payment_intent')
@@ -423,7 +490,9 @@ def checkout_success(request):
             raise Exception("Simulated checkout failure")
 
         # Retrieve the payment intent
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        with timed('stripe'):
+            payment_intent = await stripe.PaymentIntent.retrieve_async(
+                payment_intent_id)
         logger.info("\n=== Payment Intent ===")
         logger.info(f"Status: {payment_intent.status}")
         logger.info(f"Amount: {payment_intent.amount}")
@@ -432,7 +501,7 @@ def checkout_success(request):
         if payment_intent.status == 'succeeded':
             try:
                 # Create or return existing order
-                order = create_or_return_order(request, payment_intent)
+                order = await create_or_return_order(request, payment_intent)
                 logger.info("\n=== Order Details ===")
                 logger.info(f"Order Number: {order.order_number}")
                 logger.info(f"Email: {order.email}")
@@ -443,18 +512,27 @@ def checkout_success(request):
                     f'Your order number is {order.order_number}. '
                     f'A confirmation email will be sent to {order.email}.')
 
-                # Render the success page with order details,
-                # contact details, and crashpad pickup address
-                context = {
-                    'order': order,
-                }
-                response = render(request, 'payments/checkout_success.html',
-                                  context)
+                response = await sync_to_async(render_checkout_success)(
+                    request, order)
                 logger.info("\n=== Checkout Success Template Rendered ===")
                 logger.info(f"Response status code: {response.status_code}")
                 return response
 
-            except IntegrityError:
+            except OrderConflict as e:
+                # Paid for, but the stock or days went to someone else,
+                # unless the webhook created the order in the meantime
+                order = await sync_to_async(report_conflicting_payment)(
+                    payment_intent.id, e)
+                if order is not None:
+                    return await sync_to_async(render_checkout_success)(
+                        request, order)
+                messages.error(request, f"{e} We will be in touch about "
+                               "your payment.")
+                return redirect("cart_detail")
+
+            except IntegrityError as e:
+                logger.error("Integrity error creating the order for "
+                             f"payment {payment_intent.id}: {e}")
                 messages.error(
                     request, "An error occurred while processing "
                     "your order. Please contact us to "
@@ -495,3 +573,6 @@ def clear_session_data(request):
         cart = Cart(request)
         cart.clear()
     logger.info("Cart cleared from session")
+
+    # The holds were converted into the order
+    request.session.pop(settings.STOCK_HOLD_SESSION_ID, None)
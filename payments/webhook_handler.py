@@ -5,12 +5,15 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 import json
 from django.http import JsonResponse
+from django.db import transaction
 from orders.models import Order
 from django.contrib.auth.models import User
 from payments.utils import (validate_stock, create_order_items,
                             send_confirmation_email,
-                            send_rental_confirmation_email)
+                            send_rental_confirmation_email, OrderConflict,
+                            report_conflicting_payment)
 from cart.cart import Cart
+from bouldering_cy.metrics import timed
 from decimal import Decimal
 
 # Configure logging
@@ -41,6 +44,11 @@ class StripeWH_Handler:
                 session_store.save()
                 logger.info(f"Cart cleared from session {session_id}")
 
+            # The holds were converted into the order
+            if settings.STOCK_HOLD_SESSION_ID in session_store:
+                del session_store[settings.STOCK_HOLD_SESSION_ID]
+                session_store.save()
+
             # Clear order form data if not already cleared
             if 'order_form_data' in session_store:
                 del session_store['order_form_data']
@@ -66,13 +74,14 @@ class StripeWH_Handler:
                 'rental_items':
                 json.loads(intent.metadata.get('rental_items')),
             }
-            cart = Cart(cart_data=cart_data)
+            # The stock held for this payment is available to it
+            cart = Cart(cart_data=cart_data, hold_reference=intent.id)
 
             # Verify stock and availability for all items
             valid_stock, error_message = validate_stock(cart)
             if not valid_stock:
                 logger.error(f"Stock validation failed: {error_message}")
-                return JsonResponse({'error': error_message}, status=400)
+                raise OrderConflict(error_message)
 
             # Prepare order data
             order_data = {
@@ -107,22 +116,29 @@ class StripeWH_Handler:
                 except User.DoesNotExist:
                     logger.warning(f"User with ID {user_id} not found")
 
-            # Create or get order
-            order, created = Order.objects.get_or_create(stripe_piid=intent.id,
-                                                         defaults=order_data)
+            # Create or get order, with its items, so a conflict while
+            # creating the items leaves no order behind
+            with transaction.atomic():
+                order, created = Order.objects.get_or_create(
+                    stripe_piid=intent.id, defaults=order_data)
 
-            # If the order was created, we need to create the order items
-            # and update the stock
-            if created:
-                logger.info(f"Webhook created order: {order.order_number}")
-                # Create order items/bookings and update stock/availability
-                logger.info("About to create order items")
-                create_order_items(order, cart)
-                logger.info("Order items created successfully")
+                # If the order was created, we need to create the order
+                # items and update the stock
+                if created:
+                    logger.info(
+                        f"Webhook created order: {order.order_number}")
+                    # Create order items/bookings, update stock/availability
+                    logger.info("About to create order items")
+                    create_order_items(order, cart)
+                    logger.info("Order items created successfully")
 
-                # Update order totals
-                order.update_total()
-                logger.info("Order totals updated")
+                    # Update order totals
+                    order.update_total()
+                    logger.info("Order totals updated")
+
+            if created:
+                # The confirmation emails list every line
+                order.prefetch_lines()
 
                 # Send order confirmation email in any case
                 send_confirmation_email(order)
@@ -141,6 +157,13 @@ class StripeWH_Handler:
 
             return JsonResponse({'status': 'success'})
 
+        except OrderConflict as e:
+            # Paid for, but the stock or days went to someone else. Stripe
+            # retrying wouldn't help, so the event is acknowledged.
+            if report_conflicting_payment(intent.id, e) is not None:
+                return JsonResponse({'status': 'success'})
+            return JsonResponse({'status': 'conflict', 'error': str(e)})
+
         except Exception as e:
             logger.error("Error in order creation in webhook handler:"
                          f" {str(e)}")
@@ -192,8 +215,9 @@ class StripeWH_Handler:
                     'orders/confirmation_emails/payment_failed_body.txt',
                     context)
 
-                send_mail(subject, body, settings.DEFAULT_FROM_EMAIL,
-                          [customer_email])
+                with timed('sendgrid'):
+                    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL,
+                              [customer_email])
 
                 logger.info(f"Payment failed email sent to {customer_email}")
             else:
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django_summernote.admin import SummernoteModelAdmin
-from .models import Crashpad, CrashpadBooking, CrashpadGalleryImage
+from .models import (Crashpad, CrashpadBooking, CrashpadGalleryImage,
+                     RentalHold)
 
 
 class CrashpadGalleryImageInline(admin.TabularInline):
@@ -41,3 +42,13 @@ class CrashpadBookingAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at', 'rental_days', 'daily_rate',
                        'total_price', 'customer_name', 'customer_email',
                        'customer_phone')
+
+
+@admin.register(RentalHold)
+class RentalHoldAdmin(admin.ModelAdmin):
+    list_display = ('crashpad', 'check_in', 'check_out', 'reference',
+                    'expires_at')
+    list_select_related = ('crashpad', )
+    search_fields = ('reference', 'crashpad__name')
+    readonly_fields = ('crashpad', 'reference', 'check_in', 'check_out',
+                       'expires_at', 'created_at')
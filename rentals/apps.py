@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class RentalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rentals'
+
+    def ready(self):
+        from bouldering_cy.caching import (invalidate_on_change, FLEET,
+                                           AVAILABILITY)
+        from images.renditions import track_images
+        from .models import Crashpad, CrashpadGalleryImage, CrashpadBooking
+        invalidate_on_change(FLEET, Crashpad, CrashpadGalleryImage)
+        invalidate_on_change(AVAILABILITY, Crashpad, CrashpadBooking)
+        track_images(Crashpad, 'image', namespace=FLEET)
+        track_images(CrashpadGalleryImage, 'image', namespace=FLEET)
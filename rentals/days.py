@@ -0,0 +1,46 @@
+"""
+Rebuilding the materialised CrashpadDay table from the bookings.
+
+Used by the `backfill_crashpad_days` command. Takes the model classes as
+arguments, so it also works with historical models.
+"""
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Sum
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def rebuild_days(booking_model, day_model, batch_size=BATCH_SIZE):
+    """
+    Replace every CrashpadDay with the days of the confirmed bookings.
+    Where bookings already overlap the earliest one keeps the day.
+    Returns (days created, double-booked days skipped).
+    """
+    bookings = booking_model.objects.filter(status='confirmed')
+    with transaction.atomic():
+        day_model.objects.all().delete()
+        batch = []
+        rows = bookings.order_by('check_in', 'pk').values_list(
+            'pk', 'crashpad_id', 'check_in', 'check_out')
+        for pk, crashpad_id, check_in, check_out in rows.iterator(
+                chunk_size=batch_size):
+            batch.extend(
+                day_model(crashpad_id=crashpad_id,
+                          date=check_in + timedelta(days=offset),
+                          booking_id=pk)
+                for offset in range((check_out - check_in).days + 1))
+            if len(batch) >= batch_size:
+                day_model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        day_model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    created = day_model.objects.count()
+    expected = bookings.aggregate(days=Sum('rental_days'))['days'] or 0
+    skipped = expected - created
+    if skipped:
+        logger.warning(f"{skipped} crashpad days are booked more than once")
+    return created, skipped
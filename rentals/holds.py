@@ -0,0 +1,106 @@
+"""
+Rental holds.
+
+When checkout starts, each crashpad in the cart is held for its dates for
+STOCK_HOLD_TIMEOUT seconds under the checkout's PaymentIntent id. Holds
+count against availability everywhere (`Crashpad.is_available` and the
+booking views), and the final check at order creation is a single lookup
+of the checkout's own hold. Creating the order replaces the holds with
+bookings.
+
+Overlapping holds are rejected at commit by an exclusion constraint on
+PostgreSQL. On SQLite the first statement of `place_rental_holds` is a
+write, which takes the database write lock, so concurrent checkouts check
+and hold one after another.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from bouldering_cy.caching import bump_version, AVAILABILITY
+from .models import Crashpad, RentalHold
+
+logger = logging.getLogger(__name__)
+
+
+class RentalUnavailable(Exception):
+    """Raised when a crashpad can't be held for the dates requested."""
+
+    def __init__(self, crashpad, check_in, check_out):
+        self.crashpad = crashpad
+        self.check_in = check_in
+        self.check_out = check_out
+        name = crashpad.name if crashpad else 'a crashpad'
+        super().__init__(f"{name} is no longer available from {check_in} "
+                         f"to {check_out}")
+
+
+def _invalidate():
+    # Holds are written in bulk, bypassing the invalidation signals
+    bump_version(AVAILABILITY)
+    transaction.on_commit(lambda: bump_version(AVAILABILITY))
+
+
+def place_rental_holds(reference, rentals, previous=None):
+    """
+    Hold each (crashpad id, check in, check out) in `rentals` under
+    `reference` until STOCK_HOLD_TIMEOUT from now, replacing any holds
+    already placed under it or under `previous`.
+    Raises RentalUnavailable, leaving no holds, if a crashpad is booked or
+    held by another checkout for any of its dates.
+    """
+    now = timezone.now()
+    dates = {crashpad_id: (check_in, check_out)
+             for crashpad_id, check_in, check_out in rentals}
+    try:
+        with transaction.atomic():
+            # Expired holds would still trip the exclusion constraint.
+            # Being a write, this also serialises checkouts on SQLite.
+            cleared = RentalHold.objects.filter(
+                Q(reference__in=[r for r in (reference, previous) if r])
+                | Q(crashpad_id__in=dates, expires_at__lte=now)).delete()[0]
+            # Row locks serialise checkouts of the same crashpads elsewhere
+            crashpads = list(Crashpad.objects.select_for_update().filter(
+                pk__in=dates).order_by('pk'))
+            unavailable = Crashpad.unavailable_ids(
+                (crashpad_id, check_in, check_out)
+                for crashpad_id, (check_in, check_out) in dates.items())
+            for crashpad in crashpads:
+                if crashpad.pk in unavailable:
+                    raise RentalUnavailable(crashpad, *dates[crashpad.pk])
+            RentalHold.objects.bulk_create([
+                RentalHold(crashpad_id=crashpad_id,
+                           reference=reference,
+                           check_in=check_in,
+                           check_out=check_out,
+                           expires_at=now + timedelta(
+                               seconds=settings.STOCK_HOLD_TIMEOUT))
+                for crashpad_id, (check_in, check_out) in dates.items()
+            ])
+    except IntegrityError as e:
+        # Lost a race to a concurrent checkout (PostgreSQL only)
+        logger.warning(f"Overlapping rental hold for {reference}: {e}")
+        check_in, check_out = next(iter(dates.values()))
+        raise RentalUnavailable(None, check_in, check_out)
+    if dates or cleared:
+        _invalidate()
+        logger.info(f"Placed rental holds for {reference}: {dates}")
+
+
+def release_rental_holds(reference):
+    """Drop the holds placed under `reference`. Returns how many."""
+    released = RentalHold.objects.filter(reference=reference).delete()[0]
+    if released:
+        _invalidate()
+    return released
+
+
+def release_expired_rental_holds():
+    """Delete every expired hold in one query. Returns how many."""
+    released = RentalHold.objects.filter(
+        expires_at__lte=timezone.now()).delete()[0]
+    if released:
+        _invalidate()
+    return released
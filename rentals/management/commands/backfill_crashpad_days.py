@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from rentals.days import rebuild_days, BATCH_SIZE
+from rentals.models import CrashpadBooking, CrashpadDay
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the booked crashpad days used for availability from '
+            'the confirmed bookings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=BATCH_SIZE,
+                            help='Rows inserted per query (default: '
+                            '%(default)s)')
+
+    def handle(self, *args, **options):
+        created, skipped = rebuild_days(CrashpadBooking,
+                                        CrashpadDay,
+                                        batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f"Backfilled {created} crashpad days"))
+        if skipped:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Skipped {skipped} days booked more than once; "
+                    "check the overlapping bookings"))
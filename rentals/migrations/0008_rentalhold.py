@@ -0,0 +1,69 @@
+# Generated by Django 4.2.18 on 2026-10-19 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CONSTRAINT_NAME = 'rentals_rentalhold_no_overlap'
+
+
+def create_exclusion_constraint(apps, schema_editor):
+    """
+    Reject overlapping holds for a crashpad at commit, on PostgreSQL only.
+    Other databases rely on rentals.holds serialising writers instead.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Needed for the equality operator on crashpad_id in a gist index
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        f"ALTER TABLE rentals_rentalhold ADD CONSTRAINT {CONSTRAINT_NAME} "
+        "EXCLUDE USING gist (crashpad_id WITH =, "
+        "daterange(check_in, check_out, '[]') WITH &&)")
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE rentals_rentalhold "
+        f"DROP CONSTRAINT IF EXISTS {CONSTRAINT_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0007_alter_crashpadbooking_daily_rate_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentalHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=255)),
+                ('check_in', models.DateField()),
+                ('check_out', models.DateField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='crashpadbooking',
+            index=models.Index(condition=models.Q(('status', 'confirmed')), fields=['crashpad', 'check_in', 'check_out'], name='rentals_booking_overlap_idx'),
+        ),
+        migrations.AddField(
+            model_name='rentalhold',
+            name='crashpad',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='rentals.crashpad'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalhold',
+            index=models.Index(fields=['crashpad', 'check_in', 'check_out'], name='rentals_hold_overlap_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rentalhold',
+            constraint=models.UniqueConstraint(fields=('reference', 'crashpad'), name='unique_rental_hold_per_crashpad'),
+        ),
+        migrations.RunPython(create_exclusion_constraint,
+                             drop_exclusion_constraint),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.18 on 2026-10-19 12:35
+
+from datetime import timedelta
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_days(apps, schema_editor):
+    """
+    Availability is read from the new table, so fill it straight away.
+    Where bookings already overlap the earliest one keeps the day.
+    Kept self-contained rather than calling rentals.days, so later
+    changes to the app can't change what this migration does.
+    """
+    CrashpadBooking = apps.get_model('rentals', 'CrashpadBooking')
+    CrashpadDay = apps.get_model('rentals', 'CrashpadDay')
+    rows = CrashpadBooking.objects.filter(status='confirmed').order_by(
+        'check_in', 'pk').values_list('pk', 'crashpad_id', 'check_in',
+                                      'check_out')
+    batch = []
+    for pk, crashpad_id, check_in, check_out in rows.iterator(
+            chunk_size=1000):
+        batch.extend(
+            CrashpadDay(crashpad_id=crashpad_id,
+                        date=check_in + timedelta(days=offset),
+                        booking_id=pk)
+            for offset in range((check_out - check_in).days + 1))
+        if len(batch) >= 1000:
+            CrashpadDay.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    CrashpadDay.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0008_rentalhold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrashpadDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='days', to='rentals.crashpadbooking')),
+                ('crashpad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_days', to='rentals.crashpad')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date', 'crashpad'], name='rentals_day_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='crashpadday',
+            constraint=models.UniqueConstraint(fields=('crashpad', 'date'), name='unique_crashpad_day'),
+        ),
+        migrations.RunPython(backfill_days, migrations.RunPython.noop),
+    ]
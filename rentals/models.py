@@ -1,14 +1,26 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.db.models import Q
 import os
+from functools import reduce
+from operator import or_
 from orders.models import Order
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def overlapping(check_in, check_out):
+    """
+    Match bookings or holds sharing at least one day with the inclusive
+    `check_in`-`check_out` range: those starting during it, ending during
+    it or encompassing it.
+    """
+    return Q(check_in__lte=check_out, check_out__gte=check_in)
+
+
 class Crashpad(models.Model):
     name = models.CharField(max_length=100, blank=False, null=False)
     brand = models.CharField(max_length=100, blank=False, null=False)
@@ -35,13 +47,13 @@ class Crashpad(models.Model):
     def __str__(self):
         return self.name
 
-    def is_available(self, check_in, check_out):
+    def is_available(self, check_in, check_out, hold_reference=None):
         """
         Check if the crashpad is available for the given dates.
-        A crashpad is unavailable if there exists any confirmed booking that:
-        - starts during our requested period, OR
-        - ends during our requested period, OR
-        - completely encompasses our requested period
+        A crashpad is unavailable if any confirmed booking, or any active
+        hold placed by another checkout, shares a day with the period.
+        A checkout holding exactly these dates under `hold_reference` is
+        confirmed from its hold alone.
         Note: We normalize dates to ensure consistent comparison
         regardless of time components.
         """
@@ -56,25 +68,68 @@ class Crashpad(models.Model):
             f"to {check_out}"
         )
 
-        conflicting_bookings = CrashpadBooking.objects.filter(
-            crashpad=self, status='confirmed').filter(
-                # Booking starts during our period
-                Q(check_in__gte=check_in, check_in__lte=check_out) |
-                # Booking ends during our period
-                Q(check_out__gte=check_in, check_out__lte=check_out) |
-                # Booking encompasses our period
-                Q(check_in__lte=check_in, check_out__gte=check_out))
+        # The hold was only placed after checking for conflicts, and the
+        # holds exclude overlaps, so it is enough on its own
+        if hold_reference and RentalHold.objects.active().filter(
+                reference=hold_reference,
+                crashpad=self,
+                check_in=check_in,
+                check_out=check_out).exists():
+            return True
+
+        # Booked days are materialised, so this is an index range lookup
+        conflicting_days = CrashpadDay.objects.filter(
+            crashpad=self, date__range=(check_in, check_out))
 
         # Debug output to help diagnose issues
-        if conflicting_bookings.exists():
+        if conflicting_days.exists():
             logger.info(
                 f"Found conflicting bookings: {list(
-                    conflicting_bookings.values(
-                        'id', 'check_in', 'check_out'
-                        ))}"
+                    conflicting_days.values_list(
+                        'booking_id', flat=True).distinct())}"
             )
+            return False
 
-        return not conflicting_bookings.exists()
+        conflicting_holds = RentalHold.objects.active().filter(
+            overlapping(check_in, check_out), crashpad=self)
+        if hold_reference:
+            conflicting_holds = conflicting_holds.exclude(
+                reference=hold_reference)
+        return not conflicting_holds.exists()
+
+    @staticmethod
+    def unavailable_ids(rentals, hold_reference=None):
+        """
+        The ids of the crashpads in `rentals`, one (crashpad id, check in,
+        check out) per crashpad, that are not available for their dates,
+        decided as by `is_available` but in at most three queries however
+        many rentals there are.
+        """
+        rentals = list(rentals)
+        if hold_reference and rentals:
+            held = set(RentalHold.objects.active().filter(
+                reduce(or_, (Q(crashpad_id=crashpad_id,
+                               check_in=check_in,
+                               check_out=check_out)
+                             for crashpad_id, check_in, check_out in rentals)),
+                reference=hold_reference).values_list('crashpad_id',
+                                                      flat=True))
+            rentals = [rental for rental in rentals if rental[0] not in held]
+        if not rentals:
+            return set()
+
+        booked = CrashpadDay.objects.filter(
+            reduce(or_, (Q(crashpad_id=crashpad_id,
+                           date__range=(check_in, check_out))
+                         for crashpad_id, check_in, check_out in rentals)))
+        held = RentalHold.objects.active().filter(
+            reduce(or_, (Q(crashpad_id=crashpad_id)
+                         & overlapping(check_in, check_out)
+                         for crashpad_id, check_in, check_out in rentals)))
+        if hold_reference:
+            held = held.exclude(reference=hold_reference)
+        return (set(booked.values_list('crashpad_id', flat=True))
+                | set(held.values_list('crashpad_id', flat=True)))
 
 
 def crashpad_gallery_upload_path(instance, filename):
@@ -149,31 +204,52 @@ class CrashpadBooking(models.Model):
     def get_customer_phone(self):
         return self.order.phone
 
+    def booked_days(self):
+        """The CrashpadDay rows covering the booking, check-out included"""
+        return [
+            CrashpadDay(crashpad_id=self.crashpad_id,
+                        date=self.check_in + timedelta(days=offset),
+                        booking=self)
+            for offset in range(self.calculate_rental_days())
+        ]
+
+    def sync_days(self, adding=False):
+        """Materialise the booked days, or drop them if cancelled"""
+        if not adding:
+            self.days.all().delete()
+        if self.status == 'confirmed':
+            CrashpadDay.objects.bulk_create(self.booked_days())
+
     def save(self, *args, **kwargs):
-        """Populate calculated fields before saving"""
+        """
+        Populate calculated fields before saving, and keep the booked days
+        in step. A day already booked by another confirmed booking raises
+        IntegrityError and nothing is saved.
+        """
         self.rental_days = self.calculate_rental_days()
         self.daily_rate = self.calculate_daily_rate()
         self.total_price = self.calculate_total_price()
         self.customer_name = self.get_customer_name()
         self.customer_email = self.get_customer_email()
         self.customer_phone = self.get_customer_phone()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.sync_days(adding)
 
     @staticmethod
     def get_unavailable_crashpads_ids(check_in, check_out):
         """
-        Get all unavailable crashpads for the selected dates.
+        Get all unavailable crashpads for the selected dates, booked or
+        held by a checkout in progress.
         Returns a QuerySet of crashpad IDs that are unavailable.
         """
-        return CrashpadBooking.objects.filter(
-            status='confirmed').filter(
-                # Booking starts during our period
-                Q(check_in__gte=check_in, check_in__lte=check_out) |
-                # Booking ends during our period
-                Q(check_out__gte=check_in, check_out__lte=check_out) |
-                # Booking encompasses our period
-                Q(check_in__lte=check_in, check_out__gte=check_out)
-                ).values_list('crashpad_id', flat=True)
+        booked = CrashpadDay.objects.filter(
+            date__range=(check_in, check_out)).values('crashpad_id')
+        held = RentalHold.objects.active().filter(
+            overlapping(check_in, check_out)).values('crashpad_id')
+        return Crashpad.objects.filter(
+            Q(id__in=booked) | Q(id__in=held)).values_list('id', flat=True)
 
     def __str__(self):
         return f"Booking {self.id} - {self.crashpad.name} " \
@@ -181,3 +257,84 @@ class CrashpadBooking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Covers the overlap query of availability checks
+            models.Index(fields=['crashpad', 'check_in', 'check_out'],
+                         condition=Q(status='confirmed'),
+                         name='rentals_booking_overlap_idx'),
+        ]
+
+
+class CrashpadDay(models.Model):
+    """
+    A day on which a crashpad is booked, one row per day of each confirmed
+    CrashpadBooking, so availability is an index lookup over a date range
+    rather than a scan of overlapping bookings. The unique constraint
+    stops any day being booked twice, at the database level.
+    Kept in step by CrashpadBooking.save; `backfill_crashpad_days`
+    rebuilds it from the bookings.
+    """
+    crashpad = models.ForeignKey(Crashpad,
+                                 related_name='booked_days',
+                                 on_delete=models.CASCADE)
+    date = models.DateField()
+    booking = models.ForeignKey(CrashpadBooking,
+                                related_name='days',
+                                on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['crashpad', 'date'],
+                                    name='unique_crashpad_day'),
+        ]
+        indexes = [
+            # Which crashpads are booked over a range of dates
+            models.Index(fields=['date', 'crashpad'],
+                         name='rentals_day_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.crashpad} booked on {self.date}"
+
+
+class RentalHoldQuerySet(models.QuerySet):
+
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+
+class RentalHold(models.Model):
+    """
+    A short-lived hold on a crashpad for a date range, placed when checkout
+    starts so the dates can't be booked by someone else while the customer
+    pays. Keyed by the Stripe PaymentIntent id and replaced by a
+    CrashpadBooking when the order is created.
+
+    On PostgreSQL an exclusion constraint (see migration 0008) rejects
+    overlapping holds for a crashpad at commit.
+    """
+    crashpad = models.ForeignKey(Crashpad,
+                                 related_name='holds',
+                                 on_delete=models.CASCADE)
+    reference = models.CharField(max_length=255)
+    check_in = models.DateField()
+    check_out = models.DateField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RentalHoldQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reference', 'crashpad'],
+                                    name='unique_rental_hold_per_crashpad'),
+        ]
+        indexes = [
+            models.Index(fields=['crashpad', 'check_in', 'check_out'],
+                         name='rentals_hold_overlap_idx'),
+        ]
+
+    def __str__(self):
+        return f"Hold on {self.crashpad} ({self.check_in} to " \
+               f"{self.check_out}) for {self.reference}"
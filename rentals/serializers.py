@@ -1,25 +1,43 @@
 from rest_framework import serializers
+from bouldering_cy.caching import (CachedRepresentationMixin, FLEET,
+                                   AVAILABILITY)
+from images.renditions import build_srcset
 from .models import Crashpad, CrashpadBooking, CrashpadGalleryImage
 
 
 class CrashpadGalleryImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = CrashpadGalleryImage
-        fields = ['image']
+        fields = ['image', 'srcset']
+
+    def get_srcset(self, obj):
+        return build_srcset(obj.image)
 
 
-class CrashpadSerializer(serializers.ModelSerializer):
+class CrashpadSerializer(CachedRepresentationMixin,
+                         serializers.ModelSerializer):
     availability_status = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    cache_namespaces = (FLEET, AVAILABILITY)
     gallery_images = CrashpadGalleryImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Crashpad
         fields = [
             'id', 'name', 'description', 'day_rate', 'seven_day_rate',
-            'fourteen_day_rate', 'image', 'availability_status',
-            'gallery_images'
+            'fourteen_day_rate', 'image', 'image_srcset',
+            'availability_status', 'gallery_images'
         ]
 
+    def get_cache_key_parts(self, instance):
+        # Availability depends on the requested dates
+        return (self.context.get('check_in'), self.context.get('check_out'))
+
+    def get_image_srcset(self, obj):
+        return build_srcset(obj.image)
+
     def get_availability_status(self, obj):
         check_in = self.context.get('check_in')
         check_out = self.context.get('check_out')
@@ -27,14 +45,22 @@ class CrashpadSerializer(serializers.ModelSerializer):
         if not (check_in and check_out):
             return 'unknown'
 
-        # Check for overlapping bookings
-        overlapping_bookings = CrashpadBooking.objects.filter(
-            crashpad=obj,
-            status='confirmed',
-            check_out__gt=check_in,
-            check_in__lt=check_out).exists()
+        booked = self.get_booked_crashpad_ids(check_in, check_out)
+        return 'unavailable' if obj.pk in booked else 'available'
 
-        return 'unavailable' if overlapping_bookings else 'available'
+    def get_booked_crashpad_ids(self, check_in, check_out):
+        """
+        Crashpads booked or held for any of the dates, as the cart and
+        checkout see them, looked up once and shared by every crashpad
+        serialized with this context.
+        """
+        booked = self.context.get('booked_crashpad_ids')
+        if booked is None:
+            booked = set(
+                CrashpadBooking.get_unavailable_crashpads_ids(
+                    check_in, check_out))
+            self.context['booked_crashpad_ids'] = booked
+        return booked
 
 
 class BookingSerializer(serializers.ModelSerializer):
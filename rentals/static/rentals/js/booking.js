@@ -137,6 +137,11 @@ document.addEventListener("DOMContentLoaded", function () {
       // Update image handling
       const mainImage = card.querySelector(".card-img-top");
       mainImage.src = crashpad.image || "/static/images/noimage.png";
+      // Let the browser pick a smaller rendition when there are any
+      if (crashpad.image_srcset) {
+        mainImage.srcset = crashpad.image_srcset;
+        mainImage.sizes = "(min-width: 768px) 33vw, 100vw";
+      }
 
       // Add gallery button handler
       const galleryBtn = card.querySelector(".gallery-btn");
@@ -363,6 +368,13 @@ document.addEventListener("DOMContentLoaded", function () {
     return cookieValue;
   }
 
+  function srcsetAttrs(srcset) {
+    // Gallery slides fill the large modal
+    return srcset
+      ? `srcset="${srcset}" sizes="(min-width: 992px) 800px, 100vw"`
+      : "";
+  }
+
   function showGallery(crashpad) {
     const modal = new bootstrap.Modal(document.getElementById("galleryModal"));
     const carousel = document.querySelector("#galleryCarousel .carousel-inner");
@@ -371,14 +383,18 @@ document.addEventListener("DOMContentLoaded", function () {
     // Add main image
     const mainSlide = document.createElement("div");
     mainSlide.className = "carousel-item active";
-    mainSlide.innerHTML = `<img src="${crashpad.image}" class="d-block w-100" alt="${crashpad.name}">`;
+    mainSlide.innerHTML = `<img src="${crashpad.image}" ${srcsetAttrs(
+      crashpad.image_srcset
+    )} class="d-block w-100" alt="${crashpad.name}">`;
     carousel.appendChild(mainSlide);
 
     // Add gallery images
     crashpad.gallery_images?.forEach((image, index) => {
       const slide = document.createElement("div");
       slide.className = "carousel-item";
-      slide.innerHTML = `<img src="${image.image}" class="d-block w-100" alt="${
+      slide.innerHTML = `<img src="${image.image}" ${srcsetAttrs(
+        image.srcset
+      )} class="d-block w-100" alt="${
         crashpad.name
       } gallery image ${index + 1}">`;
       carousel.appendChild(slide);
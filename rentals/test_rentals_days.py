@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase
+from model_bakery import baker
+from orders.models import Order
+from rentals.models import Crashpad, CrashpadBooking, CrashpadDay
+
+
+class CrashpadDayTest(TestCase):
+
+    def setUp(self):
+        """Set up test data"""
+        self.crashpad = baker.make(Crashpad,
+                                   name="Big Pad",
+                                   day_rate=Decimal("10.00"),
+                                   seven_day_rate=Decimal("8.00"),
+                                   fourteen_day_rate=Decimal("6.00"))
+        self.check_in = date.today() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=2)
+
+    def book(self, check_in=None, days=3):
+        check_in = check_in or self.check_in
+        return CrashpadBooking.objects.create(
+            crashpad=self.crashpad,
+            order=baker.make(Order),
+            check_in=check_in,
+            check_out=check_in + timedelta(days=days - 1))
+
+    def booked_dates(self):
+        return list(CrashpadDay.objects.values_list('date', flat=True))
+
+    def test_confirmed_booking_materialises_its_days(self):
+        """Test a booking adds a row for every day, check-out included"""
+        booking = self.book()
+        self.assertEqual(self.booked_dates(), [
+            self.check_in, self.check_in + timedelta(days=1), self.check_out
+        ])
+        self.assertEqual(set(booking.days.values_list('crashpad', flat=True)),
+                         {self.crashpad.pk})
+
+    def test_cancelling_frees_the_days(self):
+        """Test cancelled bookings no longer occupy their days"""
+        booking = self.book()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.booked_dates(), [])
+        self.assertTrue(
+            self.crashpad.is_available(self.check_in, self.check_out))
+
+    def test_changing_dates_moves_the_days(self):
+        """Test editing a booking's dates replaces its days"""
+        booking = self.book()
+        booking.check_in += timedelta(days=5)
+        booking.check_out += timedelta(days=5)
+        booking.save()
+        self.assertEqual(self.booked_dates()[0],
+                         self.check_in + timedelta(days=5))
+        self.assertEqual(len(self.booked_dates()), 3)
+
+    def test_double_booking_is_rejected(self):
+        """Test the database refuses a day booked twice"""
+        self.book()
+        with self.assertRaises(IntegrityError):
+            self.book(check_in=self.check_out)
+        self.assertEqual(CrashpadBooking.objects.count(), 1)
+
+    def test_availability_is_a_single_lookup(self):
+        """Test availability reads only the booked days"""
+        self.book()
+        with self.assertNumQueries(2):
+            # Days table, then the conflicting bookings for the log
+            self.assertFalse(
+                self.crashpad.is_available(self.check_out,
+                                           self.check_out + timedelta(5)))
+        with self.assertNumQueries(2):
+            # Days table, then the (empty) holds
+            self.assertTrue(
+                self.crashpad.is_available(
+                    self.check_out + timedelta(days=1),
+                    self.check_out + timedelta(days=5)))
+        self.assertIn(
+            self.crashpad.pk,
+            CrashpadBooking.get_unavailable_crashpads_ids(
+                self.check_in, self.check_in))
+
+    def test_backfill_command(self):
+        """Test the backfill rebuilds the days from the bookings"""
+        self.book()
+        self.book(check_in=self.check_in + timedelta(days=20), days=2)
+        CrashpadDay.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_crashpad_days', stdout=out)
+        self.assertIn("Backfilled 5 crashpad days", out.getvalue())
+        self.assertFalse(
+            self.crashpad.is_available(self.check_in, self.check_in))
@@ -0,0 +1,133 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from model_bakery import baker
+from bouldering_cy.caching import get_version, AVAILABILITY
+from orders.models import Order
+from rentals.holds import (place_rental_holds, release_rental_holds,
+                           release_expired_rental_holds, RentalUnavailable)
+from rentals.models import Crashpad, CrashpadBooking, RentalHold
+
+
+class RentalHoldTest(TestCase):
+
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.crashpad = baker.make(Crashpad,
+                                   name="Big Pad",
+                                   day_rate=Decimal("10.00"),
+                                   seven_day_rate=Decimal("8.00"),
+                                   fourteen_day_rate=Decimal("6.00"))
+        self.other = baker.make(Crashpad,
+                                name="Small Pad",
+                                day_rate=Decimal("10.00"),
+                                seven_day_rate=Decimal("8.00"),
+                                fourteen_day_rate=Decimal("6.00"))
+        self.check_in = date.today() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=3)
+
+    def hold(self, reference='pi_1', crashpad=None, check_in=None):
+        check_in = check_in or self.check_in
+        place_rental_holds(reference, [
+            ((crashpad or self.crashpad).pk, check_in,
+             check_in + timedelta(days=3))
+        ])
+
+    def test_hold_blocks_other_checkouts(self):
+        """Test held dates are unavailable to everyone else"""
+        self.hold()
+        self.assertFalse(
+            self.crashpad.is_available(self.check_in, self.check_out))
+        # Overlapping by a single day is enough
+        self.assertFalse(
+            self.crashpad.is_available(self.check_out,
+                                       self.check_out + timedelta(days=2)))
+        self.assertTrue(
+            self.other.is_available(self.check_in, self.check_out))
+        self.assertIn(
+            self.crashpad.pk,
+            CrashpadBooking.get_unavailable_crashpads_ids(
+                self.check_in, self.check_out))
+
+    def test_own_hold_is_a_single_lookup(self):
+        """Test the holding checkout is confirmed from its hold alone"""
+        self.hold()
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                self.crashpad.is_available(self.check_in, self.check_out,
+                                           hold_reference='pi_1'))
+
+    def test_overlapping_hold_is_rejected(self):
+        """Test a second checkout can't hold overlapping dates"""
+        self.hold()
+        with self.assertRaises(RentalUnavailable):
+            self.hold('pi_2', check_in=self.check_in + timedelta(days=2))
+        self.assertEqual(RentalHold.objects.count(), 1)
+
+    def test_booked_dates_cant_be_held(self):
+        """Test confirmed bookings block holds"""
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad,
+                   order=baker.make(Order),
+                   check_in=self.check_in,
+                   check_out=self.check_out)
+        with self.assertRaises(RentalUnavailable):
+            self.hold()
+
+    def test_expired_holds_are_ignored(self):
+        """Test an expired hold no longer blocks the dates"""
+        baker.make(RentalHold,
+                   crashpad=self.crashpad,
+                   reference='pi_old',
+                   check_in=self.check_in,
+                   check_out=self.check_out,
+                   expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertTrue(
+            self.crashpad.is_available(self.check_in, self.check_out))
+        self.hold('pi_2')
+        self.assertEqual(
+            list(RentalHold.objects.values_list('reference', flat=True)),
+            ['pi_2'])
+
+    def test_new_checkout_replaces_previous_holds(self):
+        """Test restarting checkout replaces the earlier holds"""
+        self.hold('pi_1')
+        place_rental_holds('pi_2',
+                           [(self.crashpad.pk, self.check_in, self.check_out)],
+                           previous='pi_1')
+        self.assertEqual(
+            list(RentalHold.objects.values_list('reference', flat=True)),
+            ['pi_2'])
+
+    def test_holds_invalidate_availability_cache(self):
+        """Test placing and releasing holds bumps the availability cache"""
+        version = get_version(AVAILABILITY)
+        self.hold()
+        self.assertNotEqual(get_version(AVAILABILITY), version)
+        version = get_version(AVAILABILITY)
+        self.assertEqual(release_rental_holds('pi_1'), 1)
+        self.assertNotEqual(get_version(AVAILABILITY), version)
+
+    def test_release_expired_rental_holds(self):
+        """Test expired holds are deleted in bulk"""
+        baker.make(RentalHold,
+                   crashpad=self.crashpad,
+                   expires_at=timezone.now() - timedelta(minutes=1),
+                   _quantity=2)
+        self.hold(crashpad=self.other)
+        self.assertEqual(release_expired_rental_holds(), 2)
+        self.assertEqual(RentalHold.objects.count(), 1)
+
+    def test_release_expired_holds_command(self):
+        """Test the command also sweeps rental holds"""
+        baker.make(RentalHold,
+                   crashpad=self.crashpad,
+                   expires_at=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('release_expired_holds', stdout=out)
+        self.assertIn("1 expired rental holds", out.getvalue())
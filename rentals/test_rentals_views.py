@@ -3,8 +3,10 @@ from django.urls import reverse
 from decimal import Decimal
 from datetime import datetime, timedelta
 import json
-
-from rentals.models import Crashpad, CrashpadGalleryImage
+from model_bakery import baker
+from orders.models import Order
+from rentals.holds import place_rental_holds
+from rentals.models import Crashpad, CrashpadBooking, CrashpadGalleryImage
 
 
 class RentalsViewsTest(TestCase):
@@ -195,6 +197,25 @@ class RentalsViewsTest(TestCase):
         self.assertIn('availability_status', data)
         self.assertEqual(data['availability_status'], 'available')
 
+    def test_api_crashpad_detail_unavailable(self):
+        """Test held crashpads, and bookings ending on check in, show as
+        unavailable as they would in the cart"""
+        place_rental_holds('other-checkout',
+                           [(self.crashpad1.id, self.tomorrow,
+                             self.next_week)])
+        baker.make(CrashpadBooking,
+                   crashpad=self.crashpad2,
+                   order=baker.make(Order),
+                   check_in=self.tomorrow - timedelta(days=1),
+                   check_out=self.tomorrow)
+        for crashpad in (self.crashpad1, self.crashpad2):
+            url = \
+                f"{reverse('rentals:crashpad-detail', args=[crashpad.id])}" \
+                f"?check_in={self.tomorrow_str}" \
+                f"&check_out={self.next_week_str}"
+            data = json.loads(self.client.get(url).content)
+            self.assertEqual(data['availability_status'], 'unavailable')
+
     def test_api_available_crashpads_no_dates(self):
         """Test the API endpoint for available crashpads without dates"""
         url = reverse('rentals:crashpad-available')
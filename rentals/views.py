@@ -3,6 +3,9 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from bouldering_cy.caching import FLEET, AVAILABILITY
+from bouldering_cy.http_caching import cache_policy
 from .models import Crashpad, CrashpadBooking
 from .serializers import CrashpadSerializer, BookingSerializer
 from django.views.generic import TemplateView
@@ -12,6 +15,10 @@ from django.contrib import messages
 
 logger = logging.getLogger(__name__)
 
+# Availability is reused briefly and its ETags refreshed every minute, as
+# rental holds expire and dates pass without a cache version bump
+AVAILABILITY_CACHE = {'max_age': 30, 'refresh_every': 60}
+
 
 def validate_dates(check_in, check_out):
     """
@@ -29,6 +36,11 @@ def validate_dates(check_in, check_out):
     return True, None
 
 
+@method_decorator(cache_policy(FLEET,
+                               AVAILABILITY,
+                               vary=('Accept', ),
+                               **AVAILABILITY_CACHE),
+                  name='dispatch')
 class CrashpadViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API ViewSet for listing and retrieving crashpads.
@@ -134,6 +146,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
+@method_decorator(cache_policy(FLEET, AVAILABILITY, **AVAILABILITY_CACHE),
+                  name='dispatch')
 class BookingView(TemplateView):
     """
     View for displaying the crashpad booking interface.
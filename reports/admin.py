@@ -0,0 +1,83 @@
+from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.dateparse import parse_date
+from .models import DailyProductSales, DailyCrashpadRentals
+from .summary import default_range, summarize
+from .utilization import utilization
+
+
+def date_range(request, days=30):
+    """The start and end dates requested, defaulting to the last `days`."""
+    start, end = default_range(days)
+    start = parse_date(request.GET.get('start') or '') or start
+    end = parse_date(request.GET.get('end') or '') or end
+    return (start, end) if start <= end else (end, start)
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """Rollups are derived data, so they can be viewed but not edited."""
+    date_hierarchy = 'date'
+    change_list_template = 'admin/reports/change_list.html'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(RollupAdmin):
+    list_display = ('date', 'product', 'orders', 'units', 'revenue')
+    list_select_related = ('product', )
+    search_fields = ('product__name', )
+
+    def get_urls(self):
+        return [
+            path('dashboard/',
+                 self.admin_site.admin_view(self.dashboard_view),
+                 name='reports_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Sales and rentals between two dates, read from the rollups."""
+        start, end = date_range(request)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'summary': summarize(start, end),
+        }
+        return TemplateResponse(request, 'admin/reports/dashboard.html',
+                                context)
+
+
+@admin.register(DailyCrashpadRentals)
+class DailyCrashpadRentalsAdmin(RollupAdmin):
+    list_display = ('date', 'crashpad', 'bookings', 'rental_days', 'revenue',
+                    'occupied')
+    list_select_related = ('crashpad', )
+    search_fields = ('crashpad__name', )
+
+    def get_urls(self):
+        return [
+            path('utilization/',
+                 self.admin_site.admin_view(self.utilization_view),
+                 name='reports_utilization'),
+        ] + super().get_urls()
+
+    def utilization_view(self, request):
+        """Crashpad utilization, busiest weeks and idle streaks."""
+        start, end = date_range(request, days=365)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Crashpad utilization',
+            'opts': self.model._meta,
+            'report': utilization(start, end),
+        }
+        return TemplateResponse(request, 'admin/reports/utilization.html',
+                                context)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from reports.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily sales and rental rollups from all orders '
+            'and bookings.')
+
+    def handle(self, *args, **options):
+        products, rentals = rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {products} product days and "
+                               f"{rentals} crashpad days"))
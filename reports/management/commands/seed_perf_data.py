@@ -0,0 +1,515 @@
+import time
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+from math import ceil
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from bouldering_cy.caching import NAMESPACES, bump_version
+from newsletter.models import NewsletterSubscriber
+from orders.models import Order, OrderItem
+from rentals.days import rebuild_days
+from rentals.models import (Crashpad, CrashpadBooking, CrashpadDay,
+                            CrashpadGalleryImage)
+from reports.rollups import rebuild
+from shop.models import GalleryImage, Product, product_search_vector
+
+User = get_user_model()
+
+# Marks the seeded users, orders, products and crashpads for --clear
+SEED_PREFIX = 'perf-'
+PAYMENT_PREFIX = 'pi_perf'
+BATCH_SIZE = 5000
+
+# Relative demand per month: the bouldering season runs October to April
+SEASON = {
+    1: 1.0,
+    2: 1.0,
+    3: 0.9,
+    4: 0.7,
+    5: 0.4,
+    6: 0.2,
+    7: 0.15,
+    8: 0.15,
+    9: 0.3,
+    10: 0.7,
+    11: 0.9,
+    12: 1.0
+}
+# Demand at the end of the range relative to its start
+GROWTH = 2.0
+# Bookings are taken this many days ahead of the end date
+BOOKING_HORIZON = 90
+# Fleet occupancy the crashpad count is sized for, unless given
+OCCUPANCY = 0.5
+
+# (value, weight) tables
+RENTAL_DAYS = ((1, 10), (2, 25), (3, 25), (4, 15), (5, 8), (6, 5), (7, 6),
+               (10, 3), (14, 2), (21, 1))
+ITEMS_PER_ORDER = ((1, 50), (2, 25), (3, 12), (4, 8), (5, 5))
+QUANTITIES = ((1, 80), (2, 15), (3, 5))
+COUNTRIES = (('CY', 70), ('GR', 10), ('GB', 8), ('DE', 4), ('IL', 4),
+             ('FR', 2), ('US', 2))
+# Booking lead time, in days before check-in
+LEAD_DAYS = ((0, 10), (1, 15), (3, 20), (7, 25), (14, 15), (30, 10),
+             (60, 5))
+
+MIXED_SHARE = 0.2
+ACCOUNT_SHARE = 0.4
+CANCELLED_SHARE = 0.05
+ACTIVE_SHARE = 0.9
+OUT_OF_STOCK_SHARE = 0.05
+
+PRODUCT_KINDS = (
+    ('Chalk', 4, 12),
+    ('Chalk bag', 15, 40),
+    ('Brush', 3, 10),
+    ('Climbing shoes', 80, 180),
+    ('Guidebook', 20, 40),
+    ('Finger tape', 3, 8),
+    ('T-shirt', 18, 30),
+    ('Hoodie', 40, 70),
+    ('Crashpad cover', 25, 60),
+    ('Skin care balm', 8, 15),
+)
+CRASHPAD_MODELS = (
+    ('Black Diamond', 'Mondo', '107x135x13', 12),
+    ('Ocun', 'Paddy Dominator', '100x140x12', 11),
+    ('Organic', 'Full Pad', '91x122x10', 10),
+    ('Moon', 'Saturn', '100x120x11', 9),
+    ('Metolius', 'Session II', '91x122x8', 7),
+)
+FIRST_NAMES = ('Andreas', 'Maria', 'Giorgos', 'Eleni', 'Christos', 'Anna',
+               'Nikos', 'Sofia', 'James', 'Emma', 'Lukas', 'Lea', 'Yael',
+               'Daniel', 'Chloe', 'Omer')
+LAST_NAMES = ('Georgiou', 'Ioannou', 'Christodoulou', 'Papadopoulos',
+              'Constantinou', 'Smith', 'Jones', 'Muller', 'Cohen',
+              'Martin', 'Charalambous', 'Nicolaou')
+
+
+def batches(iterable, size):
+    """Split an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Weighted:
+    """Draws from a (value, weight) table."""
+
+    def __init__(self, table):
+        table = list(table)
+        self.values = [value for value, _ in table]
+        self.cum_weights = list(accumulate(weight for _, weight in table))
+
+    def draw(self, rng, k=1):
+        return rng.choices(self.values, cum_weights=self.cum_weights, k=k)
+
+    def one(self, rng):
+        return self.draw(rng)[0]
+
+
+def demand(start, days):
+    """Seasonal, growing demand for each of `days` days from `start`."""
+    return Weighted(
+        (offset, SEASON[(start + timedelta(days=offset)).month] *
+         (1 + (GROWTH - 1) * offset / days)) for offset in range(days))
+
+
+def money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let auto_now and auto_now_add fields be set by hand."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Generate a large synthetic dataset for performance testing: '
+            'users, newsletter subscribers, products and crashpads with '
+            'gallery images, and years of orders and crashpad bookings. '
+            'Demand is seasonal and grows over time, products follow a '
+            'long-tail popularity and bookings never overlap. The same '
+            '--seed and --end give the same data. Booked days and rollups '
+            'are rebuilt afterwards. Run it against a dedicated database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--orders', type=int, default=500_000)
+        parser.add_argument('--bookings', type=int, default=200_000)
+        parser.add_argument('--subscribers', type=int, default=50_000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument(
+            '--crashpads',
+            type=int,
+            default=None,
+            help='Default: enough for the bookings at '
+            f'{OCCUPANCY:.0%} occupancy')
+        parser.add_argument('--images',
+                            type=int,
+                            default=4,
+                            help='Gallery images per product and crashpad, '
+                            'on average')
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--end',
+                            type=datetime.fromisoformat,
+                            default=None,
+                            help='Last order date (default: today)')
+        parser.add_argument('--scale',
+                            type=float,
+                            default=1.0,
+                            help='Multiply every volume, e.g. 0.01 for a '
+                            'quick run')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear',
+                            action='store_true',
+                            help='Delete previously seeded data first')
+        parser.add_argument('--force',
+                            action='store_true',
+                            help='Allow running with PRODUCTION set')
+
+    def handle(self, *args, **options):
+        if settings.PRODUCTION and not options['force']:
+            raise CommandError('Refusing to seed a production database; '
+                               'use --force if this really is a copy')
+
+        scale = options['scale']
+        volumes = {
+            name: ceil(options[name] * scale)
+            for name in ('users', 'orders', 'bookings', 'subscribers',
+                         'products')
+        }
+        end = (options['end'].date()
+               if options['end'] else timezone.localdate())
+        start = end - timedelta(days=365 * options['years'])
+        booking_end = end + timedelta(days=BOOKING_HORIZON)
+        crashpads = options['crashpads'] or ceil(
+            volumes['bookings'] * self.mean_rental_days() /
+            ((booking_end - start).days * OCCUPANCY))
+        volumes['crashpads'] = max(crashpads, 1)
+        volumes['subscribers'] = min(volumes['subscribers'],
+                                     volumes['users'])
+        volumes['bookings'] = min(volumes['bookings'], volumes['orders'])
+
+        if options['clear']:
+            self.clear()
+
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        with transaction.atomic(), explicit_timestamps(
+                NewsletterSubscriber, Product, Order, CrashpadBooking):
+            users = self.seed_users(rng, volumes['users'], start, end)
+            self.seed_subscribers(rng, users, volumes['subscribers'])
+            products = self.seed_products(rng, volumes['products'], start,
+                                          options['images'])
+            fleet = self.seed_crashpads(rng, volumes['crashpads'],
+                                        options['images'])
+            bookings = self.plan_bookings(rng, len(fleet),
+                                          volumes['bookings'], start,
+                                          booking_end)
+            orders, items = self.seed_orders(rng, volumes['orders'],
+                                             bookings, users, products,
+                                             fleet, start, end)
+            days, _ = rebuild_days(CrashpadBooking, CrashpadDay,
+                                   batch_size=BATCH_SIZE)
+            rebuild()
+        bump_version(*NAMESPACES)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(users)} users, {volumes['subscribers']} "
+                f"subscribers, {len(products.values)} products, {len(fleet)} "
+                f"crashpads, {orders} orders with {items} items and "
+                f"{len(bookings)} bookings ({days} booked days) from "
+                f"{start} to {end} in "
+                f"{time.perf_counter() - started:.1f}s"))
+
+    @staticmethod
+    def mean_rental_days():
+        total = sum(weight for _, weight in RENTAL_DAYS)
+        return sum(days * weight for days, weight in RENTAL_DAYS) / total
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def clear(self):
+        """Delete everything a previous run seeded."""
+        self.log('Clearing previously seeded data...')
+        # Their stock goes with the seeded products and the rollups are
+        # rebuilt afterwards, so skip the bookkeeping Order deletes do
+        QuerySet.delete(
+            Order.objects.filter(stripe_piid__startswith=PAYMENT_PREFIX))
+        Product.objects.filter(
+            image__startswith=f"products/{SEED_PREFIX}").delete()
+        Crashpad.objects.filter(
+            image__startswith=f"crashpads/{SEED_PREFIX}").delete()
+        User.objects.filter(username__startswith=SEED_PREFIX).delete()
+
+    def moment(self, rng, day):
+        """An aware datetime on `day` during opening hours."""
+        return timezone.make_aware(
+            datetime(day.year, day.month, day.day, 8) +
+            timedelta(seconds=rng.randrange(14 * 60 * 60)))
+
+    def seed_users(self, rng, count, start, end):
+        """[(id, first name, last name, email, joined)] of new users."""
+        self.log(f"Seeding {count} users...")
+        span = (end - start).days
+        users = []
+        for batch in batches(range(count), BATCH_SIZE):
+            created = User.objects.bulk_create([
+                User(username=f"{SEED_PREFIX}{i}",
+                     email=f"{SEED_PREFIX}{i}@example.test",
+                     first_name=rng.choice(FIRST_NAMES),
+                     last_name=rng.choice(LAST_NAMES),
+                     password='!',
+                     date_joined=self.moment(
+                         rng, start + timedelta(days=rng.randrange(span))))
+                for i in batch
+            ])
+            users.extend((user.pk, user.first_name, user.last_name,
+                          user.email, user.date_joined) for user in created)
+        return users
+
+    def seed_subscribers(self, rng, users, count):
+        self.log(f"Seeding {count} newsletter subscribers...")
+        for batch in batches(rng.sample(users, count), BATCH_SIZE):
+            NewsletterSubscriber.objects.bulk_create([
+                NewsletterSubscriber(user_id=user[0],
+                                     is_active=rng.random() < ACTIVE_SHARE,
+                                     created_at=user[-1],
+                                     updated_at=user[-1]) for user in batch
+            ])
+
+    def seed_products(self, rng, count, start, images):
+        """Weighted [(id, price)], most popular first."""
+        self.log(f"Seeding {count} products...")
+        products = []
+        for i in range(count):
+            kind, low, high = rng.choice(PRODUCT_KINDS)
+            created_at = self.moment(rng, start)
+            products.append(
+                Product(name=f"{kind} {i + 1}",
+                        description=f"{kind} for bouldering.",
+                        price=money(rng.uniform(low, high)),
+                        stock=0 if rng.random() < OUT_OF_STOCK_SHARE else
+                        rng.randint(1, 200),
+                        image=f"products/{SEED_PREFIX}{i}.jpg",
+                        created_at=created_at,
+                        updated_at=created_at))
+        products = Product.objects.bulk_create(products)
+        if connection.vendor == 'postgresql':
+            Product.objects.filter(pk__in=[p.pk for p in products]).update(
+                search_vector=product_search_vector())
+        GalleryImage.objects.bulk_create(
+            (GalleryImage(product=product,
+                          image=f"product_gallery/{SEED_PREFIX}{product.pk}"
+                          f"/{n}.jpg") for product in products
+             for n in range(rng.randint(0, 2 * images))),
+            batch_size=BATCH_SIZE)
+        # A long tail: the n-th most popular sells 1/n as often as the first
+        rng.shuffle(products)
+        return Weighted(((product.pk, product.price), 1 / rank)
+                        for rank, product in enumerate(products, 1))
+
+    def seed_crashpads(self, rng, count, images):
+        """[(id, day rate, 7 day rate, 14 day rate)]"""
+        self.log(f"Seeding {count} crashpads...")
+        crashpads = []
+        for i in range(count):
+            brand, model, dimensions, rate = rng.choice(CRASHPAD_MODELS)
+            crashpads.append(
+                Crashpad(name=f"{model} {i + 1}",
+                         brand=brand,
+                         model=model,
+                         dimensions=dimensions,
+                         description=f"{brand} {model} crashpad.",
+                         day_rate=money(rate),
+                         seven_day_rate=money(rate * 0.8),
+                         fourteen_day_rate=money(rate * 0.6),
+                         image=f"crashpads/{SEED_PREFIX}{i}.jpg"))
+        crashpads = Crashpad.objects.bulk_create(crashpads)
+        CrashpadGalleryImage.objects.bulk_create(
+            (CrashpadGalleryImage(
+                crashpad=crashpad,
+                image=f"crashpad_gallery/{SEED_PREFIX}{crashpad.pk}/{n}.jpg")
+             for crashpad in crashpads
+             for n in range(rng.randint(1, 2 * images - 1))),
+            batch_size=BATCH_SIZE)
+        return [(crashpad.pk, crashpad.day_rate, crashpad.seven_day_rate,
+                 crashpad.fourteen_day_rate) for crashpad in crashpads]
+
+    def plan_bookings(self, rng, crashpads, count, start, end):
+        """
+        [(crashpad index, check-in, check-out)] spread over the fleet,
+        starting on days drawn from the demand and pushed back where they
+        would overlap the crashpad's previous booking.
+        """
+        days = (end - start).days + 1
+        starts = demand(start, days)
+        lengths = Weighted(RENTAL_DAYS)
+        per_crashpad, extra = divmod(count, crashpads)
+        bookings = []
+        for crashpad in range(crashpads):
+            free_from = 0
+            wanted = per_crashpad + (crashpad < extra)
+            for offset in sorted(starts.draw(rng, wanted)):
+                offset = max(offset, free_from)
+                length = lengths.one(rng)
+                if offset + length > days:
+                    break
+                bookings.append(
+                    (crashpad, start + timedelta(days=offset),
+                     start + timedelta(days=offset + length - 1)))
+                free_from = offset + length
+        self.log(f"Planned {len(bookings)} bookings")
+        return bookings
+
+    def seed_orders(self, rng, count, bookings, users, products, crashpads,
+                    start, end):
+        """
+        Create an order for each booking, some also buying products, and
+        product-only orders for the rest, in date order. Returns (orders,
+        items) created.
+        """
+        leads = Weighted(LEAD_DAYS)
+        plan = []
+        for index, (_, check_in, _) in enumerate(bookings):
+            day = min(max(check_in - timedelta(days=leads.one(rng)), start),
+                      end)
+            plan.append((day, index, rng.random() < MIXED_SHARE))
+        days = (end - start).days + 1
+        plan.extend((start + timedelta(days=offset), None, True)
+                    for offset in demand(start, days).draw(
+                        rng, count - len(bookings)))
+        plan.sort(key=lambda entry: entry[0])
+        self.log(f"Seeding {len(plan)} orders...")
+
+        countries = Weighted(COUNTRIES)
+        sizes = Weighted(ITEMS_PER_ORDER)
+        quantities = Weighted(QUANTITIES)
+        fee = money(settings.RENTAL_HANDLING_FEE)
+        threshold = Decimal(str(settings.FREE_DELIVERY_THRESHOLD))
+        delivery_share = Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) / 100
+        number = 0
+        item_count = 0
+        for batch in batches(plan, BATCH_SIZE):
+            orders, lines = [], []
+            for day, booking, buys in batch:
+                number += 1
+                if users and rng.random() < ACCOUNT_SHARE:
+                    user_id, first_name, last_name, email, _ = rng.choice(
+                        users)
+                else:
+                    user_id = None
+                    first_name = rng.choice(FIRST_NAMES)
+                    last_name = rng.choice(LAST_NAMES)
+                    email = f"guest{number}@example.test"
+
+                items = {}
+                if buys:
+                    wanted = min(sizes.one(rng), len(products.values))
+                    while len(items) < wanted:
+                        product_id, price = products.one(rng)
+                        quantity = quantities.one(rng)
+                        items[product_id] = (quantity,
+                                             price * quantity)
+                rental = None
+                if booking is not None:
+                    rental = self.price_booking(crashpads, *bookings[booking])
+                product_total = sum(total for _, total in items.values())
+                total = product_total + (rental[-1] if rental else 0)
+                delivery = (money(total * delivery_share)
+                            if items and total < threshold else Decimal(0))
+                handling = fee if rental else Decimal(0)
+                when = self.moment(rng, day)
+                order_type = ('MIXED' if items and rental else
+                              'RENTALS_ONLY' if rental else 'PRODUCTS_ONLY')
+                orders.append(
+                    Order(order_number=f"BC-{day:%Y%m%d}-P{number:06X}",
+                          stripe_piid=f"{PAYMENT_PREFIX}{number:010d}",
+                          user_id=user_id,
+                          first_name=first_name,
+                          last_name=last_name,
+                          email=email,
+                          phone=f"99{rng.randrange(10 ** 6):06d}",
+                          address_line1=f"{rng.randint(1, 200)} Test Street",
+                          town_or_city='Nicosia',
+                          postal_code=f"{rng.randint(1000, 8999)}",
+                          country=countries.one(rng),
+                          date_created=when,
+                          date_updated=when,
+                          order_total=total,
+                          delivery_cost=delivery,
+                          handling_fee=handling,
+                          grand_total=total + delivery + handling,
+                          order_type=order_type))
+                lines.append((items, rental, when))
+
+            orders = Order.objects.bulk_create(orders)
+            order_items, order_bookings = [], []
+            for order, (items, rental, when) in zip(orders, lines):
+                order_items.extend(
+                    OrderItem(order=order,
+                              product_id=product_id,
+                              quantity=quantity,
+                              item_total=item_total)
+                    for product_id, (quantity, item_total) in items.items())
+                if rental:
+                    crashpad_id, check_in, check_out, days, rate, total = (
+                        rental)
+                    order_bookings.append(
+                        CrashpadBooking(
+                            crashpad_id=crashpad_id,
+                            order=order,
+                            check_in=check_in,
+                            check_out=check_out,
+                            rental_days=days,
+                            daily_rate=rate,
+                            total_price=total,
+                            status='cancelled'
+                            if rng.random() < CANCELLED_SHARE else
+                            'confirmed',
+                            created_at=when,
+                            updated_at=when,
+                            customer_name=f"{order.first_name} "
+                            f"{order.last_name}",
+                            customer_email=order.email,
+                            customer_phone=order.phone))
+            OrderItem.objects.bulk_create(order_items)
+            CrashpadBooking.objects.bulk_create(order_bookings)
+            item_count += len(order_items)
+        return number, item_count
+
+    @staticmethod
+    def price_booking(crashpads, crashpad, check_in, check_out):
+        """The calculated fields CrashpadBooking.save would fill in."""
+        crashpad_id, day_rate, seven_day_rate, fourteen_day_rate = (
+            crashpads[crashpad])
+        days = (check_out - check_in).days + 1
+        rate = (fourteen_day_rate if days >= 14 else
+                seven_day_rate if days >= 7 else day_rate)
+        return crashpad_id, check_in, check_out, days, rate, rate * days
@@ -0,0 +1,56 @@
+from django.db import models
+from shop.models import Product
+from rentals.models import Crashpad
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue of a product sold on one day (order date)."""
+    date = models.DateField()
+    product = models.ForeignKey(Product,
+                                related_name='daily_sales',
+                                on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12,
+                                  decimal_places=2,
+                                  default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'],
+                                    name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} on {self.date}"
+
+
+class DailyCrashpadRentals(models.Model):
+    """
+    Rentals of a crashpad on one day. Bookings, rental days and revenue
+    count towards the day the order was placed; `occupied` counts the
+    confirmed bookings covering the day itself.
+    """
+    date = models.DateField()
+    crashpad = models.ForeignKey(Crashpad,
+                                 related_name='daily_rentals',
+                                 on_delete=models.CASCADE)
+    bookings = models.IntegerField(default=0)
+    rental_days = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12,
+                                  decimal_places=2,
+                                  default=0)
+    occupied = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily crashpad rentals'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'crashpad'],
+                                    name='unique_daily_crashpad_rentals'),
+        ]
+
+    def __str__(self):
+        return f"{self.crashpad} on {self.date}"
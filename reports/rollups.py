@@ -0,0 +1,172 @@
+"""
+Daily sales and rental rollups.
+
+DailyProductSales and DailyCrashpadRentals hold per-day totals so reports
+never have to scan orders. They are kept up to date incrementally:
+
+- product sales are added when an order's items are created
+  (`payments.utils.create_order_items`) and removed when orders are
+  deleted (`OrderQuerySet.delete`);
+- crashpad rentals follow CrashpadBooking saves and deletes through
+  signals (creation, cancellation, date changes, deletion). Order deletion
+  removes its bookings up front, in bulk, and their delete signals then
+  leave them alone.
+
+Each change is applied as deltas: missing rows are inserted, then every
+affected row is incremented in one bulk UPDATE, however many orders or
+days are involved. `rebuild_rollups` recomputes both tables from scratch.
+"""
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from orders.models import OrderItem
+from rentals.models import CrashpadBooking
+from .models import DailyProductSales, DailyCrashpadRentals
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+PRODUCT_FIELDS = ('orders', 'units', 'revenue')
+RENTAL_FIELDS = ('bookings', 'rental_days', 'revenue', 'occupied')
+
+# Ids of the bookings `removing_orders` has already taken out
+_removed_bookings = ContextVar('removed_bookings', default=frozenset())
+
+
+def _product_rows(orders=None):
+    """
+    (day, product id, orders, units, revenue) for the items of `orders`,
+    or of every order.
+    """
+    items = OrderItem.objects.all()
+    if orders is not None:
+        items = items.filter(order__in=orders)
+    return items.annotate(
+        day=TruncDate('order__date_created')).order_by().values(
+            'day', 'product_id').annotate(
+                order_count=Count('order_id', distinct=True),
+                units=Sum('quantity'),
+                revenue=Sum('item_total')).values_list(
+                    'day', 'product_id', 'order_count', 'units', 'revenue')
+
+
+def _booking_rows(bookings):
+    """The columns of `bookings` the rental rollups are built from."""
+    return bookings.annotate(day=TruncDate('order__date_created')).order_by(
+    ).values_list('day', 'crashpad_id', 'check_in', 'check_out',
+                  'rental_days', 'total_price')
+
+
+def _product_deltas(rows, sign=1):
+    deltas = {}
+    for day, product_id, orders, units, revenue in rows:
+        deltas[(day, product_id)] = {
+            'orders': sign * orders,
+            'units': sign * units,
+            'revenue': sign * revenue,
+        }
+    return deltas
+
+
+def _rental_deltas(rows, sign=1):
+    deltas = defaultdict(lambda: dict.fromkeys(RENTAL_FIELDS, 0))
+    for day, crashpad_id, check_in, check_out, days, revenue in rows:
+        sold = deltas[(day, crashpad_id)]
+        sold['bookings'] += sign
+        sold['rental_days'] += sign * days
+        sold['revenue'] += sign * revenue
+        # Check-out day included, as in CrashpadBooking.rental_days
+        for offset in range((check_out - check_in).days + 1):
+            deltas[(check_in + timedelta(days=offset),
+                    crashpad_id)]['occupied'] += sign
+    return deltas
+
+
+def _apply(model, key_field, fields, deltas):
+    """Add {(date, key id): {field: delta}} to the rollup rows."""
+    if not deltas:
+        return
+    model.objects.bulk_create(
+        [model(date=day, **{key_field: key}) for day, key in deltas],
+        ignore_conflicts=True,
+        batch_size=BATCH_SIZE)
+    rows = model.objects.filter(
+        date__in={day for day, _ in deltas},
+        **{f"{key_field}__in": {key for _, key in deltas}}).only(
+            'id', 'date', key_field)
+    changed = []
+    for row in rows:
+        delta = deltas.get((row.date, getattr(row, key_field)))
+        if not delta:
+            continue
+        for field, value in delta.items():
+            setattr(row, field, F(field) + value)
+        changed.append(row)
+    model.objects.bulk_update(changed, fields, batch_size=BATCH_SIZE)
+
+
+def record_product_sales(orders, sign=1):
+    """Add (or with sign=-1 remove) the product sales of `orders`."""
+    _apply(DailyProductSales, 'product_id', PRODUCT_FIELDS,
+           _product_deltas(_product_rows(orders), sign))
+
+
+def record_rentals(bookings, sign=1):
+    """Add (or with sign=-1 remove) `bookings` to the rental rollups."""
+    _apply(DailyCrashpadRentals, 'crashpad_id', RENTAL_FIELDS,
+           _rental_deltas(_booking_rows(bookings), sign))
+
+
+def remove_bookings(bookings):
+    """Take the confirmed ones of `bookings` out of the rental rollups."""
+    record_rentals(bookings.filter(status='confirmed'), sign=-1)
+
+
+def is_removed(booking_id):
+    """Whether the booking was taken out with its order's deletion."""
+    return booking_id in _removed_bookings.get()
+
+
+@contextmanager
+def removing_orders(orders):
+    """
+    Take the sales and bookings of `orders` out, in a fixed number of
+    queries however many there are, while they are deleted.
+    """
+    bookings = CrashpadBooking.objects.filter(order__in=orders)
+    record_product_sales(orders, sign=-1)
+    remove_bookings(bookings)
+    token = _removed_bookings.set(
+        frozenset(bookings.values_list('pk', flat=True)))
+    try:
+        yield
+    finally:
+        _removed_bookings.reset(token)
+
+
+def _insert(model, key_field, deltas):
+    model.objects.bulk_create(
+        (model(date=day, **{key_field: key}, **values)
+         for (day, key), values in deltas.items()),
+        batch_size=BATCH_SIZE)
+
+
+def rebuild():
+    """Recompute both rollup tables from every order and booking."""
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyCrashpadRentals.objects.all().delete()
+        products = _product_deltas(_product_rows().iterator())
+        _insert(DailyProductSales, 'product_id', products)
+        rentals = _rental_deltas(
+            _booking_rows(CrashpadBooking.objects.filter(
+                status='confirmed')).iterator())
+        _insert(DailyCrashpadRentals, 'crashpad_id', rentals)
+    logger.info(f"Rebuilt rollups: {len(products)} product days, "
+                f"{len(rentals)} crashpad days")
+    return len(products), len(rentals)
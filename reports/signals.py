@@ -0,0 +1,30 @@
+from django.db.models.signals import pre_save, post_save, pre_delete
+from django.dispatch import receiver
+from rentals.models import CrashpadBooking
+from .rollups import record_rentals, remove_bookings, is_removed
+
+
+@receiver(pre_save, sender=CrashpadBooking)
+def remove_previous_booking(sender, instance, raw=False, **kwargs):
+    """Take the booking out of the rollups as it was before the save."""
+    if raw or instance.pk is None:
+        return
+    remove_bookings(CrashpadBooking.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=CrashpadBooking)
+def add_saved_booking(sender, instance, raw=False, **kwargs):
+    """Add the booking back as saved, if it is confirmed."""
+    if raw:
+        return
+    record_rentals(
+        CrashpadBooking.objects.filter(pk=instance.pk, status='confirmed'))
+
+
+@receiver(pre_delete, sender=CrashpadBooking)
+def remove_deleted_booking(sender, instance, **kwargs):
+    """Take the booking out of the rollups before it is deleted."""
+    if is_removed(instance.pk):
+        # Already taken out in bulk with its order
+        return
+    remove_bookings(CrashpadBooking.objects.filter(pk=instance.pk))
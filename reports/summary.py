@@ -0,0 +1,78 @@
+"""Report queries, answered from the rollup tables only."""
+from collections import OrderedDict
+from datetime import timedelta
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import DailyProductSales, DailyCrashpadRentals
+
+# Longer ranges are broken down by month rather than by day
+MAX_DAILY_PERIODS = 92
+TOP_PRODUCTS = 10
+
+
+def default_range(days=30):
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def _by_period(queryset, monthly):
+    if monthly:
+        queryset = queryset.annotate(period=TruncMonth('date'))
+    else:
+        queryset = queryset.annotate(period=F('date'))
+    return dict(
+        queryset.order_by().values('period').annotate(
+            total=Sum('revenue')).values_list('period', 'total'))
+
+
+def summarize(start, end):
+    """Revenue, units, rentals and occupancy between two dates inclusive."""
+    days = (end - start).days + 1
+    monthly = days > MAX_DAILY_PERIODS
+    products = DailyProductSales.objects.filter(date__range=(start, end))
+    rentals = DailyCrashpadRentals.objects.filter(date__range=(start, end))
+
+    totals = products.aggregate(product_revenue=Sum('revenue'),
+                                units=Sum('units'))
+    totals.update(
+        rentals.aggregate(rental_revenue=Sum('revenue'),
+                          bookings=Sum('bookings'),
+                          rental_days=Sum('rental_days')))
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['revenue'] = totals['product_revenue'] + totals['rental_revenue']
+
+    product_periods = _by_period(products, monthly)
+    rental_periods = _by_period(rentals, monthly)
+    periods = OrderedDict(
+        (period, {
+            'products': product_periods.get(period) or 0,
+            'rentals': rental_periods.get(period) or 0,
+        }) for period in sorted(set(product_periods) | set(rental_periods)))
+    for values in periods.values():
+        values['total'] = values['products'] + values['rentals']
+
+    top_products = products.order_by().values(
+        'product_id', 'product__name').annotate(
+            units=Sum('units'),
+            revenue=Sum('revenue')).order_by('-revenue')[:TOP_PRODUCTS]
+
+    crashpads = list(
+        rentals.order_by().values('crashpad_id', 'crashpad__name').annotate(
+            bookings=Sum('bookings'),
+            rental_days=Sum('rental_days'),
+            revenue=Sum('revenue'),
+            occupied=Sum('occupied')).order_by('-revenue'))
+    for crashpad in crashpads:
+        crashpad['occupancy'] = round(100 * crashpad['occupied'] / days, 1)
+
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'monthly': monthly,
+        'totals': totals,
+        'periods': periods,
+        'top_products': list(top_products),
+        'crashpads': crashpads,
+    }
@@ -0,0 +1,294 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
+from newsletter.models import NewsletterSubscriber
+from orders.models import Order, OrderItem
+from rentals.models import Crashpad, CrashpadBooking, CrashpadDay
+from reports.models import DailyProductSales, DailyCrashpadRentals
+from reports.rollups import record_product_sales
+from reports.summary import summarize
+from reports.utilization import utilization
+from shop.models import Product
+
+
+class RollupTest(TestCase):
+
+    def setUp(self):
+        """Set up test data"""
+        self.today = timezone.localdate()
+        self.product = baker.make(Product,
+                                  name="Chalk Bag",
+                                  price=Decimal("20.00"),
+                                  stock=50)
+        self.crashpad = baker.make(Crashpad,
+                                   name="Big Pad",
+                                   day_rate=Decimal("10.00"),
+                                   seven_day_rate=Decimal("8.00"),
+                                   fourteen_day_rate=Decimal("6.00"))
+        self.check_in = date.today() + timedelta(days=10)
+
+    def sell(self, quantity=1):
+        order = baker.make(Order)
+        OrderItem.objects.create(order=order,
+                                 product=self.product,
+                                 quantity=quantity)
+        record_product_sales([order.pk])
+        return order
+
+    def book(self, days=3):
+        return CrashpadBooking.objects.create(
+            crashpad=self.crashpad,
+            order=baker.make(Order),
+            check_in=self.check_in,
+            check_out=self.check_in + timedelta(days=days - 1))
+
+    def product_day(self):
+        return DailyProductSales.objects.get(date=self.today,
+                                             product=self.product)
+
+    def test_sales_are_added_incrementally(self):
+        """Test each order adds to the product's day"""
+        self.sell(2)
+        self.sell(1)
+        row = self.product_day()
+        self.assertEqual((row.orders, row.units, row.revenue),
+                         (2, 3, Decimal("60.00")))
+
+    def test_deleting_orders_removes_sales(self):
+        """Test deleted orders are taken back out of the rollups"""
+        first = self.sell(2)
+        self.sell(1)
+        self.book()
+        Order.objects.filter(pk=first.pk).delete()
+        row = self.product_day()
+        self.assertEqual((row.orders, row.units, row.revenue),
+                         (1, 1, Decimal("20.00")))
+        # The booking's order survived, so its rental stays counted
+        self.assertEqual(
+            DailyCrashpadRentals.objects.get(date=self.today).bookings, 1)
+
+    def test_bookings_follow_their_status(self):
+        """Test bookings are added on save and removed on cancellation"""
+        booking = self.book(days=3)
+        sold = DailyCrashpadRentals.objects.get(date=self.today)
+        self.assertEqual((sold.bookings, sold.rental_days, sold.revenue),
+                         (1, 3, booking.total_price))
+        self.assertEqual(
+            DailyCrashpadRentals.objects.filter(date__gte=self.check_in,
+                                                occupied=1).count(), 3)
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertFalse(
+            DailyCrashpadRentals.objects.exclude(
+                bookings=0, rental_days=0, revenue=0, occupied=0).exists())
+
+    def test_deleted_bookings_are_removed(self):
+        """Test bookings deleted on their own, with their crashpad or with
+        their order are taken out of the rollups once"""
+        def is_empty():
+            return not DailyCrashpadRentals.objects.exclude(
+                bookings=0, rental_days=0, revenue=0, occupied=0).exists()
+
+        self.book().delete()
+        self.assertTrue(is_empty())
+
+        self.book()
+        self.crashpad.delete()
+        self.assertTrue(is_empty())
+
+        self.crashpad = baker.make(Crashpad, day_rate=Decimal("10.00"))
+        self.book().order.delete()
+        self.assertTrue(is_empty())
+        self.assertFalse(
+            DailyCrashpadRentals.objects.filter(occupied__lt=0).exists())
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test rebuilding from scratch gives the same totals"""
+        self.sell(2)
+        self.book()
+        incremental = (list(
+            DailyProductSales.objects.values_list('date', 'product',
+                                                  'units', 'revenue')),
+                       list(
+                           DailyCrashpadRentals.objects.order_by(
+                               'date').values_list(
+                                   'date', 'bookings', 'occupied')))
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn("Rebuilt 1 product days and 4 crashpad days",
+                      out.getvalue())
+        rebuilt = (list(
+            DailyProductSales.objects.values_list('date', 'product',
+                                                  'units', 'revenue')),
+                   list(
+                       DailyCrashpadRentals.objects.order_by(
+                           'date').values_list('date', 'bookings',
+                                               'occupied')))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_summary(self):
+        """Test the summary totals and occupancy"""
+        self.sell(2)
+        self.book(days=3)
+        summary = summarize(self.today, self.check_in + timedelta(days=9))
+        self.assertEqual(summary['totals']['units'], 2)
+        self.assertEqual(summary['totals']['rental_days'], 3)
+        self.assertEqual(summary['top_products'][0]['product__name'],
+                         "Chalk Bag")
+        crashpad = summary['crashpads'][0]
+        self.assertEqual(crashpad['occupied'], 3)
+        self.assertEqual(crashpad['occupancy'],
+                         round(100 * 3 / summary['days'], 1))
+
+    def test_dashboard(self):
+        """Test the admin dashboard renders for staff"""
+        self.sell(2)
+        admin = User.objects.create_superuser('admin', 'a@example.com',
+                                              'password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:reports_dashboard'), {
+            'start': self.today.isoformat(),
+            'end': self.today.isoformat()
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Chalk Bag")
+        self.assertEqual(response.context['summary']['totals']['revenue'],
+                         Decimal("40.00"))
+
+
+class UtilizationTest(TestCase):
+
+    def setUp(self):
+        """Set up test data"""
+        self.start = date(2025, 6, 2)  # A Monday
+        self.end = self.start + timedelta(days=13)
+        self.pads = [
+            baker.make(Crashpad,
+                       name=name,
+                       day_rate=Decimal("10.00"),
+                       seven_day_rate=Decimal("8.00"),
+                       fourteen_day_rate=Decimal("6.00"))
+            for name in ("Big Pad", "Small Pad")
+        ]
+
+    def book(self, pad, first, last, status='confirmed'):
+        CrashpadBooking.objects.create(
+            crashpad=pad,
+            order=baker.make(Order),
+            check_in=self.start + timedelta(days=first),
+            check_out=self.start + timedelta(days=last),
+            status=status)
+
+    def test_occupancy_and_streaks(self):
+        """Test utilization, peak, busiest weeks and idle streaks"""
+        big, small = self.pads
+        self.book(big, 0, 4)
+        self.book(big, 10, 20)  # Runs past the end of the range
+        self.book(small, 3, 5)
+        self.book(small, 7, 9, status='cancelled')
+
+        with self.assertNumQueries(3):
+            report = utilization(self.start, self.end)
+
+        pads = {pad['name']: pad for pad in report['crashpads']}
+        self.assertEqual(pads['Big Pad']['occupied_days'], 9)
+        self.assertEqual(pads['Big Pad']['utilization'], 64.3)
+        self.assertEqual(
+            (pads['Big Pad']['longest_idle'], pads['Big Pad']['idle_from']),
+            (5, self.start + timedelta(days=5)))
+        self.assertEqual(pads['Small Pad']['longest_idle'], 8)
+        self.assertEqual(report['peak'], 2)
+        self.assertEqual(report['peak_day'], self.start + timedelta(days=3))
+        self.assertEqual(report['fully_booked_days'], 2)
+        self.assertEqual(report['utilization'], 42.9)
+        self.assertEqual(report['busiest_weeks'][0], {
+            'week': self.start,
+            'pad_days': 8,
+            'utilization': 57.1
+        })
+
+    def test_utilization_view(self):
+        """Test the admin utilization report renders for staff"""
+        self.book(self.pads[0], 0, 2)
+        admin = User.objects.create_superuser('admin', 'a@example.com',
+                                              'password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:reports_utilization'), {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat()
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Big Pad")
+        self.assertEqual(response.context['report']['peak'], 1)
+
+
+class SeedPerfDataTest(TestCase):
+    """Test the seed_perf_data command at a tiny scale"""
+
+    def seed(self, seed=0, *args):
+        call_command('seed_perf_data',
+                     '--users=30',
+                     '--orders=120',
+                     '--bookings=40',
+                     '--subscribers=10',
+                     '--products=8',
+                     '--years=1',
+                     '--end=2026-06-30',
+                     f'--seed={seed}',
+                     *args,
+                     stdout=StringIO())
+        return list(
+            Order.objects.order_by('order_number').values_list(
+                'order_number', 'email', 'date_created', 'grand_total'))
+
+    def test_volumes_and_consistency(self):
+        """Test the requested volumes are created and add up"""
+        self.seed()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(NewsletterSubscriber.objects.count(), 10)
+        self.assertEqual(Product.objects.count(), 8)
+        self.assertEqual(Order.objects.count(), 120)
+        bookings = CrashpadBooking.objects.all()
+        self.assertEqual(bookings.count(), 40)
+
+        # No two bookings overlap, so every confirmed day is materialised
+        confirmed = bookings.filter(status='confirmed')
+        self.assertEqual(
+            CrashpadDay.objects.count(),
+            sum(booking.rental_days for booking in confirmed))
+        self.assertEqual(
+            DailyProductSales.objects.aggregate(Sum('units'))['units__sum'],
+            OrderItem.objects.aggregate(Sum('quantity'))['quantity__sum'])
+
+        for order in Order.objects.prefetch_related('items', 'crashpads'):
+            lines = (sum(item.item_total for item in order.items.all()) +
+                     sum(booking.total_price
+                         for booking in order.crashpads.all()))
+            self.assertEqual(order.order_total, lines)
+            self.assertEqual(
+                order.grand_total,
+                order.order_total + order.delivery_cost + order.handling_fee)
+            self.assertLessEqual(order.date_created.date(),
+                                 date(2026, 6, 30))
+
+    def test_deterministic_by_seed(self):
+        """Test the same seed gives the same data and --clear replaces it"""
+        first = self.seed(1)
+        self.assertEqual(self.seed(1, '--clear'), first)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertNotEqual(self.seed(2, '--clear'), first)
+
+    @override_settings(PRODUCTION=True)
+    def test_refuses_production(self):
+        """Test production databases are not seeded without --force"""
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.assertFalse(Order.objects.exists())
@@ -0,0 +1,106 @@
+"""
+Crashpad utilization over a date range.
+
+Bookings are read as bare (crashpad, check-in, check-out) tuples and
+turned into a crashpad x day occupancy matrix with difference arrays:
+each booking marks +1 on its first day and -1 after its last, and a
+running sum per crashpad fills in every day in between. The cost is one
+step per booking plus one C-level `accumulate` per crashpad, whatever the
+length of the bookings, so ranges of several years take milliseconds.
+"""
+from collections import Counter
+from datetime import timedelta
+from itertools import accumulate, groupby
+from rentals.models import Crashpad, CrashpadBooking
+
+BUSIEST_WEEKS = 5
+
+
+def occupancy(start, end):
+    """
+    {crashpad id: bookings covering each day from `start` to `end`},
+    check-out day included as in CrashpadBooking.rental_days.
+    """
+    days = (end - start).days + 1
+    diffs = {
+        pk: [0] * (days + 1)
+        for pk in Crashpad.objects.values_list('pk', flat=True)
+    }
+    bookings = CrashpadBooking.objects.filter(
+        status='confirmed', check_in__lte=end,
+        check_out__gte=start).values_list('crashpad_id', 'check_in',
+                                          'check_out')
+    for crashpad_id, check_in, check_out in bookings.iterator():
+        diff = diffs[crashpad_id]
+        diff[max((check_in - start).days, 0)] += 1
+        diff[min((check_out - start).days, days - 1) + 1] -= 1
+    return {pk: list(accumulate(diff[:-1])) for pk, diff in diffs.items()}
+
+
+def _longest_idle(row, start):
+    """(length, first day) of the longest run of unbooked days."""
+    longest, first = 0, None
+    offset = 0
+    for booked, run in groupby(row, key=bool):
+        length = sum(1 for _ in run)
+        if not booked and length > longest:
+            longest, first = length, start + timedelta(days=offset)
+        offset += length
+    return longest, first
+
+
+def utilization(start, end):
+    """Per-crashpad and fleet utilization between two dates inclusive."""
+    days = (end - start).days + 1
+    matrix = occupancy(start, end)
+    names = dict(Crashpad.objects.values_list('pk', 'name'))
+
+    crashpads = []
+    for pk, row in matrix.items():
+        occupied = days - row.count(0)
+        idle, idle_from = _longest_idle(row, start)
+        crashpads.append({
+            'crashpad_id': pk,
+            'name': names[pk],
+            'occupied_days': occupied,
+            'utilization': round(100 * occupied / days, 1),
+            'longest_idle': idle,
+            'idle_from': idle_from,
+            # Above 1 only if the same pad was booked twice for a day
+            'peak_overlap': max(row, default=0),
+        })
+    crashpads.sort(key=lambda crashpad: -crashpad['utilization'])
+
+    # Crashpads out on each day
+    fleet = [sum(map(bool, day)) for day in zip(*matrix.values())]
+    capacity = len(matrix)
+
+    weeks = Counter()
+    week_days = Counter()
+    for offset, out in enumerate(fleet):
+        day = start + timedelta(days=offset)
+        monday = day - timedelta(days=day.weekday())
+        weeks[monday] += out
+        week_days[monday] += 1
+    busiest_weeks = [{
+        'week': monday,
+        'pad_days': pad_days,
+        'utilization': round(
+            100 * pad_days / (capacity * week_days[monday]), 1),
+    } for monday, pad_days in weeks.most_common(BUSIEST_WEEKS) if pad_days]
+
+    peak = max(fleet, default=0)
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'crashpads': crashpads,
+        'utilization': round(100 * sum(fleet) / (capacity * days), 1)
+        if capacity else 0,
+        'peak': peak,
+        'peak_day': start + timedelta(days=fleet.index(peak)) if peak
+        else None,
+        # Days every crashpad was out: any further requests were turned away
+        'fully_booked_days': fleet.count(capacity) if capacity else 0,
+        'busiest_weeks': busiest_weeks,
+    }
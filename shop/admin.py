@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django_summernote.admin import SummernoteModelAdmin
-from .models import Product, GalleryImage
+from .models import Product, GalleryImage, StockReservation
+from .search import search_product_ids
 
 
 class GalleryImageInline(admin.TabularInline):
@@ -12,11 +13,68 @@ class GalleryImageInline(admin.TabularInline):
     max_num = 10
 
 
+class StockFilter(admin.SimpleListFilter):
+    title = 'stock'
+    parameter_name = 'stock_level'
+
+    def lookups(self, request, model_admin):
+        return (('in', 'In stock'), ('low', 'Low stock'),
+                ('out', 'Out of stock'))
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.with_stock_level().filter(
+                stock_level=self.value())
+        return queryset
+
+
+class PriceRangeFilter(admin.SimpleListFilter):
+    title = 'price'
+    parameter_name = 'price_range'
+    ranges = {
+        'under-20': (None, 20),
+        '20-50': (20, 50),
+        'over-50': (50, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return (('under-20', 'Under €20'), ('20-50', '€20 to €50'),
+                ('over-50', 'Over €50'))
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        if low is not None:
+            queryset = queryset.filter(price__gte=low)
+        if high is not None:
+            queryset = queryset.filter(price__lt=high)
+        return queryset
+
+
 @admin.register(Product)
 class ProductAdmin(SummernoteModelAdmin):
     list_display = ('name', 'price', 'stock', 'is_active', 'created_at')
     search_fields = ('name', 'description')
-    list_filter = ('is_active', 'created_at')
+    list_filter = ('is_active', StockFilter, PriceRangeFilter, 'created_at')
     summernote_fields = ('description',)
 
     inlines = [GalleryImageInline]  # Add the inline for multiple image uploads
+
+    def get_search_results(self, request, queryset, search_term):
+        """Use the indexed product search instead of icontains scans."""
+        if not search_term.strip():
+            return queryset, False
+        ids = search_product_ids(query=search_term,
+                                 active_only=False,
+                                 limit=None)
+        return queryset.filter(pk__in=ids), False
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity', 'reference', 'expires_at')
+    list_select_related = ('product', )
+    search_fields = ('reference', 'product__name')
+    readonly_fields = ('product', 'reference', 'quantity', 'expires_at',
+                       'created_at')
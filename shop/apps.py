@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        from bouldering_cy.caching import invalidate_on_change, CATALOGUE
+        from images.renditions import track_images
+        from .models import Product, GalleryImage
+        invalidate_on_change(CATALOGUE, Product, GalleryImage)
+        track_images(Product, 'image', namespace=CATALOGUE)
+        track_images(GalleryImage, 'image', namespace=CATALOGUE)
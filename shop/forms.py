@@ -0,0 +1,48 @@
+from django import forms
+
+
+class ProductSearchForm(forms.Form):
+    """Search and filter form for the shop listing."""
+    q = forms.CharField(required=False,
+                        max_length=100,
+                        label='Search',
+                        widget=forms.TextInput(attrs={
+                            'placeholder': 'Search products',
+                            'class': 'form-control',
+                        }))
+    min_price = forms.DecimalField(required=False,
+                                   min_value=0,
+                                   decimal_places=2,
+                                   label='Min €',
+                                   widget=forms.NumberInput(attrs={
+                                       'class': 'form-control',
+                                       'step': '0.01',
+                                   }))
+    max_price = forms.DecimalField(required=False,
+                                   min_value=0,
+                                   decimal_places=2,
+                                   label='Max €',
+                                   widget=forms.NumberInput(attrs={
+                                       'class': 'form-control',
+                                       'step': '0.01',
+                                   }))
+    in_stock = forms.BooleanField(
+        required=False,
+        label='In stock only',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        min_price = cleaned_data.get('min_price')
+        max_price = cleaned_data.get('max_price')
+        if (min_price is not None and max_price is not None
+                and min_price > max_price):
+            raise forms.ValidationError(
+                'The minimum price cannot be above the maximum price.')
+        return cleaned_data
+
+    def has_filters(self):
+        """Whether the visitor searched or filtered at all."""
+        return self.is_valid() and any(
+            value not in (None, '', False)
+            for value in self.cleaned_data.values())
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from rentals.holds import release_expired_rental_holds
+from shop.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = ('Delete expired stock and rental holds in bulk. Expired holds '
+            'already stop counting against availability; this keeps the '
+            'tables small. Schedule it to run every few minutes.')
+
+    def handle(self, *args, **options):
+        stock = release_expired_holds()
+        rentals = release_expired_rental_holds()
+        self.stdout.write(
+            self.style.SUCCESS(f"Released {stock} expired stock holds and "
+                               f"{rentals} expired rental holds"))
@@ -0,0 +1,40 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'shop_product_search_vector_gin'
+
+
+def create_search_index(apps, schema_editor):
+    """Index and populate the search vector on PostgreSQL only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON shop_product USING gin (search_vector)")
+    schema_editor.execute(
+        "UPDATE shop_product SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_remove_product_slug_alter_product_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,9 +1,56 @@
 import os
-from django.db import models
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, connection
+from django.db.models import (Case, When, Value, F, OuterRef, Subquery,
+                              Sum)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
 
 
+SEARCH_CONFIG = 'english'
+
+
+def product_search_vector():
+    """Weighted full-text vector of a product's name and description."""
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('description', weight='B', config=SEARCH_CONFIG))
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def with_stock_level(self, threshold=None, field='stock'):
+        """
+        Annotate each product with its `stock_level` ('out', 'low' or 'in')
+        so stock badges for a whole listing come from the one query.
+        `field` is the stock to go by, e.g. 'available_stock' after
+        with_available_stock().
+        """
+        if threshold is None:
+            threshold = settings.LOW_STOCK_THRESHOLD
+        return self.annotate(stock_level=Case(
+            When(**{f"{field}__lte": 0}, then=Value('out')),
+            When(**{f"{field}__lte": threshold}, then=Value('low')),
+            default=Value('in'),
+            output_field=models.CharField()))
+
+    def with_available_stock(self, exclude_reference=None):
+        """
+        Annotate each product with its `available_stock`: the stock less
+        the quantity held by unexpired reservations. Holds placed under
+        `exclude_reference` (the caller's own checkout) are not deducted.
+        """
+        holds = StockReservation.objects.filter(
+            product=OuterRef('pk'), expires_at__gt=timezone.now())
+        if exclude_reference:
+            holds = holds.exclude(reference=exclude_reference)
+        held = holds.order_by().values('product').annotate(
+            total=Sum('quantity')).values('total')
+        return self.annotate(available_stock=F('stock') - Coalesce(
+            Subquery(held, output_field=models.IntegerField()), 0))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -13,10 +60,21 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Only populated and GIN-indexed on PostgreSQL, see shop.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The vector is computed by the database from the saved columns
+        if connection.vendor == 'postgresql':
+            Product.objects.filter(pk=self.pk).update(
+                search_vector=product_search_vector())
+
     def is_in_stock(self):
         return self.stock > 0
 
@@ -24,17 +82,32 @@ class Product(models.Model):
         """Check if product is running low on stock"""
         return 0 < self.stock <= threshold
 
+    def available_quantity(self):
+        """
+        Stock not held by other checkouts, when annotated by
+        with_available_stock(), otherwise the plain stock.
+        """
+        return max(getattr(self, 'available_stock', self.stock), 0)
+
     def has_stock(self, quantity=1):
         """Check if requested quantity is available"""
-        return self.stock >= quantity
+        return self.available_quantity() >= quantity
 
     def get_stock_status(self):
         """Returns stock status message and CSS class"""
-        if self.stock == 0:
+        # Less any stock held by checkouts, if annotated
+        quantity = self.available_quantity()
+        # Use the level annotated by with_stock_level() when available
+        level = getattr(self, 'stock_level', None)
+        if level is None:
+            level = 'out' if quantity == 0 else \
+                'low' if quantity <= settings.LOW_STOCK_THRESHOLD else 'in'
+
+        if level == 'out':
             return {'message': 'Out of Stock', 'css_class': 'text-danger'}
-        elif self.is_low_stock():
+        elif level == 'low':
             return {
-                'message': f'Only {self.stock} left!',
+                'message': f'Only {quantity} left!',
                 'css_class': 'text-warning'
             }
         return {'message': 'In Stock', 'css_class': 'text-success'}
@@ -58,3 +131,33 @@ class GalleryImage(models.Model):
 
     def __str__(self):
         return f"Gallery image for {self.product.name}"
+
+
+class StockReservation(models.Model):
+    """
+    A time-limited hold on stock, placed when checkout starts so the same
+    units can't be sold to someone else while the customer pays. Holds are
+    keyed by the Stripe PaymentIntent id and turned into a sale (deleted
+    along with the stock decrement) when the order is created.
+    """
+    product = models.ForeignKey(Product,
+                                related_name="reservations",
+                                on_delete=models.CASCADE)
+    reference = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reference', 'product'],
+                                    name='unique_reservation_per_product'),
+        ]
+        indexes = [
+            # Covers the active holds sum for a product
+            models.Index(fields=['product', 'expires_at'],
+                         name='shop_reservation_active_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product} for {self.reference}"
@@ -0,0 +1,137 @@
+"""
+Stock reservations.
+
+When checkout starts, the cart's products are held for STOCK_HOLD_TIMEOUT
+seconds under the checkout's PaymentIntent id. Availability everywhere else
+is `stock - active holds`, read with `Product.objects.with_available_stock`,
+so a product can't be sold twice while one customer is paying. Creating the
+order converts the holds into a sale: the stock is decremented and the
+holds deleted in one transaction.
+
+Expired holds no longer count against availability; the
+`release_expired_holds` command just deletes them in bulk to keep the table
+small.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from bouldering_cy.caching import bump_version, CATALOGUE, STOCK
+from .models import Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a product can't cover the quantity requested."""
+
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f"Only {available} units of {product.name} "
+                         "available")
+
+
+def _invalidate():
+    """Listings show the available stock, so drop their cached copies."""
+    bump_version(STOCK)
+    transaction.on_commit(lambda: bump_version(STOCK))
+
+
+def place_holds(reference, quantities, previous=None):
+    """
+    Hold `quantities` ({product id: quantity}) under `reference` until
+    STOCK_HOLD_TIMEOUT from now, replacing any holds already placed under
+    it or under `previous` (an earlier checkout of the same cart).
+    Raises InsufficientStock, leaving no holds, if a product falls short.
+    """
+    expires_at = timezone.now() + timedelta(
+        seconds=settings.STOCK_HOLD_TIMEOUT)
+    with transaction.atomic():
+        StockReservation.objects.filter(
+            reference__in=[r for r in (reference, previous) if r]).delete()
+        # Lock the rows so concurrent checkouts check and hold in turn
+        products = Product.objects.select_for_update().filter(
+            pk__in=quantities).with_available_stock().order_by('pk')
+        for product in products:
+            if not product.has_stock(quantities[product.pk]):
+                raise InsufficientStock(product,
+                                        product.available_quantity())
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id,
+                             reference=reference,
+                             quantity=quantity,
+                             expires_at=expires_at)
+            for product_id, quantity in quantities.items() if quantity > 0
+        ])
+    _invalidate()
+    logger.info(f"Placed stock holds for {reference}: {quantities}")
+
+
+def release_holds(reference):
+    """Drop the holds placed under `reference`."""
+    released = StockReservation.objects.filter(
+        reference=reference).delete()[0]
+    if released:
+        _invalidate()
+    return released
+
+
+def _per_product(quantities):
+    """An expression giving each product its quantity in `quantities`."""
+    return Case(*[When(pk=pk, then=Value(quantity))
+                  for pk, quantity in quantities.items()],
+                default=Value(0),
+                output_field=IntegerField())
+
+
+def sell_stock(reference, quantities):
+    """
+    Decrement the stock of sold products and delete the holds placed for
+    the sale, atomically. Each decrement only applies while enough stock
+    is left, so stock can never go negative.
+    Raises InsufficientStock and rolls back if a product falls short.
+    """
+    sold = _per_product(quantities)
+    with transaction.atomic():
+        # One UPDATE for the whole sale, skipping products short of stock
+        updated = Product.objects.filter(
+            pk__in=quantities,
+            stock__gte=sold).update(stock=F('stock') - sold)
+        if updated < len(quantities):
+            # Rolled back with the transaction
+            product = Product.objects.filter(
+                pk__in=quantities, stock__lt=sold).order_by('pk').first()
+            if product is None:
+                raise Product.DoesNotExist(
+                    f"Sold products not found: {list(quantities)}")
+            raise InsufficientStock(product, product.stock)
+        release_holds(reference)
+    # update() skips the signals that invalidate cached listings
+    bump_version(CATALOGUE)
+    transaction.on_commit(lambda: bump_version(CATALOGUE))
+
+
+def return_stock(quantities):
+    """
+    Add `quantities` ({product id: quantity}) back to the products' stock
+    in a single UPDATE, e.g. when orders are deleted.
+    """
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') + _per_product(quantities))
+    # update() skips the signals that invalidate cached listings
+    bump_version(CATALOGUE)
+    transaction.on_commit(lambda: bump_version(CATALOGUE))
+
+
+def release_expired_holds():
+    """Delete every expired hold in one query. Returns how many."""
+    released = StockReservation.objects.filter(
+        expires_at__lte=timezone.now()).delete()[0]
+    if released:
+        _invalidate()
+    return released
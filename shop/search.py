@@ -0,0 +1,96 @@
+"""
+Product search.
+
+On PostgreSQL products are matched against the GIN-indexed `search_vector`
+column and ranked with `SearchRank`. Other databases (SQLite in
+development and tests) fall back to LIKE matching on the name and
+description, ranking name matches first.
+
+Ranked ids are cached per normalised query under the catalogue version,
+so repeated searches don't touch the product table until it changes.
+In-stock searches are cached under the stock version too, as they leave
+out products whose stock is held by checkouts in progress.
+"""
+from decimal import Decimal
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from bouldering_cy.caching import get_or_set, CATALOGUE, STOCK
+from .models import Product, SEARCH_CONFIG
+
+# Cap the ids cached per query; nobody pages past this many results
+MAX_RESULTS = 500
+
+
+def uses_full_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def normalize_query(query):
+    """Lower-case the query and collapse whitespace."""
+    return ' '.join((query or '').lower().split())
+
+
+def _full_text_search(products, query):
+    search_query = SearchQuery(query,
+                               config=SEARCH_CONFIG,
+                               search_type='websearch')
+    return products.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)).order_by(
+            '-rank', 'id')
+
+
+def _like_search(products, query):
+    terms = query.split()
+    for term in terms:
+        products = products.filter(
+            Q(name__icontains=term) | Q(description__icontains=term))
+    return products.annotate(rank=Case(
+        When(name__icontains=query, then=Value(3)),
+        When(Q(*[Q(name__icontains=term) for term in terms],
+               _connector=Q.OR),
+             then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField())).order_by('-rank', 'id')
+
+
+def search_product_ids(query='',
+                       min_price=None,
+                       max_price=None,
+                       in_stock=False,
+                       active_only=True,
+                       limit=MAX_RESULTS):
+    """
+    Return the ids of products matching the filters, best match first.
+    Without a text query products are listed by id. Pass limit=None to
+    return every match.
+    """
+    query = normalize_query(query)
+    min_price = Decimal(min_price) if min_price is not None else None
+    max_price = Decimal(max_price) if max_price is not None else None
+
+    def run_search():
+        products = Product.objects.all()
+        if active_only:
+            products = products.filter(is_active=True)
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+        if max_price is not None:
+            products = products.filter(price__lte=max_price)
+        if in_stock:
+            products = products.with_available_stock().filter(
+                available_stock__gt=0)
+
+        if not query:
+            products = products.order_by('id')
+        elif uses_full_text_search():
+            products = _full_text_search(products, query)
+        else:
+            products = _like_search(products, query)
+        ids = products.values_list('id', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    key = (f"product-search:{query}:{min_price}:{max_price}:"
+           f"{int(bool(in_stock))}:{int(bool(active_only))}:{limit}")
+    namespaces = (CATALOGUE, STOCK) if in_stock else (CATALOGUE, )
+    return get_or_set(namespaces, key, run_search)
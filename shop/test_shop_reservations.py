@@ -0,0 +1,142 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from model_bakery import baker
+from bouldering_cy.caching import get_version, CATALOGUE
+from cart.cart import Cart
+from shop.models import Product, StockReservation
+from shop.reservations import (place_holds, release_holds, sell_stock,
+                               release_expired_holds, InsufficientStock)
+
+
+class StockReservationTest(TestCase):
+
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.product = baker.make(Product,
+                                  name="Chalk Bag",
+                                  price=Decimal("20.00"),
+                                  stock=5)
+        self.other = baker.make(Product,
+                                name="Brush",
+                                price=Decimal("5.00"),
+                                stock=3)
+
+    def available(self, product, exclude_reference=None):
+        return Product.objects.with_available_stock(
+            exclude_reference).get(pk=product.pk).available_quantity()
+
+    def test_holds_reduce_availability(self):
+        """Test active holds are deducted from the stock"""
+        place_holds('pi_1', {self.product.pk: 2, self.other.pk: 1})
+        self.assertEqual(self.available(self.product), 3)
+        self.assertEqual(self.available(self.other), 2)
+        # A checkout's own holds don't count against it
+        self.assertEqual(self.available(self.product, 'pi_1'), 5)
+
+    def test_expired_holds_are_ignored(self):
+        """Test expired holds no longer count against availability"""
+        baker.make(StockReservation,
+                   product=self.product,
+                   reference='pi_old',
+                   quantity=4,
+                   expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.available(self.product), 5)
+
+    def test_availability_in_one_query(self):
+        """Test availability of a whole listing is read in one query"""
+        place_holds('pi_1', {self.product.pk: 2})
+        with self.assertNumQueries(1):
+            products = list(Product.objects.with_available_stock())
+        self.assertEqual({p.pk: p.available_stock
+                          for p in products},
+                         {self.product.pk: 3, self.other.pk: 3})
+
+    def test_insufficient_stock_places_no_holds(self):
+        """Test a hold that can't be covered leaves nothing held"""
+        place_holds('pi_1', {self.product.pk: 4})
+        with self.assertRaises(InsufficientStock) as raised:
+            place_holds('pi_2', {self.other.pk: 1, self.product.pk: 2})
+        self.assertEqual(raised.exception.available, 1)
+        self.assertFalse(
+            StockReservation.objects.filter(reference='pi_2').exists())
+
+    def test_new_checkout_replaces_previous_holds(self):
+        """Test restarting checkout replaces the earlier holds"""
+        place_holds('pi_1', {self.product.pk: 4})
+        place_holds('pi_2', {self.product.pk: 5}, previous='pi_1')
+        self.assertEqual(
+            list(StockReservation.objects.values_list('reference',
+                                                      'quantity')),
+            [('pi_2', 5)])
+
+    def test_sell_stock_converts_holds(self):
+        """Test selling decrements stock and drops the holds"""
+        place_holds('pi_1', {self.product.pk: 2})
+        version = get_version(CATALOGUE)
+        sell_stock('pi_1', {self.product.pk: 2})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertNotEqual(get_version(CATALOGUE), version)
+
+    def test_sell_stock_never_oversells(self):
+        """Test a sale exceeding the stock is rolled back"""
+        place_holds('pi_1', {self.product.pk: 1})
+        with self.assertRaises(InsufficientStock):
+            sell_stock('pi_1', {self.other.pk: 1, self.product.pk: 6})
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.stock, 3)
+        self.assertTrue(StockReservation.objects.exists())
+
+    def test_release_holds(self):
+        """Test releasing a checkout's holds"""
+        place_holds('pi_1', {self.product.pk: 2, self.other.pk: 1})
+        self.assertEqual(release_holds('pi_1'), 2)
+        self.assertEqual(self.available(self.product), 5)
+
+    def test_release_expired_holds(self):
+        """Test expired holds are deleted in bulk"""
+        baker.make(StockReservation,
+                   product=self.product,
+                   quantity=1,
+                   expires_at=timezone.now() - timedelta(minutes=1),
+                   _quantity=3)
+        place_holds('pi_1', {self.product.pk: 1})
+        self.assertEqual(release_expired_holds(), 3)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_release_expired_holds_command(self):
+        """Test the release_expired_holds command"""
+        baker.make(StockReservation,
+                   product=self.product,
+                   quantity=1,
+                   expires_at=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('release_expired_holds', stdout=out)
+        self.assertIn("Released 1 expired stock holds", out.getvalue())
+
+    def test_cart_validation_uses_availability(self):
+        """Test the cart checks stock held by other checkouts"""
+        cart_data = {
+            'cart_items': [{
+                'id': self.product.pk,
+                'quantity': 3,
+                'price': '20.00'
+            }]
+        }
+        place_holds('pi_other', {self.product.pk: 3})
+        has_errors, error = Cart(cart_data=cart_data).has_invalid_items()
+        self.assertTrue(has_errors)
+        self.assertEqual(error['available'], 2)
+
+        # The same cart is valid against its own holds
+        place_holds('pi_mine', {self.product.pk: 2})
+        release_holds('pi_other')
+        cart = Cart(cart_data=cart_data, hold_reference='pi_mine')
+        self.assertEqual(cart.has_invalid_items(), (False, None))
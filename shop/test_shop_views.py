@@ -5,8 +5,14 @@ from decimal import Decimal
 import re
 import tempfile
 from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from shop.models import Product, GalleryImage
+from shop.views import get_product_page
+from shop.reservations import place_holds, release_holds
+from shop.search import search_product_ids
 
 # Create a temporary media root for testing
 TEMP_MEDIA_ROOT = tempfile.mkdtemp()
@@ -141,3 +147,216 @@ class ShopViewTest(TestCase):
         products = self.response.context['products']
         self.assertEqual(len(products), 1)  # Only active products
         self.assertEqual(products[0], self.product)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, SHOP_PAGE_SIZE=2)
+class ShopPaginationTest(TestCase):
+
+    def setUp(self):
+        """Set up five active products with gallery images"""
+        cache.clear()
+        self.products = [
+            baker.make(Product,
+                       name=f"Product {i}",
+                       price=Decimal("10.00"),
+                       stock=stock,
+                       is_active=True,
+                       _fill_optional=False)
+            for i, stock in enumerate([20, 5, 0, 20, 20])
+        ]
+        for product in self.products:
+            baker.make(GalleryImage, product=product, _fill_optional=False,
+                       _quantity=2)
+        self.url = reverse('shop')
+
+        self.patcher = patch(
+            'django.db.models.fields.files.ImageFieldFile.url',
+            new_callable=lambda: '/mock/image/url.jpg')
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def test_first_page(self):
+        """Test the first page holds the first products and a next link"""
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context['products']),
+                         self.products[:2])
+        self.assertEqual(response.context['next_cursor'],
+                         self.products[1].id)
+        self.assertIsNone(response.context['previous_cursor'])
+        self.assertContains(response, f'?after={self.products[1].id}')
+
+    def test_next_and_previous_pages(self):
+        """Test paging forwards and back with id cursors"""
+        response = self.client.get(self.url,
+                                   {'after': self.products[1].id})
+        self.assertEqual(list(response.context['products']),
+                         self.products[2:4])
+        self.assertEqual(response.context['previous_cursor'],
+                         self.products[2].id)
+
+        response = self.client.get(self.url,
+                                   {'before': self.products[2].id})
+        self.assertEqual(list(response.context['products']),
+                         self.products[:2])
+        self.assertIsNone(response.context['previous_cursor'])
+
+    def test_last_page(self):
+        """Test the last page has no next link"""
+        response = self.client.get(self.url,
+                                   {'after': self.products[3].id})
+        self.assertEqual(list(response.context['products']),
+                         self.products[4:])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Test a malformed cursor falls back to the first page"""
+        response = self.client.get(self.url, {'after': 'abc'})
+        self.assertEqual(list(response.context['products']),
+                         self.products[:2])
+
+    def test_queries_do_not_grow_with_products(self):
+        """Test the listing uses two queries whatever the page holds"""
+        # Products with their stock level, then their gallery images
+        with self.assertNumQueries(2):
+            get_product_page(page_size=5)
+
+    def test_cached_page_skips_product_queries(self):
+        """Test a repeat visit is served without querying products"""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(
+            [q for q in queries if 'shop_product' in q['sql']])
+
+    def test_product_change_refreshes_page(self):
+        """Test editing a product shows on the next visit"""
+        self.client.get(self.url)
+        self.products[0].name = "Renamed product"
+        self.products[0].save()
+
+        response = self.client.get(self.url)
+        self.assertContains(response, "Renamed product")
+
+    def test_stock_badges(self):
+        """Test stock badges come from the annotated stock level"""
+        response = self.client.get(self.url, {'after': self.products[0].id})
+        self.assertContains(response, 'Only 5 left!')
+        self.assertContains(response, 'Out of Stock')
+
+    def test_stock_badges_leave_out_held_stock(self):
+        """Test stock held by a checkout isn't shown as available, and
+        cached pages are refreshed when it is held or released"""
+        self.client.get(self.url, {'after': self.products[0].id})
+
+        place_holds('pi_badge', {self.products[1].pk: 2})
+        response = self.client.get(self.url, {'after': self.products[0].id})
+        self.assertContains(response, 'Only 3 left!')
+
+        place_holds('pi_badge', {self.products[1].pk: 5})
+        response = self.client.get(self.url, {'after': self.products[0].id})
+        self.assertNotContains(response, 'Only')
+        self.assertNotContains(response, 'name="quantity"')
+
+        release_holds('pi_badge')
+        response = self.client.get(self.url, {'after': self.products[0].id})
+        self.assertContains(response, 'Only 5 left!')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, SHOP_PAGE_SIZE=2)
+class ShopSearchTest(TestCase):
+
+    def setUp(self):
+        """Set up products to search"""
+        cache.clear()
+        self.guide = baker.make(Product,
+                                name="Cyprus Bouldering Guide",
+                                description="<p>Every boulder in Cyprus</p>",
+                                price=Decimal("29.99"),
+                                stock=10,
+                                _fill_optional=False)
+        self.chalk = baker.make(Product,
+                                name="Chalk Bag",
+                                description="<p>Handy for the guide walk</p>",
+                                price=Decimal("12.00"),
+                                stock=0,
+                                _fill_optional=False)
+        self.brush = baker.make(Product,
+                                name="Brush",
+                                description="<p>Clean holds</p>",
+                                price=Decimal("5.00"),
+                                stock=3,
+                                _fill_optional=False)
+        self.hidden = baker.make(Product,
+                                 name="Old Guide",
+                                 price=Decimal("9.00"),
+                                 is_active=False,
+                                 _fill_optional=False)
+        self.url = reverse('shop')
+
+    def test_name_matches_rank_first(self):
+        """Test products named after the query rank above others"""
+        self.assertEqual(search_product_ids(query='guide'),
+                         [self.guide.id, self.chalk.id])
+
+    def test_all_terms_must_match(self):
+        """Test multi-word queries match products with every term"""
+        self.assertEqual(search_product_ids(query='cyprus guide'),
+                         [self.guide.id])
+
+    def test_filters(self):
+        """Test price range and in-stock filters"""
+        self.assertEqual(
+            search_product_ids(min_price=Decimal('10'),
+                               max_price=Decimal('20')), [self.chalk.id])
+        self.assertEqual(search_product_ids(in_stock=True),
+                         [self.guide.id, self.brush.id])
+
+    def test_in_stock_leaves_out_held_stock(self):
+        """Test in-stock searches follow stock holds placed and released"""
+        search_product_ids(in_stock=True)
+        place_holds('checkout-1', {self.brush.id: 3})
+        self.assertEqual(search_product_ids(in_stock=True), [self.guide.id])
+        release_holds('checkout-1')
+        self.assertEqual(search_product_ids(in_stock=True),
+                         [self.guide.id, self.brush.id])
+
+    def test_results_cached_per_normalized_query(self):
+        """Test equivalent queries share a cache entry"""
+        search_product_ids(query='Guide')
+        with self.assertNumQueries(0):
+            search_product_ids(query='  guide ')
+
+    def test_product_change_refreshes_results(self):
+        """Test cached results are dropped when the catalogue changes"""
+        search_product_ids(query='brush')
+        self.brush.name = "Comb"
+        self.brush.save()
+        self.assertEqual(search_product_ids(query='brush'), [])
+
+    def test_search_view(self):
+        """Test the shop lists ranked, paginated results"""
+        response = self.client.get(self.url, {'q': 'guide'})
+        self.assertTrue(response.context['is_search'])
+        self.assertEqual(list(response.context['products']),
+                         [self.guide, self.chalk])
+        self.assertNotContains(response, self.hidden.name)
+        self.assertContains(response, '2 results found.')
+
+    def test_search_view_pages(self):
+        """Test search results are paged with the query preserved"""
+        response = self.client.get(self.url, {'max_price': '30'})
+        self.assertEqual(response.context['next_page'], 2)
+        self.assertContains(response, '?max_price=30&amp;page=2')
+
+        response = self.client.get(self.url, {'max_price': '30', 'page': 2})
+        self.assertEqual(list(response.context['products']), [self.brush])
+        self.assertIsNone(response.context['next_page'])
+
+    def test_invalid_price_range(self):
+        """Test an inverted price range shows an error and all products"""
+        response = self.client.get(self.url, {
+            'min_price': '50',
+            'max_price': '10'
+        })
+        self.assertNotIn('is_search', response.context)
+        self.assertContains(response, 'The minimum price cannot be above')
@@ -1,9 +1,128 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from django.shortcuts import render
-from .models import Product
+from bouldering_cy.caching import get_or_set, CATALOGUE, STOCK
+from bouldering_cy.http_caching import cache_policy
+from .forms import ProductSearchForm
+from .models import Product, GalleryImage
+from .search import search_product_ids
 
+# Columns the listing template actually uses
+LISTING_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'image',
+                  'is_active')
+# Seconds listings are reused for, as stock holds expire without a cache
+# version bump
+STOCK_REFRESH = 60
 
+
+def _parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def listing_queryset():
+    """
+    Products with what the listing shows, in two queries per page. Stock
+    held by checkouts in progress isn't shown as available.
+    """
+    return Product.objects.only(*LISTING_FIELDS).with_available_stock(
+    ).with_stock_level(field='available_stock').prefetch_related(
+        Prefetch('gallery_images',
+                 queryset=GalleryImage.objects.only(
+                     'id', 'product_id', 'image').order_by('id')))
+
+
+def get_product_page(after=None, before=None, page_size=None):
+    """
+    Return one page of active products using keyset pagination on id,
+    along with whether there are more products after and before it.
+
+    Seeking by id stays fast however deep the page, unlike OFFSET, and
+    pages don't shift when products are added or removed meanwhile.
+    """
+    if page_size is None:
+        page_size = settings.SHOP_PAGE_SIZE
+
+    products = listing_queryset().filter(is_active=True)
+
+    # Fetch one extra row to tell whether another page follows
+    if before:
+        page = list(
+            products.filter(id__lt=before).order_by('-id')[:page_size + 1])
+        has_before = len(page) > page_size
+        page = page[:page_size][::-1]
+        has_after = True
+    else:
+        if after:
+            products = products.filter(id__gt=after)
+        page = list(products.order_by('id')[:page_size + 1])
+        has_after = len(page) > page_size
+        page = page[:page_size]
+        has_before = after is not None
+
+    return page, has_after, has_before
+
+
+def get_search_page(ids, page_number, page_size=None):
+    """Load one page of ranked search results, keeping the rank order."""
+    if page_size is None:
+        page_size = settings.SHOP_PAGE_SIZE
+    start = (page_number - 1) * page_size
+    page_ids = ids[start:start + page_size]
+    products = listing_queryset().in_bulk(page_ids)
+    return [products[pk] for pk in page_ids if pk in products]
+
+
+@cache_policy(CATALOGUE, STOCK, max_age=60, refresh_every=STOCK_REFRESH)
 def shop_view(request):
-    products = Product.objects.filter(is_active=True)
-    context = {"products": products}
+    form = ProductSearchForm(request.GET or None)
+    context = {
+        "search_form": form,
+        "fragment_timeout": settings.CACHE_NAMESPACE_TIMEOUT,
+    }
+
+    if form.has_filters():
+        # Ranked ids are cached per query; pages are slices of them
+        ids = search_product_ids(
+            query=form.cleaned_data['q'],
+            min_price=form.cleaned_data['min_price'],
+            max_price=form.cleaned_data['max_price'],
+            in_stock=form.cleaned_data['in_stock'])
+        page_number = _parse_cursor(request.GET.get('page')) or 1
+        page_size = settings.SHOP_PAGE_SIZE
+        products = get_search_page(ids, page_number)
+
+        query = request.GET.copy()
+        query.pop('page', None)
+        context.update({
+            "products": products,
+            "is_search": True,
+            "result_count": len(ids),
+            "search_query": query.urlencode(),
+            "next_page": page_number + 1
+            if len(ids) > page_number * page_size else None,
+            "previous_page": page_number - 1 if page_number > 1 else None,
+        })
+        return render(request, "shop/shop.html", context)
+
+    after = _parse_cursor(request.GET.get('after'))
+    before = None if after else _parse_cursor(request.GET.get('before'))
+
+    # Pages are reused until a product, gallery image or stock hold changes
+    products, has_next, has_previous = get_or_set(
+        (CATALOGUE, STOCK),
+        f"shop-page:{after}:{before}:{settings.SHOP_PAGE_SIZE}",
+        lambda: get_product_page(after, before),
+        timeout=STOCK_REFRESH)
+
+    context.update({
+        "products": products,
+        "next_cursor": products[-1].id if products and has_next else None,
+        "previous_cursor":
+        products[0].id if products and has_previous else None,
+    })
 
     return render(request, "shop/shop.html", context)
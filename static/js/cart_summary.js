@@ -0,0 +1,40 @@
+// The cart badge is filled in from the cart summary endpoint rather than
+// rendered with each page, so pages don't depend on the session and can be
+// cached. Scripts rendering the cart can listen for "cart:summary", or call
+// window.refreshCartSummary() after changing it.
+const refreshCartSummary = async () => {
+  const badge = document.getElementById("cart-badge");
+  if (!badge) {
+    return null;
+  }
+  try {
+    const response = await fetch(badge.dataset.summaryUrl, {
+      credentials: "same-origin",
+      headers: { Accept: "application/json" }
+    });
+    if (!response.ok) {
+      return null;
+    }
+    const summary = await response.json();
+    document.getElementById("cart-badge-count").textContent = summary.count;
+    badge.classList.toggle("d-none", summary.count === 0);
+    document.dispatchEvent(
+      new CustomEvent("cart:summary", { detail: summary })
+    );
+    return summary;
+  } catch (error) {
+    console.error("Could not load the cart summary:", error);
+    return null;
+  }
+};
+
+window.refreshCartSummary = refreshCartSummary;
+
+document.addEventListener("DOMContentLoaded", refreshCartSummary);
+
+// Pages restored from the back/forward cache keep their old badge
+window.addEventListener("pageshow", (event) => {
+  if (event.persisted) {
+    refreshCartSummary();
+  }
+});